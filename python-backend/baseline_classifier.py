@@ -0,0 +1,180 @@
+import os
+import re
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from config import settings, parse_args
+
+# Hashed features need no vocabulary pass, so training and scoring stay
+# a single sparse matrix product over the corpus
+N_FEATURES = 2 ** 20
+
+URL_PATTERN = re.compile(r'https?://\S+')
+MENTION_PATTERN = re.compile(r'@\w+')
+
+
+def normalize_text(text):
+    """Lowercase tweet text and collapse URLs and mentions into placeholder tokens"""
+    if not isinstance(text, str):
+        return ''
+    text = URL_PATTERN.sub(' urltoken ', text.lower())
+    return MENTION_PATTERN.sub(' mentiontoken ', text)
+
+
+def parse_labels(series):
+    """Map the is_disinfo column to 1.0/0.0, leaving unlabeled rows as NaN"""
+    values = series.astype(str).str.strip().str.lower()
+    labels = pd.Series(np.nan, index=series.index)
+    labels[values.isin(['true', '1', '1.0', 'yes', 'y'])] = 1.0
+    labels[values.isin(['false', '0', '0.0', 'no', 'n'])] = 0.0
+    return labels
+
+
+class BaselineClassifier:
+    """Hashed n-gram TF-IDF + logistic regression baseline for is_disinfo.
+
+    Texts go through normalize_text before the pipeline rather than as its
+    preprocessor, so the saved pipeline holds no reference to a function of
+    this module and loads the same from the CLI or any importer.
+    """
+
+    def __init__(self, pipeline=None):
+        """Wrap an existing fitted pipeline or create a fresh one."""
+        self.pipeline = pipeline or make_pipeline(
+            HashingVectorizer(
+                n_features=N_FEATURES,
+                ngram_range=(1, 2),
+                alternate_sign=False,
+                norm=None,
+            ),
+            TfidfTransformer(sublinear_tf=True),
+            LogisticRegression(solver='liblinear', class_weight='balanced', max_iter=1000),
+        )
+
+    def fit(self, texts, labels):
+        """Train on texts and 0/1 labels"""
+        self.pipeline.fit([normalize_text(text) for text in texts], np.asarray(labels, dtype=int))
+        return self
+
+    def predict_proba(self, texts):
+        """Return the disinformation probability for each text"""
+        return self.pipeline.predict_proba([normalize_text(text) for text in texts])[:, 1]
+
+    def save(self, path=None):
+        """Persist the fitted pipeline to disk"""
+        path = path or settings.baseline_model_file
+        joblib.dump(self.pipeline, path)
+        print(f"Saved baseline model to {path}")
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a pipeline saved with save()"""
+        return cls(joblib.load(path or settings.baseline_model_file))
+
+
+def train(df, model_path=None, holdout=0.2):
+    """Train the baseline on the labeled rows of a tweets DataFrame and save it"""
+    labels = parse_labels(df['is_disinfo'])
+    labeled = labels.notna()
+    texts = df.loc[labeled, 'Text'].fillna('')
+    y = labels[labeled].astype(int)
+
+    if y.nunique() < 2:
+        print("Need labeled examples of both classes to train. Aborting.")
+        return None
+
+    print(f'{datetime.now()} - Training on {len(y)} labeled tweets ({int(y.sum())} disinformation)')
+
+    # Report held-out accuracy when there is enough data in each class
+    if holdout and y.value_counts().min() >= 10:
+        x_train, x_test, y_train, y_test = train_test_split(
+            texts, y, test_size=holdout, stratify=y, random_state=42
+        )
+        model = BaselineClassifier().fit(x_train, y_train)
+        accuracy = ((model.predict_proba(x_test) >= 0.5).astype(int) == y_test.to_numpy()).mean()
+        print(f'{datetime.now()} - Held-out accuracy: {accuracy:.3f} on {len(y_test)} tweets')
+
+    model = BaselineClassifier().fit(texts, y)
+    model.save(model_path)
+    return model
+
+
+def predict(df, model=None, include_labeled=False):
+    """Score tweets in one batch and store the probability in a disinfo_score column"""
+    model = model or BaselineClassifier.load()
+
+    mask = pd.Series(True, index=df.index)
+    if not include_labeled and 'is_disinfo' in df.columns:
+        mask = parse_labels(df['is_disinfo']).isna()
+
+    if 'disinfo_score' not in df.columns:
+        df['disinfo_score'] = np.nan
+
+    if mask.any():
+        df.loc[mask, 'disinfo_score'] = model.predict_proba(df.loc[mask, 'Text'].fillna(''))
+
+    print(f'{datetime.now()} - Scored {int(mask.sum())} tweets')
+    return df
+
+
+def write_scores_to_firestore(gcp, df):
+    """Push disinfo_score values to their Firestore tweet documents in batches"""
+    scored = df[df['disinfo_score'].notna() & df['Tweet_ID'].notna()]
+    updates = {
+        str(tweet_id): {'disinfo_score': float(score)}
+        for tweet_id, score in zip(scored['Tweet_ID'], scored['disinfo_score'])
+    }
+    return gcp.update_tweets_batch(updates)
+
+
+def load_dataset(csv_filename):
+    """Load tweets from a CSV export, or from Firestore when no file is given"""
+    if csv_filename:
+        return pd.read_csv(csv_filename, dtype={'Tweet_ID': str}), None
+
+    from gcp_utils import GCPStorage
+    gcp = GCPStorage()
+    return gcp.load_tweets_dataframe('tweets.csv'), gcp
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Baseline disinformation classifier')
+    parser.add_argument('command', choices=['train', 'predict'])
+    parser.add_argument('csv', nargs='?', help='CSV export to use instead of Firestore')
+    parser.add_argument('--model', help='Model file; defaults to the baseline_model_file setting')
+    parser.add_argument('--all', action='store_true', help='Also score rows that already have a label')
+    parser.add_argument('--firestore', action='store_true', help='Write scores back to Firestore')
+    args = parse_args(parser)
+
+    df, gcp = load_dataset(args.csv)
+    if df is None or df.empty:
+        print("No tweets to process.")
+        return
+
+    if args.command == 'train':
+        train(df, args.model)
+        return
+
+    df = predict(df, BaselineClassifier.load(args.model), include_labeled=args.all)
+
+    if args.csv:
+        tmp_path = f"{args.csv}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, args.csv)
+        print(f"Scores saved to {args.csv}")
+
+    if args.firestore or not args.csv:
+        if gcp is None:
+            from gcp_utils import GCPStorage
+            gcp = GCPStorage()
+        write_scores_to_firestore(gcp, df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import settings, parse_args
+
+# flat:     media/{tweet_id}/{file}          (original layout)
+# hashed:   media/{md5(id)[:4]}/{tweet_id}/{file}
+# reversed: media/{reversed(id)[:4]}/{tweet_id}/{file}
+#
+# Tweet IDs are time-ordered, so with the flat layout concurrent uploads all
+# land in one lexicographic key range. A short shard prefix that varies with
+# the fast-changing part of the ID spreads them over the whole bucket.
+KEY_SCHEMES = ('flat', 'hashed', 'reversed')
+SHARD_WIDTH = 4
+
+
+def media_shard(tweet_id, scheme=None):
+    """Return the shard folder for a tweet ID, or None for the flat layout"""
+    scheme = scheme or settings.media_key_scheme
+    id_str = str(tweet_id)
+    if scheme == 'hashed':
+        return hashlib.md5(id_str.encode('utf-8')).hexdigest()[:SHARD_WIDTH]
+    if scheme == 'reversed':
+        return id_str[::-1][:SHARD_WIDTH]
+    if scheme == 'flat':
+        return None
+    raise ValueError(f"Unknown media key scheme: {scheme}")
+
+
+def media_prefix(tweet_id, scheme=None):
+    """Return the blob "folder" that holds a tweet's media"""
+    shard = media_shard(tweet_id, scheme)
+    if shard is None:
+        return f"media/{tweet_id}/"
+    return f"media/{shard}/{tweet_id}/"
+
+
+def media_blob_path(tweet_id, file_name, scheme=None):
+    """Return the blob path of one media file"""
+    return media_prefix(tweet_id, scheme) + file_name
+
+
+def all_media_prefixes(tweet_id):
+    """Return the prefixes a tweet's media can live under in any layout"""
+    return {media_prefix(tweet_id, scheme) for scheme in KEY_SCHEMES}
+
+
+def parse_media_blob_path(blob_path):
+    """Return (tweet_id, file_name) for a media blob in any layout, or None"""
+    parts = blob_path.split('/')
+    if len(parts) == 3 and parts[0] == 'media':
+        return parts[1], parts[2]
+    if len(parts) == 4 and parts[0] == 'media' and len(parts[1]) == SHARD_WIDTH:
+        return parts[2], parts[3]
+    return None
+
+
+def media_path_candidates(path, scheme=None):
+    """List where a stored gs:// media path may live now, most likely first.
+
+    Paths saved in Media_Files before a layout migration still point at the old
+    key, so readers try the current scheme's location right after the stored one.
+    """
+    if not path or not str(path).startswith('gs://'):
+        return [path]
+
+    bucket_name, _, blob_path = path[len('gs://'):].partition('/')
+    parsed = parse_media_blob_path(blob_path)
+    if parsed is None:
+        return [path]
+
+    tweet_id, file_name = parsed
+    scheme = scheme or settings.media_key_scheme
+    candidates = [path]
+    for candidate_scheme in (scheme,) + KEY_SCHEMES:
+        candidate = f"gs://{bucket_name}/{media_blob_path(tweet_id, file_name, candidate_scheme)}"
+        if candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def rewrite_media_path(path, scheme=None):
+    """Return a stored gs:// media path rewritten to the given layout"""
+    if not path or not str(path).startswith('gs://'):
+        return path
+
+    bucket_name, _, blob_path = path[len('gs://'):].partition('/')
+    parsed = parse_media_blob_path(blob_path)
+    if parsed is None:
+        return path
+    return f"gs://{bucket_name}/{media_blob_path(parsed[0], parsed[1], scheme)}"
+
+
+def stream_media_prefixes(storage_client, bucket_name):
+    """Yield (tweet_id, prefix) for every tweet folder under media/, in flat or sharded layout"""
+    iterator = storage_client.list_blobs(bucket_name, prefix='media/', delimiter='/')
+    for page in iterator.pages:
+        for prefix in page.prefixes:
+            key = prefix[len('media/'):].rstrip('/')
+            if len(key) != SHARD_WIDTH:
+                yield key, prefix
+                continue
+
+            # Shard folder: the tweet folders are one level deeper
+            shard_iterator = storage_client.list_blobs(bucket_name, prefix=prefix, delimiter='/')
+            for shard_page in shard_iterator.pages:
+                for tweet_prefix in shard_page.prefixes:
+                    yield tweet_prefix[len(prefix):].rstrip('/'), tweet_prefix
+
+
+def copy_tweet_media(storage_client, bucket_name, tweet_id, old_prefix, scheme):
+    """Copy a tweet's media to its prefix in the given scheme, return the old blobs"""
+    bucket = storage_client.bucket(bucket_name)
+    new_prefix = media_prefix(tweet_id, scheme)
+    blobs = list(bucket.list_blobs(prefix=old_prefix))
+    for blob in blobs:
+        bucket.copy_blob(blob, bucket, new_prefix + blob.name[len(old_prefix):])
+    return blobs
+
+
+def rewrite_media_files(gcp, tweet_ids, scheme):
+    """Point the stored Media_Files of the tweets at their keys in the scheme.
+
+    Returns the tweet IDs whose document is confirmed not to reference the
+    old keys anymore: rewritten, already up to date, or missing.
+    """
+    from gcp_utils import BatchWriteError
+
+    stored = gcp.get_tweet_fields(tweet_ids, ['Media_Files'])
+    updates = {}
+    for tweet_id, fields in stored.items():
+        media_files = fields.get('Media_Files') or ''
+        rewritten = '|'.join(rewrite_media_path(path, scheme) for path in media_files.split('|')) if media_files else ''
+        if rewritten != media_files:
+            updates[tweet_id] = {'Media_Files': rewritten}
+
+    failed = set()
+    if updates:
+        try:
+            # update, not merge: a tweet deleted since the read is not recreated
+            gcp.update_tweets_batch(updates, merge=False)
+        except BatchWriteError as e:
+            failed = {str(tweet_id) for tweet_id in e.failed_ids}
+    print(f'{datetime.now()} - Rewrote Media_Files of {len(updates) - len(failed)} documents, {len(failed)} failed')
+    return [tweet_id for tweet_id in tweet_ids if str(tweet_id) not in failed]
+
+
+def migrate_media_layout(gcp, scheme=None, dry_run=True, max_workers=16):
+    """Move existing media blobs to a key scheme and rewrite Media_Files in Firestore.
+
+    Blobs are copied first, then the documents are rewritten, and the old
+    blobs are only deleted for tweets whose document write went through, so
+    an interrupted migration never leaves a document pointing at nothing.
+    Running it again picks up where it stopped.
+    """
+    from deletion_executor import delete_blob_prefix
+
+    scheme = scheme or settings.media_key_scheme
+    bucket_name = gcp.buckets['images']
+    to_move = [
+        (tweet_id, prefix)
+        for tweet_id, prefix in stream_media_prefixes(gcp.storage_client, bucket_name)
+        if prefix != media_prefix(tweet_id, scheme)
+    ]
+    print(f'{datetime.now()} - {len(to_move)} tweet media folders to move to the {scheme} layout')
+
+    if dry_run or not to_move:
+        return to_move
+
+    copied = {}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(copy_tweet_media, gcp.storage_client, bucket_name, tweet_id, prefix, scheme): (tweet_id, prefix)
+            for tweet_id, prefix in to_move
+        }
+        for future, (tweet_id, prefix) in futures.items():
+            try:
+                copied.setdefault(tweet_id, []).append((prefix, future.result()))
+            except Exception as e:
+                print(f"Error copying media for tweet {tweet_id}: {e}")
+                failed.add(tweet_id)
+    # A tweet is only repointed once all of its media is in the new layout
+    copied = {tweet_id: prefixes for tweet_id, prefixes in copied.items() if tweet_id not in failed}
+
+    confirmed = rewrite_media_files(gcp, list(copied), scheme)
+
+    moved = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(delete_blob_prefix, gcp.storage_client, bucket_name, prefix, blobs): tweet_id
+            for tweet_id in confirmed for prefix, blobs in copied[tweet_id]
+        }
+        for future, tweet_id in futures.items():
+            try:
+                future.result()
+                moved.append(tweet_id)
+            except Exception as e:
+                print(f"Error deleting the old media of tweet {tweet_id}: {e}")
+
+    print(f'{datetime.now()} - Moved media for {len(moved)} tweets, '
+          f'{len(copied) - len(confirmed)} kept in both layouts until their document is rewritten')
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate media blobs to another key layout')
+    parser.add_argument('--scheme', choices=KEY_SCHEMES, required=True,
+                        help='Target layout; set media_key_scheme to it afterwards so new uploads follow')
+    parser.add_argument('--migrate', action='store_true', help='Actually move blobs; default is a dry run')
+    parser.add_argument('--workers', type=int, default=16)
+    args = parse_args(parser)
+
+    from gcp_utils import GCPStorage
+    migrate_media_layout(GCPStorage(), args.scheme, dry_run=not args.migrate, max_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
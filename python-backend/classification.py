@@ -1,6 +1,10 @@
 import os
 import csv
 import pandas as pd
+from label_journal import LabelJournal
+from lazy_csv import LazyCsv, TWEET_DTYPES
+from review_queue import build_review_queue, summarize_for_queue, load_scorer
+from config import configure
 
 # NOT USED ANYMORE ON THE WEBSITE
 
@@ -39,40 +43,55 @@ def delete_file_if_exists(filepath):
 
 def classify_tweets(csv_filename):
     """Process the CSV file and classify tweets as disinformation or not"""
-    # Read the CSV file
+    # Rows are read a window at a time, the file is never loaded whole
     try:
-        df = pd.read_csv(csv_filename)
+        dataset = LazyCsv(csv_filename, dtype=TWEET_DTYPES)
     except Exception as e:
         print(f"Error reading CSV file: {e}")
         return
     
     # Verify 'is_disinfo' column exists
-    if 'is_disinfo' not in df.columns:
+    if 'is_disinfo' not in dataset.columns:
         print("Error: 'is_disinfo' column not found in CSV.")
         return
     
-    print(f"\nProcessing {len(df)} tweets from {csv_filename}...\n")
+    # Decisions go to an append-only journal, the CSV is only rewritten on checkpoint
+    journal = LabelJournal.for_dataset(csv_filename)
+    state = journal.latest()
+    deleted_ids = journal.deleted_ids(state)
+    
+    # One streaming pass keeps just IDs, labels, cluster keys and scores per row
+    model = load_scorer()
+    summary = pd.concat([
+        summarize_for_queue(journal.apply_to_dataframe(chunk, state=state, drop_deleted=False), model)
+        for chunk in dataset.iter_chunks()
+    ])
+    summary = summary[~summary['Tweet_ID'].astype(str).isin(deleted_ids)]
+    
+    print(f"\nProcessing {len(summary)} tweets from {csv_filename}...\n")
     
     # Count already classified tweets
-    already_classified = df['is_disinfo'].notna().sum()
+    already_classified = summary['is_disinfo'].notna().sum()
     if already_classified > 0:
-        resume = input(f"{already_classified} tweets already classified. Resume from where you left off? (y/n): ").lower()
-        if resume == 'y':
-            start_index = already_classified
-        else:
-            start_index = 0
-    else:
-        start_index = 0
+        print(f"{already_classified} tweets already classified. Resuming with the remaining ones.")
+    
+    # Most uncertain tweets first, one tweet per near-duplicate cluster
+    queue = build_review_queue(summary)
+    print(f"{len(queue)} tweets to review ({int(summary['is_disinfo'].isna().sum())} unlabeled)")
     
     # Process each tweet
     try:
-        for i in range(start_index, len(df)):
+        for position, (i, duplicates) in enumerate(queue):
+            row = dataset.row(i)
+            
             # Display tweet information
             print("\n" + "="*80)
-            print(f"Tweet {i+1} of {len(df)}")
-            print(f"User: {df.at[i, 'Username']}")
+            print(f"Tweet {position+1} of {len(queue)}")
+            print(f"User: {row['Username']}")
+            if duplicates:
+                print(f"Near-duplicates: {len(duplicates)} more tweets will get the same label")
             print("-"*80)
-            print(f"Text: {df.at[i, 'Text']}")
+            print(f"Text: {row['Text']}")
             print("-"*80)
             
             # Get user input for classification
@@ -91,37 +110,38 @@ def classify_tweets(csv_filename):
                 print("\nDeleting tweet and associated media...")
                 
                 # Delete profile picture
-                profile_pic = df.at[i, 'Profile_Pic']
-                delete_file_if_exists(profile_pic)
+                profile_pic = row['Profile_Pic']
+                if pd.notna(profile_pic):
+                    delete_file_if_exists(profile_pic)
                 
                 # Delete media files
-                if 'Media_Files' in df.columns and df.at[i, 'Media_Files']:
-                    media_files = str(df.at[i, 'Media_Files']).split('|')
+                if 'Media_Files' in row.index and pd.notna(row['Media_Files']) and row['Media_Files']:
+                    media_files = str(row['Media_Files']).split('|')
                     for media_file in media_files:
                         delete_file_if_exists(media_file)
                 
-                # Remove the row from the dataframe entirely
-                df = df.drop(i).reset_index(drop=True)
-                print(f"Tweet {i+1} and associated media have been deleted.")
-                
-                i -= 1
+                # The row is dropped from the CSV when the journal is merged
+                journal.record(summary.at[i, 'Tweet_ID'], action='delete')
+                print(f"Tweet {position+1} and associated media have been deleted.")
             else:
-                # Update the DataFrame for y/n responses
-                df.at[i, 'is_disinfo'] = 'true' if response == 'y' else 'false'
-                print(f"Tweet {i+1} classified as {'disinformation' if response == 'y' else 'not disinformation'}.")
-            
-            # Save progress after each classification or deletion
-            df.to_csv(csv_filename, index=False)
+                # Record the label for the tweet and its near-duplicates
+                label = 'true' if response == 'y' else 'false'
+                journal.record(summary.at[i, 'Tweet_ID'], label=label)
+                for duplicate in duplicates:
+                    journal.record(summary.at[duplicate, 'Tweet_ID'], label=label, source='duplicate')
+                print(f"Tweet {position+1} classified as {'disinformation' if response == 'y' else 'not disinformation'}.")
     
     except KeyboardInterrupt:
         print("\n\nClassification interrupted. Progress has been saved.")
     
     finally:
-        # Final save to ensure all classifications are recorded
-        df.to_csv(csv_filename, index=False)
+        # Merge the journal into the CSV once at the end of the session, chunk by chunk
+        journal.checkpoint_csv(csv_filename)
+        journal.close()
         print(f"\nClassification complete. Results saved to {csv_filename}")
 
 def main():
+    configure()
     print("Tweet Disinformation Classifier\n")
     csv_filename = select_csv_file()
     
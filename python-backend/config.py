@@ -1,11 +1,212 @@
 import os
+import argparse
+from configparser import ConfigParser
+from dataclasses import dataclass, fields
 
-# Constants
-MINIMUM_TWEETS = 10
-QUERY = '(#f1) lang:en until:2025-05-05 since:2025-01-01 -filter:retweets -filter:replies'
-IMAGES_DIR = 'downloaded_images'
-PROFILE_PICS_DIR = 'profile_pics'
+# Settings are read from the [settings] section of this file, then from
+# COLLECTOR_<NAME> environment variables, then from --set NAME=VALUE flags
+SETTINGS_FILE = 'config.ini'
+SETTINGS_SECTION = 'settings'
+SETTINGS_FILE_ENV = 'COLLECTOR_CONFIG'
+ENV_PREFIX = 'COLLECTOR_'
+# Separator between queries in environment variables and --set flags; in the
+# config file each query can also go on its own line
+QUERY_SEPARATOR = ';'
 
-# Create directories if they don't exist
-os.makedirs(IMAGES_DIR, exist_ok=True)
-os.makedirs(PROFILE_PICS_DIR, exist_ok=True)
+CHOICES = {
+    'media_key_scheme': ('flat', 'hashed', 'reversed'),
+    'queue_backend': ('sqlite', 'firestore'),
+}
+
+
+@dataclass
+class Settings:
+    """Every tunable of the collector and the review tools, with its default."""
+
+    # Search
+    queries: tuple = ('(#f1) lang:en until:2025-05-05 since:2025-01-01 -filter:retweets -filter:replies',)
+    minimum_tweets: int = 10  # new tweets collected per query and run
+
+    # Storage backends
+    gcp_key_path: str = 'GCP_KEYS.json'
+    data_bucket: str = 'disinformation-game-data'
+    images_bucket: str = 'disinformation-game-images'
+    profiles_bucket: str = 'disinformation-game-profiles'
+    media_key_scheme: str = 'flat'  # 'flat', 'hashed' or 'reversed'; switch only after migrating, see blob_layout.py
+    queue_backend: str = 'sqlite'  # work queue of media_worker.py and work_queue.py
+    work_queue_file: str = 'work_queue.sqlite3'
+
+    # Concurrency
+    cpu_workers: int = max(1, (os.cpu_count() or 2) - 1)  # processes for decode/hash/thumbnail work
+    media_worker_concurrency: int = 8  # tweets processed at once per media worker
+    # 500-op batches committed in parallel. Firestore's 500/50/5 guidance starts a
+    # collection at ~500 writes/s, so a few concurrent batches is as much as we push
+    firestore_write_workers: int = 4
+    image_prefetch_workers: int = 4
+    delete_workers: int = 8
+
+    # Batch sizes
+    firestore_batch_size: int = 500  # Firestore allows at most 500 writes per batch
+    tweet_count_block_size: int = 100  # Tweet_count numbers leased per counter transaction, see tweet_sequence.py
+    import_chunk_rows: int = 20000  # rows per chunk when streaming CSVs and exports
+
+    # Timeouts and retries
+    download_timeout_seconds: float = 60.0  # whole request, per image download
+    video_connect_timeout_seconds: float = 15.0
+    video_read_timeout_seconds: float = 30.0  # longest wait for the next chunk; videos have no total limit
+    shutdown_drain_seconds: float = 25.0  # in-flight work gets this long after SIGTERM (preemptible VMs allow ~30s)
+    work_queue_lease_seconds: float = 300.0  # a job not acked within this is handed to another worker
+    work_queue_max_attempts: int = 5  # then it goes to the dead-letter table
+
+    # Caches and review
+    image_cache_size: int = 64
+    review_grid_columns: int = 3
+    review_grid_rows: int = 2
+    review_prefetch_pages: int = 2
+    review_delete_from_gcs: bool = False
+
+    # Media
+    video_min_bitrate: int = 600000  # bits/s, lowest variant at or above this is downloaded
+    max_video_bytes: int = 50 * 1024 * 1024
+
+    # Local files
+    low_cred_domains_file: str = 'low_cred_domains.txt'
+    baseline_model_file: str = 'baseline_model.joblib'
+    checkpoint_file: str = 'collector_checkpoint.json'
+    page_archive_dir: str = 'page_archive'  # raw search pages, gzipped JSONL per query
+    tweet_store_dir: str = 'tweet_store'  # local Parquet copy of the tweets, see tweet_store.py
+    users_table_file: str = 'users.parquet'  # local copy of the Firestore users collection, see user_table.py
+    near_dup_index_file: str = 'near_duplicates.npz'  # MinHash signatures and Cluster_IDs, see near_duplicates.py
+    search_index_file: str = 'search_index.npz'  # BM25 inverted index over Text, see search_index.py
+
+    # Streaming (main.py --stream), see streaming.py
+    stream_min_poll_seconds: float = 60.0  # a busy query is polled this often
+    stream_max_poll_seconds: float = 1800.0  # a quiet query backs off to this
+    stream_target_tweets_per_poll: int = 20  # the poll interval aims at this many new tweets
+    stream_max_pages_per_poll: int = 5  # pages fetched per poll before giving up on reaching the watermark
+    stream_rate_smoothing: float = 0.3  # weight of the latest poll in the arrival rate estimate
+    stream_state_file: str = 'stream_watermarks.json'  # since_id watermark and arrival rate per query
+
+    # Profiling (main.py --profile)
+    profile_dir: str = 'profiles'
+    profile_sample_seconds: float = 0.01  # stack sampling interval
+    slow_callback_seconds: float = 0.1  # event loop callbacks holding the loop longer than this are reported
+
+    @property
+    def query(self):
+        """The first configured query"""
+        return self.queries[0]
+
+
+# The one shared instance; it holds the defaults until configure() is called
+settings = Settings()
+# The file configure() last read, which also holds the [X] credentials
+_settings_file = None
+
+
+def convert(name, value):
+    """Parse a setting from its string form into the type of its field"""
+    field_types = {field.name: field.type for field in fields(Settings)}
+    if name not in field_types:
+        raise ValueError(f"Unknown setting '{name}'")
+    field_type = field_types[name]
+    value = value.strip()
+
+    if field_type is tuple:
+        parts = value.replace('\n', QUERY_SEPARATOR).split(QUERY_SEPARATOR)
+        result = tuple(part.strip() for part in parts if part.strip())
+        if not result:
+            raise ValueError(f"Setting '{name}' needs at least one value")
+    elif field_type is bool:
+        if value.lower() not in ('1', 'true', 'yes', 'on', '0', 'false', 'no', 'off'):
+            raise ValueError(f"Setting '{name}' expects true or false, got '{value}'")
+        result = value.lower() in ('1', 'true', 'yes', 'on')
+    elif field_type in (int, float):
+        try:
+            result = field_type(value)
+        except ValueError:
+            raise ValueError(f"Setting '{name}' expects {field_type.__name__}, got '{value}'") from None
+    else:
+        result = value
+
+    if name in CHOICES and result not in CHOICES[name]:
+        raise ValueError(f"Setting '{name}' must be one of {', '.join(CHOICES[name])}, got '{result}'")
+    return result
+
+
+def settings_file(config_file=None, environ=None):
+    """Path of the settings file: the one given, the one configure() read, ${COLLECTOR_CONFIG} or config.ini"""
+    environ = os.environ if environ is None else environ
+    return config_file or _settings_file or environ.get(SETTINGS_FILE_ENV) or SETTINGS_FILE
+
+
+def load_settings(config_file=None, overrides=None, environ=None):
+    """Build Settings from defaults, the config file, the environment and overrides, in that order.
+
+    overrides is a list of 'name=value' strings or a dict. Nothing is created or written.
+    """
+    environ = os.environ if environ is None else environ
+    values = {}
+
+    config_file = settings_file(config_file, environ)
+    # No interpolation, so queries and paths can contain '%', and only ';'
+    # starts a comment, so a query line can start with a hashtag
+    parser = ConfigParser(interpolation=None, comment_prefixes=(';',))
+    if parser.read(config_file) and parser.has_section(SETTINGS_SECTION):
+        for name, value in parser.items(SETTINGS_SECTION):
+            values[name] = convert(name, value)
+
+    for field in fields(Settings):
+        env_name = ENV_PREFIX + field.name.upper()
+        if env_name in environ:
+            values[field.name] = convert(field.name, environ[env_name])
+
+    if isinstance(overrides, dict):
+        overrides = [f"{name}={value}" for name, value in overrides.items()]
+    for override in overrides or []:
+        name, separator, value = override.partition('=')
+        if not separator:
+            raise ValueError(f"Expected NAME=VALUE, got '{override}'")
+        values[name.strip()] = convert(name.strip(), value)
+
+    return Settings(**values)
+
+
+def configure(config_file=None, overrides=None, environ=None):
+    """Load settings and apply them to the shared instance every module reads"""
+    global _settings_file
+    loaded = load_settings(config_file, overrides, environ)
+    _settings_file = config_file or _settings_file
+    for field in fields(Settings):
+        setattr(settings, field.name, getattr(loaded, field.name))
+    return settings
+
+
+def add_settings_arguments(parser):
+    """Add --config and --set to a command line parser"""
+    parser.add_argument('--config', help=f'Settings file, [{SETTINGS_SECTION}] section (default {SETTINGS_FILE}, or ${SETTINGS_FILE_ENV})')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', dest='settings',
+                        help='Override a setting, e.g. --set media_worker_concurrency=16; repeatable')
+    return parser
+
+
+def parse_args(parser, argv=None):
+    """parser.parse_args() with --config/--set, applying the settings before returning"""
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        configure(args.config, args.settings)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the effective settings')
+    parse_args(parser)
+    for field in fields(Settings):
+        print(f"{field.name} = {getattr(settings, field.name)!r}")
+
+
+if __name__ == "__main__":
+    main()
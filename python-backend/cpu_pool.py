@@ -0,0 +1,112 @@
+import time
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from config import settings
+
+# Below this size pickling the bytes is cheaper than setting up shared memory
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+
+def _warm_up():
+    """Import the heavy modules once per worker so the first real task isn't slow"""
+    import PIL.Image  # noqa: F401
+    return True
+
+
+def _attach(name):
+    """Attach to a parent-owned shared memory block without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the block for cleanup
+        # in this process, which would unlink it under the parent's feet
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _run_shared(task, name, size, *args):
+    """Worker side: call task on a zero-copy view of the shared payload"""
+    shm = _attach(name)
+    view = shm.buf[:size]
+    try:
+        return task(view, *args)
+    finally:
+        view.release()
+        shm.close()
+
+
+class CpuPool:
+    """Warm process pool for CPU-bound media work, awaited from the collector's event loop."""
+
+    def __init__(self, max_workers=None, warm=True):
+        """Start the worker processes and optionally wait until they are all up."""
+        max_workers = max_workers or settings.cpu_workers
+        self.max_workers = max_workers
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_seconds = 0.0
+
+        if warm:
+            # One task per worker forces every process to start now, not mid-run
+            for future in [self._executor.submit(_warm_up) for _ in range(max_workers)]:
+                future.result()
+
+    async def run(self, task, payload=None, *args):
+        """Run task(payload, *args) in a worker; large byte payloads travel through shared memory"""
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        shm = None
+
+        try:
+            if isinstance(payload, (bytes, bytearray, memoryview)) and len(payload) >= SHARED_MEMORY_THRESHOLD:
+                size = len(payload)
+                shm = shared_memory.SharedMemory(create=True, size=size)
+                shm.buf[:size] = payload
+                call = functools.partial(_run_shared, task, shm.name, size, *args)
+            else:
+                call = functools.partial(task, payload, *args)
+
+            result = await loop.run_in_executor(self._executor, call)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_seconds += time.perf_counter() - start
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    @property
+    def queue_depth(self):
+        """Tasks waiting for a free worker"""
+        return max(0, self.in_flight - self.max_workers)
+
+    def metrics(self):
+        """Counters for the end-of-run report"""
+        finished = self.completed + self.failed
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'max_in_flight': self.max_in_flight,
+            'avg_ms': round(1000 * self.total_seconds / finished, 1) if finished else 0.0,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self._executor.shutdown()
@@ -0,0 +1,130 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from blob_layout import all_media_prefixes
+
+# Cloud Storage accepts at most 100 calls per batch request
+GCS_BATCH_SIZE = 100
+
+
+def build_username_index(df):
+    """Map each username to the row positions of its tweets in one groupby pass"""
+    return {username: list(rows) for username, rows in df.groupby('Username', sort=False).indices.items()}
+
+
+def row_file_paths(df, row_indices):
+    """Collect the profile picture and media paths referenced by the given rows"""
+    paths = set()
+    for row_idx in row_indices:
+        profile_pic = df.at[row_idx, 'Profile_Pic'] if 'Profile_Pic' in df.columns else None
+        if pd.notna(profile_pic) and profile_pic:
+            paths.add(str(profile_pic))
+
+        media = df.at[row_idx, 'Media_Files'] if 'Media_Files' in df.columns else None
+        if pd.notna(media) and media:
+            paths.update(path for path in str(media).split('|') if path)
+    return paths
+
+
+def remove_local_file(path):
+    """Delete a file, trying the parent directory only when the path itself is missing"""
+    for candidate in (path, os.path.join('..', path)):
+        try:
+            os.remove(candidate)
+            return True
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"Error deleting {candidate}: {e}")
+            return False
+    return False
+
+
+def delete_blob_prefix(storage_client, bucket_name, prefix, blobs=None):
+    """Delete every blob under a prefix using batched requests"""
+    if blobs is None:
+        blobs = list(storage_client.bucket(bucket_name).list_blobs(prefix=prefix))
+    for i in range(0, len(blobs), GCS_BATCH_SIZE):
+        with storage_client.batch():
+            for blob in blobs[i:i + GCS_BATCH_SIZE]:
+                blob.delete()
+    return len(blobs)
+
+
+class DeletionExecutor:
+    """Runs file and bucket deletions for reviewed tweets in the background."""
+
+    def __init__(self, gcp=None, max_workers=8):
+        """Use gcp (a GCPStorage) to also remove the tweets' blobs from Cloud Storage."""
+        self.gcp = gcp
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='delete')
+        self._futures = []
+
+    def delete_rows(self, df, row_indices, delete_user_prefix=False):
+        """Queue deletion of all local files and blobs belonging to the given rows"""
+        local_paths = [path for path in row_file_paths(df, row_indices) if not path.startswith('gs://')]
+        for path in local_paths:
+            self._futures.append(self._executor.submit(remove_local_file, path))
+
+        if self.gcp is not None:
+            tweet_ids = {str(df.at[row_idx, 'Tweet_ID']) for row_idx in row_indices}
+            # Media may still be in the pre-sharding layout, so cover every scheme
+            prefixes = [
+                (self.gcp.buckets['images'], prefix)
+                for tweet_id in tweet_ids for prefix in all_media_prefixes(tweet_id)
+            ]
+            if delete_user_prefix:
+                usernames = {df.at[row_idx, 'Username'] for row_idx in row_indices}
+                prefixes += [(self.gcp.buckets['profiles'], f"users/{username}/") for username in usernames]
+            for bucket_name, prefix in prefixes:
+                self._futures.append(
+                    self._executor.submit(delete_blob_prefix, self.gcp.storage_client, bucket_name, prefix)
+                )
+
+        return len(local_paths)
+
+    def wait(self):
+        """Block until all queued deletions finished and return how many removed something"""
+        done = 0
+        for future in self._futures:
+            try:
+                done += 1 if future.result() else 0
+            except Exception as e:
+                print(f"Deletion failed: {e}")
+        self._futures = []
+        return done
+
+    def close(self):
+        """Finish pending deletions and stop the worker threads"""
+        done = self.wait()
+        self._executor.shutdown()
+        return done
+
+
+class ReviewedUsers:
+    """Usernames whose profile picture was already reviewed, persisted across sessions."""
+
+    def __init__(self, csv_filename):
+        """Load the reviewed usernames stored next to the CSV."""
+        self.path = f"{csv_filename}.reviewed_users.txt"
+        self.users = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.users = {line.rstrip('\n') for line in f if line.strip()}
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __contains__(self, username):
+        return str(username) in self.users
+
+    def add(self, username):
+        """Remember a username with a single appended line"""
+        username = str(username)
+        if username in self.users:
+            return
+        self.users.add(username)
+        self._file.write(username + '\n')
+        self._file.flush()
+
+    def close(self):
+        """Close the underlying file"""
+        self._file.close()
@@ -0,0 +1,212 @@
+import os
+import sys
+from functools import lru_cache
+from urllib.parse import urlsplit
+import pandas as pd
+from config import settings, configure
+
+# Multi-label public suffixes we see most often in tweet links. When a full
+# Public Suffix List file (public_suffix_list.dat) is available it is loaded
+# on top of this set.
+DEFAULT_PUBLIC_SUFFIXES = {
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'net.uk',
+    'com.au', 'net.au', 'org.au', 'co.nz', 'org.nz', 'co.za',
+    'com.br', 'com.ar', 'com.mx', 'com.tr', 'com.cn', 'com.hk',
+    'com.sg', 'com.my', 'co.in', 'co.jp', 'ne.jp', 'or.jp', 'co.kr',
+    'blogspot.com', 'wordpress.com', 'substack.com', 'medium.com',
+    'github.io', 'appspot.com', 'herokuapp.com',
+}
+
+
+def load_public_suffixes(path='public_suffix_list.dat'):
+    """Load multi-label public suffixes from a PSL file, falling back to the built-in set"""
+    suffixes = set(DEFAULT_PUBLIC_SUFFIXES)
+    if not path or not os.path.exists(path):
+        return suffixes
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().lower()
+            # Skip comments, blanks and exception/wildcard rules
+            if not line or line.startswith('//') or line[0] in '!*':
+                continue
+            if '.' in line:
+                suffixes.add(line)
+    return suffixes
+
+
+def normalize_host(url_or_host):
+    """Reduce a URL or host name to a lowercase host without www., port or trailing dot"""
+    if not url_or_host:
+        return ''
+
+    value = str(url_or_host).strip()
+    if '://' not in value:
+        value = '//' + value
+
+    try:
+        host = urlsplit(value).hostname or ''
+    except ValueError:
+        return ''
+
+    host = host.rstrip('.').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    # Keep international domains comparable with punycode entries in the list
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    return host
+
+
+class DomainReputationIndex:
+    """In-memory index of low-credibility domains with public-suffix aware lookups."""
+
+    def __init__(self, entries=None, public_suffixes=None):
+        """Build the index from a mapping or iterable of domains."""
+        self.public_suffixes = frozenset(public_suffixes or DEFAULT_PUBLIC_SUFFIXES)
+        self.ratings = {}
+
+        if isinstance(entries, dict):
+            items = entries.items()
+        else:
+            items = ((domain, 'low') for domain in (entries or []))
+
+        for domain, rating in items:
+            host = normalize_host(domain)
+            if host:
+                self.ratings[host] = rating
+
+        # Cache results per host so repeated domains cost one dict hit
+        self._lookup_host = lru_cache(maxsize=65536)(self._lookup_host_uncached)
+
+    @classmethod
+    def from_file(cls, path=None, psl_path='public_suffix_list.dat'):
+        """Load a domain list file with one `domain[,rating]` per line"""
+        path = path or settings.low_cred_domains_file
+        entries = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    domain, _, rating = line.partition(',')
+                    entries[domain.strip()] = rating.strip() or 'low'
+            print(f"Loaded {len(entries)} low-credibility domains from {path}")
+        else:
+            print(f"Domain reputation list not found: {path}. No links will be flagged.")
+
+        return cls(entries, load_public_suffixes(psl_path))
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def __contains__(self, url_or_host):
+        return self.lookup(url_or_host) is not None
+
+    def registrable_domain(self, host):
+        """Return the registrable domain (one label + public suffix) of a host"""
+        labels = host.split('.')
+        if len(labels) <= 2:
+            return host
+
+        # Find the longest public suffix, then keep one more label
+        for i in range(1, len(labels) - 1):
+            if '.'.join(labels[i:]) in self.public_suffixes:
+                return '.'.join(labels[i - 1:])
+        return '.'.join(labels[-2:])
+
+    def _lookup_host_uncached(self, host):
+        """Walk from the full host up to its registrable domain, one hash lookup per label"""
+        if not host:
+            return None
+
+        registrable = self.registrable_domain(host)
+        candidate = host
+        while True:
+            rating = self.ratings.get(candidate)
+            if rating is not None:
+                return candidate, rating
+            if candidate == registrable or '.' not in candidate:
+                return None
+            candidate = candidate.split('.', 1)[1]
+
+    def lookup(self, url_or_host):
+        """Return (matched_domain, rating) for a URL or host, or None if it is not listed"""
+        return self._lookup_host(normalize_host(url_or_host))
+
+    def flag_links(self, links):
+        """Return the sorted list of listed domains among the given links"""
+        flagged = set()
+        for link in links:
+            match = self.lookup(link)
+            if match:
+                flagged.add(match[0])
+        return sorted(flagged)
+
+    def annotate_tweet(self, tweet_data, links):
+        """Add link domain and low-credibility fields to a tweet document in place"""
+        domains = sorted({normalize_host(link) for link in links if link} - {''})
+        flagged = self.flag_links(links)
+
+        tweet_data['Link_Domains'] = '|'.join(domains)
+        tweet_data['Low_Cred_Domains'] = '|'.join(flagged)
+        tweet_data['has_low_cred_link'] = bool(flagged)
+        return tweet_data
+
+    def annotate_dataframe(self, df, links_column='Expanded_Links'):
+        """Annotate every row of an exported dataset in one pass over its unique link strings"""
+        if links_column not in df.columns:
+            print(f"Column '{links_column}' not found. Nothing to annotate.")
+            return df
+
+        links = df[links_column].fillna('').astype(str)
+
+        # Exports repeat the same link strings a lot, so resolve each once
+        unique_links = pd.Series(links.unique())
+        flagged = unique_links.map(lambda s: '|'.join(self.flag_links(s.split('|'))) if s else '')
+        domains = unique_links.map(
+            lambda s: '|'.join(sorted({normalize_host(link) for link in s.split('|') if link} - {''})) if s else ''
+        )
+
+        flagged_map = dict(zip(unique_links, flagged))
+        domains_map = dict(zip(unique_links, domains))
+
+        df['Link_Domains'] = links.map(domains_map)
+        df['Low_Cred_Domains'] = links.map(flagged_map)
+        df['has_low_cred_link'] = df['Low_Cred_Domains'] != ''
+        return df
+
+
+def main():
+    """Annotate an exported CSV with low-credibility domain flags"""
+    if len(sys.argv) < 2:
+        print("Usage: python domain_reputation.py <export.csv> [links_column]")
+        return
+
+    configure()
+    csv_filename = sys.argv[1]
+    links_column = sys.argv[2] if len(sys.argv) > 2 else 'Expanded_Links'
+
+    try:
+        df = pd.read_csv(csv_filename)
+    except Exception as e:
+        print(f"Error reading CSV file: {e}")
+        return
+
+    index = DomainReputationIndex.from_file()
+    df = index.annotate_dataframe(df, links_column)
+    # Written beside the export and swapped in, so a crash never truncates it
+    tmp_path = f"{csv_filename}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_filename)
+
+    flagged_count = int(df['has_low_cred_link'].sum()) if 'has_low_cred_link' in df.columns else 0
+    print(f"Annotated {len(df)} tweets, {flagged_count} link to low-credibility domains")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,17 @@ def select_csv_file():
         except ValueError:
             print("Please enter a valid number.")
 
+def adjust_path_if_needed(path):
+    """Check if file exists in parent directory and adjust path if needed"""
+    if not path or str(path).startswith('gs://'):
+        return path
+        
+    if not os.path.exists(path):
+        parent_path = os.path.join('..', path)
+        if os.path.exists(parent_path):
+            return parent_path
+    return path
+
 def delete_file_if_exists(filepath):
     """Delete a file if it exists and return success status"""
     if filepath and os.path.exists(filepath):
@@ -1,18 +1,46 @@
 import os
 import json
+import time
 import logging
 import pandas as pd
 from io import StringIO
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from google.cloud import storage, firestore
-import magic
+from mime_utils import detect_content_type, extension_for
+from blob_layout import media_blob_path
+from config import settings
+
+
+def dataframe_to_records(df):
+    """Convert a DataFrame to Firestore-ready dicts, with NaN/NaT values as None."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def tweet_document_id(tweet_id, fallback):
+    """Format a Tweet_ID value as a document ID, undoing pandas' float upcast."""
+    if tweet_id is None:
+        return fallback
+    if isinstance(tweet_id, float):
+        return str(int(tweet_id))
+    return str(tweet_id)
+
+
+class BatchWriteError(Exception):
+    """Batched writes that still failed after their retries; failed_ids names the documents."""
+
+    def __init__(self, failed_ids, written, collection='tweets'):
+        self.failed_ids = list(failed_ids)
+        self.written = written
+        super().__init__(f"{len(self.failed_ids)} {collection} writes failed after retries ({written} written)")
 
 
 class GCPStorage:
     """Class to handle GCP storage operations with Firestore for tweet data."""
     
-    def __init__(self, key_path='GCP_KEYS.json'):
+    def __init__(self, key_path=None):
         """Initialize the GCP storage client and Firestore."""
+        key_path = key_path or settings.gcp_key_path
         try:
             # Initialize both Storage and Firestore clients
             if os.path.exists(key_path):
@@ -22,11 +50,11 @@ class GCPStorage:
                 self.storage_client = storage.Client()
                 self.db = firestore.Client()
             
-            # Define bucket names
+            # Bucket names come from the settings, so test instances can use their own
             self.buckets = {
-                'data': 'disinformation-game-data',
-                'images': 'disinformation-game-images',
-                'profiles': 'disinformation-game-profiles'
+                'data': settings.data_bucket,
+                'images': settings.images_bucket,
+                'profiles': settings.profiles_bucket
             }
             
             # Create buckets if they don't exist
@@ -49,8 +77,8 @@ class GCPStorage:
             print(f"Error checking/creating bucket {bucket_name}: {e}")
             raise
     
-    def save_tweet_json(self, tweet_data, tweet_id):
-        """Save tweet data to Firestore database instead of Storage."""
+    def save_tweet_json(self, tweet_data, tweet_id, merge=False):
+        """Save tweet data to Firestore database instead of Storage (merge keeps fields not in tweet_data)."""
         try:
             # Get a reference to the tweets collection
             tweet_ref = self.db.collection('tweets').document(str(tweet_id))
@@ -59,7 +87,7 @@ class GCPStorage:
             tweet_data['timestamp'] = firestore.SERVER_TIMESTAMP
             
             # Save to Firestore
-            tweet_ref.set(tweet_data)
+            tweet_ref.set(tweet_data, merge=merge)
             
             print(f"Saved tweet {tweet_id} to Firestore")
             return f"tweets/{tweet_id}"
@@ -102,7 +130,7 @@ class GCPStorage:
             _, file_extension = os.path.splitext(local_path)
             
             file_name = f"tweet_{tweet_id}_media_{index}{file_extension}"
-            blob_path = f"media/{tweet_id}/{file_name}"
+            blob_path = media_blob_path(tweet_id, file_name)
             
             # Upload file
             bucket = self.storage_client.bucket(self.buckets['images'])
@@ -116,41 +144,27 @@ class GCPStorage:
             print(f"Error uploading media file {local_path}: {e}")
             return local_path
     
-    def save_tweets_dataframe(self, df, filename):
+    def save_tweets_dataframe(self, df, filename, max_workers=None):
         """Save CSV backup to GCP Storage and also update Firestore."""
         try:
-            # First save CSV backup
-            csv_data = df.to_csv(index=False)
+            # First save CSV backup, streamed to the blob in chunks
             bucket = self.storage_client.bucket(self.buckets['data'])
             blob = bucket.blob(filename)
-            blob.upload_from_string(csv_data, content_type='text/csv')
-            
-            # Update Firestore with tweets from DataFrame
-            batch = self.db.batch()
-            batch_count = 0
-            batch_size = 500  # Firestore limit
+            with blob.open('w', content_type='text/csv') as f:
+                df.to_csv(f, index=False)
             
-            for _, row in df.iterrows():
-                # Convert row to dict for Firestore
-                tweet_data = row.to_dict()
-                tweet_id = str(tweet_data.get('Tweet_ID', f"unknown_{row.name}"))
-                
-                # Add to batch
-                tweet_ref = self.db.collection('tweets').document(tweet_id)
-                batch.set(tweet_ref, tweet_data)
-                batch_count += 1
-                
-                # When batch is full, commit and start a new one
-                if batch_count >= batch_size:
-                    batch.commit()
-                    batch = self.db.batch()
-                    batch_count = 0
+            # Build all documents in one pass, with NaN turned into None
+            records = dataframe_to_records(df)
+            tweet_ids = [
+                tweet_document_id(record.get('Tweet_ID'), f"unknown_{index}")
+                for index, record in zip(df.index, records)
+            ]
             
-            # Commit any remaining tweets
-            if batch_count > 0:
-                batch.commit()
+            # Commit 500-op batches concurrently, retrying failed documents one by one
+            writes = (('set', tweet_id, record) for tweet_id, record in zip(tweet_ids, records))
+            saved = self._commit_batches(writes, max_workers=max_workers)
             
-            print(f"Saved DataFrame with {len(df)} tweets to {filename} and updated Firestore")
+            print(f"Saved DataFrame with {len(df)} tweets to {filename} and updated {saved} Firestore documents")
             return f"gs://{self.buckets['data']}/{filename}"
         except Exception as e:
             print(f"Error saving DataFrame to GCP: {e}")
@@ -191,23 +205,15 @@ class GCPStorage:
             print(f"Error loading DataFrame from GCP: {e}")
             return None
 
-    def upload_profile_pic_from_memory(self, content_bytes, tweet_id, username):
+    def upload_profile_pic_from_memory(self, content_bytes, tweet_id, username, header_type=None):
         """Upload profile picture from memory directly to GCP Storage."""
         if not content_bytes:
             return ""
             
         try:
-            # Determine content type from bytes (simplified)
-            content_type = magic.from_buffer(content_bytes, mime=True)
-            
-            # Determine extension from content type
-            extension_map = {
-                'image/jpeg': '.jpg',
-                'image/png': '.png', 
-                'image/gif': '.gif',
-                'image/webp': '.webp'
-            }
-            file_extension = extension_map.get(content_type, '.jpg')
+            # Determine content type from the first bytes and the download headers
+            content_type = detect_content_type(content_bytes, header_type)
+            file_extension = extension_for(content_type)
             
             # Simple flat structure
             file_name = f"profile_{username}{file_extension}"
@@ -224,27 +230,18 @@ class GCPStorage:
             print(f"Error uploading profile pic from memory: {e}")
             return ""
 
-    def upload_media_file_from_memory(self, content_bytes, tweet_id, index):
+    def upload_media_file_from_memory(self, content_bytes, tweet_id, index, header_type=None):
         """Upload media file from memory directly to GCP Storage."""
         if not content_bytes:
             return ""
             
         try:
-            # Determine content type from bytes (simplified)
-            content_type = magic.from_buffer(content_bytes, mime=True)
-            
-            # Determine extension from content type
-            extension_map = {
-                'image/jpeg': '.jpg',
-                'image/png': '.png', 
-                'image/gif': '.gif',
-                'image/webp': '.webp',
-                'video/mp4': '.mp4'
-            }
-            file_extension = extension_map.get(content_type, '.jpg')
+            # Determine content type from the first bytes and the download headers
+            content_type = detect_content_type(content_bytes, header_type)
+            file_extension = extension_for(content_type)
             
             file_name = f"tweet_{tweet_id}_media_{index}{file_extension}"
-            blob_path = f"media/{tweet_id}/{file_name}"
+            blob_path = media_blob_path(tweet_id, file_name)
             
             # Upload file from memory
             bucket = self.storage_client.bucket(self.buckets['images'])
@@ -255,4 +252,159 @@ class GCPStorage:
             return f"gs://{self.buckets['images']}/{blob_path}"
         except Exception as e:
             print(f"Error uploading media file from memory: {e}")
-            return ""
\ No newline at end of file
+            return ""
+
+    def upload_video_file(self, local_path, tweet_id, index, header_type=None):
+        """Upload a downloaded video from disk with a chunked, resumable upload."""
+        try:
+            # Only the first bytes are needed to check the container type
+            with open(local_path, 'rb') as f:
+                content_type = detect_content_type(f.read(16), header_type)
+            file_extension = extension_for(content_type, '.mp4')
+            
+            file_name = f"tweet_{tweet_id}_media_{index}{file_extension}"
+            blob_path = media_blob_path(tweet_id, file_name)
+            
+            bucket = self.storage_client.bucket(self.buckets['images'])
+            blob = bucket.blob(blob_path, chunk_size=8 * 1024 * 1024)
+            blob.upload_from_filename(local_path, content_type=content_type)
+            
+            print(f"Uploaded video file for tweet {tweet_id}")
+            return f"gs://{self.buckets['images']}/{blob_path}"
+        except Exception as e:
+            print(f"Error uploading video file {local_path}: {e}")
+            return ""
+
+    def _commit_batches(self, writes, batch_size=None, max_workers=None, retries=3, collection='tweets'):
+        """Group (op, doc_id, data) writes into batches and commit them with bounded parallelism.
+
+        Returns the number of documents written. Documents that still fail
+        after their retries raise BatchWriteError once everything else is in.
+        """
+        batch_size = batch_size or settings.firestore_batch_size
+        max_workers = max_workers or settings.firestore_write_workers
+        collection_name = collection
+        collection = self.db.collection(collection)
+        failed = []
+
+        def add_write(batch, write):
+            op, tweet_id, data = write
+            tweet_ref = collection.document(str(tweet_id))
+            if op == 'delete':
+                batch.delete(tweet_ref)
+            elif op == 'update':
+                batch.update(tweet_ref, data)
+            else:
+                batch.set(tweet_ref, data, merge=(op == 'merge'))
+
+        def commit_one(write):
+            for attempt in range(retries):
+                try:
+                    batch = self.db.batch()
+                    add_write(batch, write)
+                    batch.commit()
+                    return 1
+                except Exception as e:
+                    if attempt == retries - 1:
+                        print(f"Giving up on document {write[1]} after {retries} attempts: {e}")
+                        failed.append(write[1])
+                        return 0
+                    time.sleep(0.5 * 2 ** attempt)
+
+        def commit(chunk):
+            batch = self.db.batch()
+            for write in chunk:
+                add_write(batch, write)
+            try:
+                batch.commit()
+                return len(chunk)
+            except Exception as e:
+                # One bad document fails the whole batch, so retry them individually
+                print(f"Batch of {len(chunk)} writes failed ({e}), retrying documents one by one")
+                return sum(commit_one(write) for write in chunk)
+
+        def chunks():
+            chunk = []
+            for write in writes:
+                chunk.append(write)
+                # Firestore allows at most 500 writes per batch
+                if len(chunk) >= batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        if max_workers <= 1:
+            total = sum(commit(chunk) for chunk in chunks())
+        else:
+            # Keep at most max_workers batches in flight so memory stays bounded
+            total = 0
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = set()
+                for chunk in chunks():
+                    pending.add(executor.submit(commit, chunk))
+                    if len(pending) >= max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        total += sum(future.result() for future in done)
+                total += sum(future.result() for future in pending)
+
+        if failed:
+            raise BatchWriteError(failed, total, collection_name)
+        return total
+
+    def update_tweets_batch(self, updates, batch_size=None, max_workers=None, merge=True):
+        """Write partial field updates to many tweet documents with batched writes."""
+        try:
+            op = 'merge' if merge else 'update'
+            writes = ((op, tweet_id, fields) for tweet_id, fields in updates.items())
+            total = self._commit_batches(writes, batch_size, max_workers)
+
+            print(f"Updated {total} tweets in Firestore")
+            return total
+        except Exception as e:
+            print(f"Error updating tweets in Firestore: {e}")
+            raise
+
+    def delete_tweets_batch(self, tweet_ids, batch_size=None, max_workers=None):
+        """Delete many tweet documents with batched writes."""
+        try:
+            writes = (('delete', tweet_id, None) for tweet_id in tweet_ids)
+            total = self._commit_batches(writes, batch_size, max_workers)
+
+            print(f"Deleted {total} tweets from Firestore")
+            return total
+        except Exception as e:
+            print(f"Error deleting tweets from Firestore: {e}")
+            raise
+
+    def upsert_users_batch(self, users, batch_size=None, max_workers=None):
+        """Merge account features into the users collection, keyed by user ID."""
+        try:
+            writes = (('merge', user_id, fields) for user_id, fields in users.items())
+            total = self._commit_batches(writes, batch_size, max_workers, collection='users')
+
+            print(f"Upserted {total} users in Firestore")
+            return total
+        except Exception as e:
+            print(f"Error upserting users in Firestore: {e}")
+            raise
+
+    def get_tweet_fields(self, tweet_ids, field_paths, chunk_size=300, max_workers=4):
+        """Fetch only the given fields of many tweet documents, keyed by tweet ID."""
+        collection = self.db.collection('tweets')
+        tweet_ids = [str(tweet_id) for tweet_id in tweet_ids]
+
+        def fetch(chunk):
+            refs = [collection.document(tweet_id) for tweet_id in chunk]
+            return {
+                snapshot.id: snapshot.to_dict() or {}
+                for snapshot in self.db.get_all(refs, field_paths=field_paths)
+                if snapshot.exists
+            }
+
+        chunks = [tweet_ids[i:i + chunk_size] for i in range(0, len(tweet_ids), chunk_size)]
+        result = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for fields in executor.map(fetch, chunks):
+                result.update(fields)
+        return result
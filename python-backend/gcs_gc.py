@@ -0,0 +1,142 @@
+import csv
+import argparse
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from gcp_utils import GCPStorage
+from deletion_executor import delete_blob_prefix
+from blob_layout import stream_media_prefixes
+from config import parse_args
+
+GC_WORKERS = 8
+# Media is uploaded before its Firestore document is written, so recent
+# prefixes may belong to a tweet that is still being collected
+MIN_AGE_HOURS = 24
+
+
+def stream_live_keys(gcp):
+    """Return the sets of tweet IDs and usernames that still have a Firestore document"""
+    tweet_ids = set()
+    usernames = set()
+    # Only fetch the fields we join on instead of whole documents
+    for doc in gcp.db.collection('tweets').select(['Tweet_ID', 'Username']).stream():
+        data = doc.to_dict() or {}
+        tweet_ids.add(doc.id)
+        if data.get('Tweet_ID') is not None:
+            tweet_ids.add(str(data['Tweet_ID']))
+        if data.get('Username'):
+            usernames.add(str(data['Username']))
+    return tweet_ids, usernames
+
+
+def profile_owner(blob_name, usernames):
+    """(username, is_live) for a users/<username>/profile_<username>.<ext> blob.
+
+    Usernames are display names and may contain '/', so every folder depth
+    of the path is checked against the live set, not just the first one.
+    """
+    rest = blob_name[len('users/'):]
+    owner = None
+    for position in range(len(rest)):
+        if rest[position] != '/':
+            continue
+        candidate = rest[:position]
+        if candidate in usernames:
+            return candidate, True
+        if owner is None and rest[position + 1:].startswith(f"profile_{candidate}"):
+            owner = candidate
+    return owner or rest.rsplit('/', 1)[0], False
+
+
+def find_orphans(gcp, tweet_ids, usernames):
+    """Yield (bucket, prefix, blobs) for media whose tweet ID or profile pictures whose username is no longer live.
+
+    blobs is None for media prefixes, which are listed when collected. For
+    profiles it lists exactly the orphaned blobs: a prefix like users/a/
+    can also hold the live folder of a user named 'a/b'.
+    """
+    images_bucket = gcp.buckets['images']
+    for tweet_id, prefix in stream_media_prefixes(gcp.storage_client, images_bucket):
+        if tweet_id not in tweet_ids:
+            yield images_bucket, prefix, None
+
+    profiles_bucket = gcp.buckets['profiles']
+    orphans = {}
+    for blob in gcp.storage_client.list_blobs(profiles_bucket, prefix='users/'):
+        owner, live = profile_owner(blob.name, usernames)
+        if not live:
+            orphans.setdefault(f"users/{owner}/", []).append(blob)
+    for prefix, blobs in orphans.items():
+        yield profiles_bucket, prefix, blobs
+
+
+def collect_orphan(gcp, bucket_name, prefix, blobs, min_age, dry_run):
+    """Inspect one orphaned prefix (or its given blobs) and delete it unless it was written too recently"""
+    if blobs is None:
+        blobs = list(gcp.storage_client.bucket(bucket_name).list_blobs(prefix=prefix))
+    size = sum(blob.size or 0 for blob in blobs)
+    newest = max((blob.updated for blob in blobs if blob.updated), default=None)
+
+    if newest and datetime.now(timezone.utc) - newest < min_age:
+        return bucket_name, prefix, len(blobs), size, 'too recent'
+    if dry_run:
+        return bucket_name, prefix, len(blobs), size, 'would delete'
+
+    delete_blob_prefix(gcp.storage_client, bucket_name, prefix, blobs)
+    return bucket_name, prefix, len(blobs), size, 'deleted'
+
+
+def run_gc(gcp, dry_run=True, max_workers=GC_WORKERS, min_age_hours=MIN_AGE_HOURS, report_path=None):
+    """Delete blobs under media/ and users/ that no Firestore tweet refers to anymore"""
+    print(f'{datetime.now()} - Loading live tweet IDs and usernames from Firestore...')
+    tweet_ids, usernames = stream_live_keys(gcp)
+    print(f'{datetime.now()} - {len(tweet_ids)} tweet IDs, {len(usernames)} usernames live')
+
+    min_age = timedelta(hours=min_age_hours)
+    results = []
+    totals = {}
+
+    # Orphans are checked and deleted while the listing is still streaming
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(collect_orphan, gcp, bucket_name, prefix, blobs, min_age, dry_run)
+            for bucket_name, prefix, blobs in find_orphans(gcp, tweet_ids, usernames)
+        ]
+        for future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error collecting orphan: {e}")
+                continue
+            results.append(result)
+            status = result[4]
+            count, size = totals.get(status, (0, 0))
+            totals[status] = (count + result[2], size + result[3])
+
+    for status, (count, size) in totals.items():
+        print(f'{datetime.now()} - {status}: {count} blobs, {size / 1024 / 1024:.1f} MB')
+
+    if report_path:
+        # Prefixes hold display names, which can contain commas and quotes
+        with open(report_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['bucket', 'prefix', 'blobs', 'bytes', 'status'])
+            writer.writerows(results)
+        print(f'{datetime.now()} - Report written to {report_path}')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete orphaned media and profile blobs')
+    parser.add_argument('--delete', action='store_true', help='Actually delete; default is a dry run')
+    parser.add_argument('--workers', type=int, default=GC_WORKERS)
+    parser.add_argument('--min-age-hours', type=float, default=MIN_AGE_HOURS)
+    parser.add_argument('--report', default='gc_report.csv', help='CSV report of orphaned prefixes')
+    args = parse_args(parser)
+
+    run_gc(GCPStorage(), dry_run=not args.delete, max_workers=args.workers,
+           min_age_hours=args.min_age_hours, report_path=args.report)
+
+
+if __name__ == "__main__":
+    main()
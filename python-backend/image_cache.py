@@ -0,0 +1,93 @@
+import os
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from file_utils import adjust_path_if_needed
+from blob_layout import media_path_candidates
+
+
+class ImageCache:
+    """Bounded LRU cache of decoded thumbnails filled by a background thread pool."""
+
+    def __init__(self, max_items=64, max_workers=4, thumb_size=(480, 480), key_path='GCP_KEYS.json'):
+        """Set up the cache and its loader pool; the GCS client is created on first use."""
+        self.max_items = max_items
+        self.thumb_size = thumb_size
+        self.key_path = key_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-prefetch')
+        self._storage_client = None
+
+    def _get_storage_client(self):
+        """Create the GCS client lazily so local-only reviews don't need credentials"""
+        if self._storage_client is None:
+            from google.cloud import storage
+            if os.path.exists(self.key_path):
+                self._storage_client = storage.Client.from_service_account_json(self.key_path)
+            else:
+                self._storage_client = storage.Client()
+        return self._storage_client
+
+    def _read_bytes(self, path):
+        """Read raw image bytes from local disk or a gs:// URI"""
+        if path.startswith('gs://'):
+            from google.api_core.exceptions import NotFound
+
+            # Paths stored before a key layout migration may have moved
+            candidates = media_path_candidates(path)
+            for candidate in candidates:
+                bucket_name, _, blob_path = candidate[len('gs://'):].partition('/')
+                bucket = self._get_storage_client().bucket(bucket_name)
+                try:
+                    return bucket.blob(blob_path).download_as_bytes()
+                except NotFound:
+                    if candidate == candidates[-1]:
+                        raise
+
+        with open(adjust_path_if_needed(path), 'rb') as f:
+            return f.read()
+
+    def _load(self, path):
+        """Download and decode one image into a display-sized RGB thumbnail"""
+        try:
+            image = Image.open(BytesIO(self._read_bytes(path)))
+            # draft() lets JPEG decode at reduced scale, which is much cheaper
+            image.draft('RGB', self.thumb_size)
+            image = image.convert('RGB')
+            image.thumbnail(self.thumb_size)
+            return image
+        except Exception as e:
+            print(f"Error loading image {path}: {e}")
+            return None
+
+    def prefetch(self, paths):
+        """Start loading the given paths in the background if they aren't cached yet"""
+        with self._lock:
+            for path in paths:
+                if not path:
+                    continue
+                if path in self._entries:
+                    self._entries.move_to_end(path)
+                    continue
+                self._entries[path] = self._executor.submit(self._load, path)
+                self._evict()
+
+    def get(self, path):
+        """Return the decoded thumbnail for a path, loading it now if it wasn't prefetched"""
+        self.prefetch([path])
+        with self._lock:
+            future = self._entries.get(path)
+        return future.result() if future else self._load(path)
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_items (caller holds the lock)"""
+        while len(self._entries) > self.max_items:
+            _, future = self._entries.popitem(last=False)
+            future.cancel()
+
+    def close(self):
+        """Stop the loader threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,12 @@
 import os
 import time
-import pyautogui
+from PIL import Image, ImageDraw
+
+# pyautogui needs a desktop session, the grid review mode works without it
+try:
+    import pyautogui
+except Exception:
+    pyautogui = None
 
 #NOT USED ANYMORE, ON THE WEBSITE
 
@@ -22,6 +28,8 @@ def view_image(image_path):
         
         # Try to refocus using Alt+Tab
         try:
+            if pyautogui is None:
+                raise RuntimeError("pyautogui unavailable")
             time.sleep(4)  # Wait for image viewer to open
             
             pyautogui.keyDown('alt')
@@ -74,4 +82,77 @@ def delete_file_if_exists(filepath):
     else:
         print(f"File not found: {original_filepath}")
     
-    return False
\ No newline at end of file
+    return False
+
+
+class GridViewer:
+    """Single Tk window that shows a page of numbered thumbnails and is reused between pages."""
+    
+    def __init__(self, columns=3, tile_size=(480, 480), title="Tweet Image Review"):
+        """Open the window. Raises if no display is available."""
+        import tkinter as tk
+        from PIL import ImageTk
+        
+        self._tk = tk
+        self._image_tk = ImageTk
+        self.columns = columns
+        self.tile_size = tile_size
+        self.root = tk.Tk()
+        self.root.title(title)
+        self._widgets = []
+        self._photos = []
+    
+    def show(self, images, captions):
+        """Replace the window contents with the given images and captions"""
+        for widget in self._widgets:
+            widget.destroy()
+        self._widgets = []
+        # Tk only displays PhotoImages that are still referenced
+        self._photos = []
+        
+        for i, (image, caption) in enumerate(zip(images, captions)):
+            row, column = divmod(i, self.columns)
+            if image is None:
+                image = Image.new('RGB', self.tile_size, 'gray')
+            photo = self._image_tk.PhotoImage(image)
+            self._photos.append(photo)
+            
+            label = self._tk.Label(self.root, image=photo, text=caption, compound='top', font=('Arial', 12, 'bold'))
+            label.grid(row=row, column=column, padx=4, pady=4)
+            self._widgets.append(label)
+        
+        # Draw now; the console prompt blocks the Tk event loop afterwards
+        self.root.update()
+    
+    def close(self):
+        """Close the window"""
+        try:
+            self.root.destroy()
+        except Exception:
+            pass
+
+
+def compose_grid(images, captions, columns=3, tile_size=(480, 480)):
+    """Paste thumbnails into one captioned grid image"""
+    rows = max(1, (len(images) + columns - 1) // columns)
+    caption_height = 24
+    grid = Image.new('RGB', (columns * tile_size[0], rows * (tile_size[1] + caption_height)), 'white')
+    draw = ImageDraw.Draw(grid)
+    
+    for i, (image, caption) in enumerate(zip(images, captions)):
+        row, column = divmod(i, columns)
+        x = column * tile_size[0]
+        y = row * (tile_size[1] + caption_height)
+        draw.text((x + 4, y + 4), caption, fill='black')
+        if image is not None:
+            grid.paste(image, (x, y + caption_height))
+    return grid
+
+
+def open_grid_viewer(columns=3, tile_size=(480, 480)):
+    """Return a GridViewer, or None when Tk can't open a window"""
+    try:
+        return GridViewer(columns, tile_size)
+    except Exception as e:
+        print(f"Could not open review window ({e}). Falling back to the default image viewer.")
+        return None
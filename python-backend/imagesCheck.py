@@ -5,175 +5,272 @@ from PIL import Image
 # NOT USED ANYMORE ON THE WEBSITE
 
 # Import from our utility modules
-from file_utils import select_csv_file, delete_file_if_exists
-from image_utils import view_image, close_image_viewers
+from file_utils import select_csv_file, adjust_path_if_needed
+from image_utils import view_image, close_image_viewers, open_grid_viewer, compose_grid
+from image_cache import ImageCache
+from label_journal import LabelJournal
+from lazy_csv import LazyCsv, TWEET_DTYPES
+from deletion_executor import DeletionExecutor, ReviewedUsers, build_username_index
+from config import settings, configure
 
-def adjust_path_if_needed(path):
-    """Check if file exists in parent directory and adjust path if needed"""
-    if not path:
-        return path
-        
-    if not os.path.exists(path):
-        parent_path = os.path.join('..', path)
-        if os.path.exists(parent_path):
-            return parent_path
-    return path
+def open_deleter():
+    """Create the deletion executor, with Cloud Storage cleanup when enabled in config"""
+    gcp = None
+    if settings.review_delete_from_gcs:
+        from gcp_utils import GCPStorage
+        gcp = GCPStorage()
+    return DeletionExecutor(gcp, max_workers=settings.delete_workers)
+
+def load_review_keys(dataset, journal, columns=()):
+    """Read the narrow per-row columns a review pass needs, plus the IDs already deleted"""
+    keys = dataset.read_columns(['Tweet_ID', 'Username'] + list(columns))
+    deleted_ids = journal.deleted_ids()
+    # Rows keep their position, deleted ones are skipped rather than dropped
+    username_index = build_username_index(keys[~keys['Tweet_ID'].astype(str).isin(deleted_ids)])
+    return keys, username_index, deleted_ids
+
+def delete_tweets(dataset, keys, rows_to_delete, image_type, journal, deleter, deleted_ids):
+    """Queue file deletions for the given rows and journal them as deleted"""
+    rows = [row_idx for row_idx in rows_to_delete if str(keys.at[row_idx, 'Tweet_ID']) not in deleted_ids]
+    
+    # Files are removed in the background, the journal entry is what makes it durable
+    deleter.delete_rows(dataset.take(rows), rows, delete_user_prefix=(image_type == "profile"))
+    for row_idx in rows:
+        tweet_id = str(keys.at[row_idx, 'Tweet_ID'])
+        journal.record(tweet_id, action='delete', reason=image_type)
+        deleted_ids.add(tweet_id)
+    return len(rows)
 
-def process_images(df, csv_filename, image_type):
+def process_images(dataset, csv_filename, image_type):
     """Process images of the specified type (profile pics or media)"""
     print(f"\nProcessing {image_type} from {csv_filename}...")
     
     if image_type == "profile":
         column_name = "Profile_Pic"
         print("\nReviewing profile pictures...\n")
-        # Keep track of processed usernames to avoid duplicates
-        processed_users = set()
+        # Keep track of processed usernames to avoid duplicates, across sessions
+        processed_users = ReviewedUsers(csv_filename)
     else:  # media
         column_name = "Media_Files"
         print("\nReviewing media images...\n")
     
-    current_row = 0
+    # Deletions are journaled and merged into the CSV once at the end,
+    # so rows keep their position for the whole session
+    journal = LabelJournal.for_dataset(csv_filename)
+    keys, username_index, deleted_ids = load_review_keys(dataset, journal)
+    deleter = open_deleter()
+    quit_requested = False
     
-    while current_row < len(df):
-        if current_row >= len(df):  # Check again as df size may change
-            break
-        
-        # For profile pictures, skip if username already processed
-        if image_type == "profile":
-            current_username = df.at[current_row, 'Username']
-            if current_username in processed_users:
-                print(f"Skipping profile pic for {current_username} (already reviewed)")
-                current_row += 1
+    try:
+        for current_row in range(len(dataset)):
+            if quit_requested:
+                break
+            
+            if str(keys.at[current_row, 'Tweet_ID']) in deleted_ids:
                 continue
+            
+            # For profile pictures, skip if username already processed
+            if image_type == "profile":
+                current_username = keys.at[current_row, 'Username']
+                if current_username in processed_users:
+                    print(f"Skipping profile pic for {current_username} (already reviewed)")
+                    continue
+            
+            # Only the window around the current row is decoded
+            row = dataset.row(current_row)
+            
+            # Get the image paths for the current row
+            if image_type == "profile":
+                image_paths = [row[column_name]] if pd.notna(row[column_name]) and row[column_name] else []
             else:
-                processed_users.add(current_username)
-        
-        # Get the image paths for the current row
-        if image_type == "profile":
-            image_paths = [df.at[current_row, column_name]] if pd.notna(df.at[current_row, column_name]) and df.at[current_row, column_name] else []
-        else:
-            media_str = str(df.at[current_row, column_name]) if pd.notna(df.at[current_row, column_name]) else ""
-            image_paths = media_str.split('|') if media_str else []
-        
-        # Skip if no images
-        if not image_paths or not any(path for path in image_paths):
-            current_row += 1
-            continue
-        
-        # Display tweet information
-        print("\n" + "="*80)
-        print(f"Tweet {current_row+1} of {len(df)}")
-        print(f"User: {df.at[current_row, 'Username']}")
-        print(f"Text: {df.at[current_row, 'Text']}")
-        print("-"*80)
-        
-        # Process each image
-        decision = 'k'  # default to keep
-        for img_path in image_paths:
-            if not img_path:
+                media_str = str(row[column_name]) if pd.notna(row[column_name]) else ""
+                image_paths = media_str.split('|') if media_str else []
+            
+            # Skip if no images
+            if not image_paths or not any(path for path in image_paths):
                 continue
             
-            # Check if we need to adjust the path to look in parent directory
-            img_path = adjust_path_if_needed(img_path)
+            # Display tweet information
+            print("\n" + "="*80)
+            print(f"Tweet {current_row+1} of {len(dataset)}")
+            print(f"User: {row['Username']}")
+            print(f"Text: {row['Text']}")
+            print("-"*80)
             
-            if not os.path.exists(img_path):
-                print(f"Image not found: {img_path}")
-                continue
+            # Process each image
+            for img_path in image_paths:
+                if not img_path:
+                    continue
                 
-            print(f"Viewing image: {img_path}")
-            view_result = view_image(img_path)
-            
-            if view_result:
-                # Get user decision
-                while True:
-                    decision = input("Keep this image? (k)eep, (d)elete tweet, (s)kip, (q)uit: ").lower()
-                    if decision in ['k', 'd', 's', 'q']:
-                        break
-                    print("Please enter k, d, s, or q.")
+                # Check if we need to adjust the path to look in parent directory
+                img_path = adjust_path_if_needed(img_path)
                 
-                # Close all image viewers after decision is made
-                close_image_viewers()
-                
-                if decision == 'q':
-                    print("\nImage review process terminated.")
-                    return df
-                
-                elif decision == 'd':
-                    print("\nDeleting tweet and all associated media...")
+                if not os.path.exists(img_path):
+                    print(f"Image not found: {img_path}")
+                    continue
                     
-                    # If deleting profile pic, find and delete all rows with same username
-                    if image_type == "profile":
-                        username_to_delete = df.at[current_row, 'Username']
-                        rows_to_delete = df[df['Username'] == username_to_delete].index.tolist()
-                        
-                        for row_idx in rows_to_delete:
-                            # Delete profile picture
-                            profile_pic = adjust_path_if_needed(df.at[row_idx, 'Profile_Pic'])
-                            delete_file_if_exists(profile_pic)
-                            
-                            # Delete all media files
-                            if 'Media_Files' in df.columns and pd.notna(df.at[row_idx, 'Media_Files']) and df.at[row_idx, 'Media_Files']:
-                                media_files = str(df.at[row_idx, 'Media_Files']).split('|')
-                                for media_file in media_files:
-                                    media_file = adjust_path_if_needed(media_file)
-                                    delete_file_if_exists(media_file)
-                        
-                        # Remove all rows with this username
-                        print(f"Deleting all {len(rows_to_delete)} tweets from user: {username_to_delete}")
-                        df = df[df['Username'] != username_to_delete]
-                    else:
-                        # Delete just this tweet
-                        # Delete profile picture
-                        profile_pic = adjust_path_if_needed(df.at[current_row, 'Profile_Pic'])
-                        delete_file_if_exists(profile_pic)
-                        
-                        # Delete all media files
-                        if 'Media_Files' in df.columns and pd.notna(df.at[current_row, 'Media_Files']) and df.at[current_row, 'Media_Files']:
-                            media_files = str(df.at[current_row, 'Media_Files']).split('|')
-                            for media_file in media_files:
-                                media_file = adjust_path_if_needed(media_file)
-                                delete_file_if_exists(media_file)
-                        
-                        # Remove the row from the dataframe
-                        df = df.drop(current_row)
+                print(f"Viewing image: {img_path}")
+                view_result = view_image(img_path)
+                
+                if view_result:
+                    # Get user decision
+                    while True:
+                        decision = input("Keep this image? (k)eep, (d)elete tweet, (s)kip, (q)uit: ").lower()
+                        if decision in ['k', 'd', 's', 'q']:
+                            break
+                        print("Please enter k, d, s, or q.")
                     
-                    # Reset index and reindex Tweet_count column
-                    df = df.reset_index(drop=True)
+                    # Close all image viewers after decision is made
+                    close_image_viewers()
                     
-                    # Update Tweet_count column to be sequential
-                    if 'Tweet_count' in df.columns:
-                        df['Tweet_count'] = range(1, len(df) + 1)
+                    if decision == 'q':
+                        print("\nImage review process terminated.")
+                        quit_requested = True
+                        break
                     
-                    # Save the updated CSV immediately without index
-                    df.to_csv(csv_filename, index=False)
-                    print(f"Tweet and associated media have been deleted.")
+                    elif decision == 'd':
+                        print("\nDeleting tweet and all associated media...")
+                        
+                        # If deleting profile pic, find and delete all rows with same username
+                        if image_type == "profile":
+                            username_to_delete = row['Username']
+                            rows_to_delete = username_index.get(username_to_delete, [current_row])
+                            print(f"Deleting all {len(rows_to_delete)} tweets from user: {username_to_delete}")
+                        else:
+                            # Delete just this tweet
+                            rows_to_delete = [current_row]
+                        
+                        delete_tweets(dataset, keys, rows_to_delete, image_type, journal, deleter, deleted_ids)
+                        print(f"Tweet and associated media have been deleted.")
+                        break  # Break the image loop as we've deleted all images for this tweet
                     
-                    # Don't increment current_row since we deleted the current row
-                    # and the next row has shifted up to take its place
-                    break  # Break the image loop as we've deleted all images for this tweet
+                    elif decision == 's':
+                        continue  # Skip to next image
                 
-                elif decision == 's':
-                    continue  # Skip to next image
+                else:
+                    print("Failed to display image. Skipping...")
             
-            else:
-                print("Failed to display image. Skipping...")
+            # Remember the user once a decision was made on their picture
+            if image_type == "profile" and not quit_requested:
+                processed_users.add(current_username)
         
-        # Move to next tweet if we didn't delete the current one
-        if decision != 'd':
-            current_row += 1
+        if not quit_requested:
+            print("\nImage review complete!")
+    
+    finally:
+        deleter.close()
+        if image_type == "profile":
+            processed_users.close()
+        # Apply all deletions in one streamed CSV rewrite
+        journal.checkpoint_csv(csv_filename)
+        journal.close()
+
+def process_images_grid(dataset, csv_filename, image_type):
+    """Review images a grid page at a time while the next pages are decoded in the background"""
+    print(f"\nProcessing {image_type} from {csv_filename} in grid mode...")
+    column_name = "Profile_Pic" if image_type == "profile" else "Media_Files"
+    grid_size = settings.review_grid_columns * settings.review_grid_rows
+    
+    journal = LabelJournal.for_dataset(csv_filename)
+    keys, username_index, deleted_ids = load_review_keys(dataset, journal, [column_name])
+    reviewed_users = ReviewedUsers(csv_filename) if image_type == "profile" else None
+    
+    # One tile per image, remembering the row it belongs to
+    tiles = []
+    seen_users = set()
+    for row_idx, tweet_id, username, value in zip(keys.index, keys['Tweet_ID'], keys['Username'], keys[column_name]):
+        if pd.isna(value) or not value or str(tweet_id) in deleted_ids:
+            continue
+        if image_type == "profile":
+            # Each user's profile picture is only reviewed once, across sessions
+            if username in seen_users or username in reviewed_users:
+                continue
+            seen_users.add(username)
+            tiles.append((row_idx, value))
+        else:
+            tiles.extend((row_idx, path) for path in str(value).split('|') if path)
+    
+    pages = [tiles[i:i + grid_size] for i in range(0, len(tiles), grid_size)]
+    print(f"{len(tiles)} images to review on {len(pages)} pages")
     
-    print("\nImage review complete!")
+    cache = ImageCache(max_items=settings.image_cache_size, max_workers=settings.image_prefetch_workers,
+                       key_path=settings.gcp_key_path)
+    viewer = open_grid_viewer(columns=settings.review_grid_columns)
+    deleter = open_deleter()
     
-    # Final cleanup of the dataframe - fix any missing indices
-    df = df.reset_index(drop=True)
-    if 'Tweet_count' in df.columns:
-        df['Tweet_count'] = range(1, len(df) + 1)
+    try:
+        for page_no, page in enumerate(pages):
+            # Start decoding the next pages while this one is on screen
+            upcoming = pages[page_no + 1:page_no + 1 + settings.review_prefetch_pages]
+            cache.prefetch([path for next_page in upcoming for _, path in next_page])
+            
+            # Tiles of tweets deleted on an earlier page (same user) are dropped
+            page = [(row_idx, path) for row_idx, path in page if str(keys.at[row_idx, 'Tweet_ID']) not in deleted_ids]
+            if not page:
+                continue
+            
+            print("\n" + "="*80)
+            print(f"Page {page_no+1} of {len(pages)}")
+            for n, (row_idx, path) in enumerate(page):
+                text = str(dataset.row(row_idx)['Text'])[:100]
+                print(f"{n+1}. {keys.at[row_idx, 'Username']}: {text}")
+            print("-"*80)
+            
+            images = [cache.get(path) for _, path in page]
+            captions = [f"{n+1}. {keys.at[row_idx, 'Username']}" for n, (row_idx, _) in enumerate(page)]
+            if viewer:
+                viewer.show(images, captions)
+            else:
+                compose_grid(images, captions, settings.review_grid_columns, cache.thumb_size).show()
+            
+            # Get user decision for the whole page
+            while True:
+                response = input("Tiles to delete (e.g. '2 5'), Enter to keep all, q to quit: ").strip().lower()
+                if response == 'q':
+                    break
+                try:
+                    choices = {int(n) for n in response.replace(',', ' ').split()}
+                except ValueError:
+                    print("Please enter tile numbers separated by spaces, or q.")
+                    continue
+                if all(1 <= n <= len(page) for n in choices):
+                    break
+                print(f"Tile numbers must be between 1 and {len(page)}.")
+            
+            if response == 'q':
+                print("\nImage review process terminated.")
+                break
+            
+            for n in sorted(choices):
+                row_idx = page[n - 1][0]
+                if image_type == "profile":
+                    # Deleting a profile picture removes every tweet of that user
+                    rows_to_delete = username_index.get(keys.at[row_idx, 'Username'], [row_idx])
+                else:
+                    rows_to_delete = [row_idx]
+                
+                deleted = delete_tweets(dataset, keys, rows_to_delete, image_type, journal, deleter, deleted_ids)
+                print(f"Deleted {deleted} tweet(s) for tile {n}")
+            
+            if reviewed_users is not None:
+                for row_idx, _ in page:
+                    reviewed_users.add(keys.at[row_idx, 'Username'])
+        else:
+            print("\nImage review complete!")
     
-    # Final save to ensure CSV is clean
-    df.to_csv(csv_filename, index=False)
-    return df
+    finally:
+        cache.close()
+        if viewer:
+            viewer.close()
+        deleter.close()
+        if reviewed_users is not None:
+            reviewed_users.close()
+        # Apply all deletions in one streamed CSV rewrite
+        journal.checkpoint_csv(csv_filename)
+        journal.close()
 
 def main():
+    configure()
     print("Tweet Image Reviewer\n")
     
     # Step 1: Select CSV file
@@ -182,9 +279,9 @@ def main():
         print("No file selected. Exiting.")
         return
     
-    # Step 2: Read the CSV
+    # Step 2: Index the CSV; rows are only decoded when they are reviewed
     try:
-        df = pd.read_csv(csv_filename)
+        dataset = LazyCsv(csv_filename, dtype=TWEET_DTYPES)
     except Exception as e:
         print(f"Error reading CSV file: {e}")
         return
@@ -194,25 +291,35 @@ def main():
         print("\nWhat would you like to review?")
         print("1. Profile pictures")
         print("2. Media images (photos, videos, etc.)")
-        print("3. Exit")
+        print("3. Profile pictures (grid, prefetched)")
+        print("4. Media images (grid, prefetched)")
+        print("5. Exit")
         
         try:
-            choice = int(input("\nEnter your choice (1-3): "))
+            choice = int(input("\nEnter your choice (1-5): "))
             
             if choice == 1:
-                df = process_images(df, csv_filename, "profile")
+                process_images(dataset, csv_filename, "profile")
             elif choice == 2:
-                df = process_images(df, csv_filename, "media")
+                process_images(dataset, csv_filename, "media")
             elif choice == 3:
+                process_images_grid(dataset, csv_filename, "profile")
+            elif choice == 4:
+                process_images_grid(dataset, csv_filename, "media")
+            elif choice == 5:
                 print("Exiting program.")
                 break
             else:
-                print("Invalid choice. Please enter 1, 2, or 3.")
+                print("Invalid choice. Please enter a number from 1 to 5.")
+                continue
+            
+            # The review rewrote the CSV, re-index it for the next pass
+            dataset = LazyCsv(csv_filename, dtype=TWEET_DTYPES)
         except ValueError:
             print("Please enter a valid number.")
         except KeyboardInterrupt:
-            print("\n\nProgram interrupted. Saving any changes.")
-            df.to_csv(csv_filename, index=False)
+            # process_images already merged its journal into the CSV
+            print("\n\nProgram interrupted. Changes have been saved.")
             break
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import pandas as pd
+from lazy_csv import TWEET_DTYPES
+from config import settings, configure
+
+
+class LabelJournal:
+    """Append-only JSONL write-ahead log of review decisions kept next to a dataset."""
+
+    def __init__(self, path, compact_every=500):
+        """Open (or create) the journal file for appending."""
+        self.path = path
+        # Entries already merged into the CSV but not yet replayed into Firestore
+        self.unsynced_path = f"{path}.unsynced"
+        self.compact_every = compact_every
+        self._since_compact = 0
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @classmethod
+    def for_dataset(cls, csv_filename, **kwargs):
+        """Open the journal that belongs to a CSV export"""
+        return cls(f"{csv_filename}.journal.jsonl", **kwargs)
+
+    def record(self, tweet_id, action='label', label=None, **extra):
+        """Append one decision and fsync it, without touching the dataset"""
+        entry = {'tweet_id': str(tweet_id), 'action': action, 'label': label, 'ts': time.time()}
+        entry.update(extra)
+
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self._since_compact += 1
+        if self.compact_every and self._since_compact >= self.compact_every:
+            self.compact()
+        return entry
+
+    def entries(self, include_unsynced=False):
+        """Yield journal entries in write order, optionally preceded by merged-but-unsynced ones"""
+        paths = [self.unsynced_path, self.path] if include_unsynced else [self.path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash mid-write can leave a partial last line
+                        print(f"Skipping corrupt journal line in {path}")
+
+    def latest(self, include_unsynced=False):
+        """Return the last decision per tweet ID (last write wins)"""
+        state = {}
+        for entry in self.entries(include_unsynced):
+            state[entry['tweet_id']] = entry
+        return state
+
+    def compact(self):
+        """Rewrite the journal keeping only the latest decision per tweet"""
+        state = self.latest()
+        tmp_path = f"{self.path}.tmp"
+
+        self._file.close()
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in state.values():
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._since_compact = 0
+        return len(state)
+
+    def deleted_ids(self, state=None):
+        """Tweet IDs whose latest journaled decision is a deletion"""
+        state = self.latest() if state is None else state
+        return {tid for tid, e in state.items() if e['action'] == 'delete'}
+
+    def apply_to_dataframe(self, df, id_column='Tweet_ID', label_column='is_disinfo', state=None, drop_deleted=True):
+        """Overlay journaled labels and deletions onto a DataFrame in one vectorized pass.
+
+        Pass state (from latest()) to overlay many chunks without re-reading the
+        journal, and drop_deleted=False to keep row positions stable.
+        """
+        state = self.latest() if state is None else state
+        if not state or id_column not in df.columns:
+            return df
+
+        labels = {tid: e['label'] for tid, e in state.items() if e['action'] == 'label'}
+        deleted = {tid for tid, e in state.items() if e['action'] == 'delete'}
+
+        ids = df[id_column].astype(str)
+        if labels:
+            journaled = ids.map(labels)
+            if label_column not in df.columns:
+                df[label_column] = None
+            df[label_column] = journaled.where(journaled.notna(), df[label_column])
+        if deleted and drop_deleted:
+            df = df[~ids.isin(deleted)].reset_index(drop=True)
+        return df
+
+    def checkpoint(self, df, csv_filename, **kwargs):
+        """Merge the journal into the CSV with a single write, then truncate the journal.
+
+        Tweet_count is left alone: it is the tweet's stored number, so
+        deletions leave gaps rather than shifting the tweets after them.
+        """
+        df = self.apply_to_dataframe(df, **kwargs)
+
+        # Write to a temp file first so a crash never leaves a half-written CSV
+        tmp_path = f"{csv_filename}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_filename)
+
+        self._rotate()
+        return df
+
+    def checkpoint_csv(self, csv_filename, chunksize=None):
+        """Like checkpoint(), but streams the CSV through the journal a chunk at a time"""
+        chunksize = chunksize or settings.import_chunk_rows
+        state = self.latest()
+        tmp_path = f"{csv_filename}.tmp"
+        count = 0
+        with pd.read_csv(csv_filename, dtype=TWEET_DTYPES, chunksize=chunksize) as chunks, \
+                open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            for n, chunk in enumerate(chunks):
+                chunk = self.apply_to_dataframe(chunk, state=state)
+                count += len(chunk)
+                chunk.to_csv(f, header=(n == 0), index=False)
+        if os.path.getsize(tmp_path):
+            os.replace(tmp_path, csv_filename)
+        else:
+            # Header-only CSV: nothing to rewrite
+            os.remove(tmp_path)
+
+        self._rotate()
+        return count
+
+    def _rotate(self):
+        """Move the merged entries to the unsynced file and start an empty journal"""
+        # Keep the merged entries around until they are replayed into Firestore
+        self._file.close()
+        with open(self.path, encoding='utf-8') as src, open(self.unsynced_path, 'a', encoding='utf-8') as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._since_compact = 0
+
+    def close(self):
+        """Close the underlying file"""
+        if not self._file.closed:
+            self._file.close()
+
+    def replay_to_firestore(self, gcp, batch_size=None):
+        """Apply the journaled labels and deletions to Firestore in batches.
+
+        Writes that still fail are kept in the unsynced file for the next
+        replay, and BatchWriteError is raised with their tweet IDs.
+        """
+        from gcp_utils import BatchWriteError
+
+        state = self.latest(include_unsynced=True)
+
+        labels = {
+            tid: {'is_disinfo': e['label']}
+            for tid, e in state.items() if e['action'] == 'label'
+        }
+        deleted = [tid for tid, e in state.items() if e['action'] == 'delete']
+
+        failed = []
+        updated = removed = 0
+        try:
+            updated = gcp.update_tweets_batch(labels, batch_size=batch_size) if labels else 0
+        except BatchWriteError as e:
+            failed += e.failed_ids
+            updated = e.written
+        try:
+            removed = gcp.delete_tweets_batch(deleted, batch_size=batch_size) if deleted else 0
+        except BatchWriteError as e:
+            failed += e.failed_ids
+            removed = e.written
+
+        # Replaying is idempotent, so merged entries are forgotten only once written
+        if failed:
+            self._keep_unsynced([state[str(tid)] for tid in failed if str(tid) in state])
+            raise BatchWriteError(failed, updated + removed)
+        if os.path.exists(self.unsynced_path):
+            os.remove(self.unsynced_path)
+        return updated, removed
+
+    def _keep_unsynced(self, entries):
+        """Replace the unsynced file with just these entries"""
+        tmp_path = f"{self.unsynced_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.unsynced_path)
+
+
+def main():
+    """Merge a review journal into its CSV and/or replay it into Firestore"""
+    if len(sys.argv) < 3 or sys.argv[1] not in ('merge', 'replay'):
+        print("Usage: python label_journal.py <merge|replay> <export.csv>")
+        return
+
+    configure()
+    command, csv_filename = sys.argv[1], sys.argv[2]
+    journal = LabelJournal.for_dataset(csv_filename, compact_every=0)
+
+    try:
+        if command == 'replay':
+            from gcp_utils import GCPStorage, BatchWriteError
+            try:
+                updated, removed = journal.replay_to_firestore(GCPStorage())
+            except BatchWriteError as e:
+                print(f"Replay incomplete: {e}; {len(e.failed_ids)} entries kept in {journal.unsynced_path} for the next replay")
+                sys.exit(1)
+            print(f"Replayed {updated} labels and {removed} deletions into Firestore")
+        else:
+            deleted = len(journal.deleted_ids())
+            remaining = journal.checkpoint_csv(csv_filename)
+            print(f"Merged journal into {csv_filename}: {deleted} deletions applied, {remaining} rows remaining")
+    finally:
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import sys
+import argparse
+from datetime import datetime
+import pandas as pd
+from label_journal import LabelJournal
+from lazy_csv import TWEET_DTYPES
+from gcp_utils import GCPStorage, BatchWriteError
+from config import parse_args
+
+
+def load_local_labels(csv_filename):
+    """Return {tweet_id: label} for every labeled row of a review CSV, journal included"""
+    df = pd.read_csv(csv_filename, dtype=TWEET_DTYPES)
+
+    journal = LabelJournal.for_dataset(csv_filename)
+    try:
+        df = journal.apply_to_dataframe(df)
+    finally:
+        journal.close()
+
+    labels = df['is_disinfo'].fillna('').str.strip().str.lower()
+    labeled = df['Tweet_ID'].notna() & labels.isin(['true', 'false'])
+    return dict(zip(df.loc[labeled, 'Tweet_ID'], labels[labeled]))
+
+
+def diff_labels(local_labels, remote_fields):
+    """Return the local labels that differ from Firestore, ignoring tweets missing remotely"""
+    changes = {}
+    missing = 0
+    for tweet_id, label in local_labels.items():
+        if tweet_id not in remote_fields:
+            missing += 1
+            continue
+        if str(remote_fields[tweet_id].get('is_disinfo', '')).lower() != label:
+            changes[tweet_id] = label
+    return changes, missing
+
+
+def sync_labels(gcp, csv_filename, max_workers=None, dry_run=False):
+    """Push only the is_disinfo values that changed locally to Firestore.
+
+    max_workers defaults to the firestore_write_workers setting.
+    """
+    local_labels = load_local_labels(csv_filename)
+    print(f'{datetime.now()} - {len(local_labels)} labeled tweets in {csv_filename}')
+
+    # Only read the is_disinfo field of the tweets we have labels for
+    remote_fields = gcp.get_tweet_fields(local_labels.keys(), ['is_disinfo'])
+    changes, missing = diff_labels(local_labels, remote_fields)
+    print(f'{datetime.now()} - {len(changes)} labels changed, {missing} tweets not in Firestore')
+
+    if dry_run or not changes:
+        return changes
+
+    updates = {tweet_id: {'is_disinfo': label} for tweet_id, label in changes.items()}
+    gcp.update_tweets_batch(updates, max_workers=max_workers, merge=False)
+    print(f'{datetime.now()} - Synced {len(changes)} labels to Firestore')
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync local is_disinfo labels to Firestore')
+    parser.add_argument('csv', help='Review CSV produced by classification.py')
+    parser.add_argument('--workers', type=int, help='Batches written in parallel; defaults to the firestore_write_workers setting')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    args = parse_args(parser)
+
+    try:
+        sync_labels(GCPStorage(), args.csv, args.workers, args.dry_run)
+    except BatchWriteError as e:
+        # Only differences are pushed, so the next sync retries exactly these
+        print(f'{datetime.now()} - Sync incomplete: {e}')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
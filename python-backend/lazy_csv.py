@@ -0,0 +1,134 @@
+import os
+from io import BytesIO
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from config import settings
+
+# Column types shared by every reader of a tweets CSV, so IDs and labels stay strings
+TWEET_DTYPES = {'Tweet_ID': str, 'is_disinfo': str}
+
+# Rows decoded per window when reviewing; whole-file passes use the import_chunk_rows setting
+WINDOW_ROWS = 256
+# Windows kept decoded, so stepping back a few rows does not re-read the file
+CACHED_WINDOWS = 2
+
+# Layout of the .rowindex.npy file: the CSV's size and mtime (to detect a
+# rewrite), the byte offset where the header ends, then the start offset of
+# every data row followed by the end-of-file offset
+INDEX_META = 3
+
+
+def scan_row_offsets(path):
+    """Return (header_end, row_start_offsets + [eof]) for a CSV in one streaming pass.
+
+    A line ends a record only when the record holds an even number of quote
+    characters, so multi-line quoted fields (tweet texts) stay one row.
+    """
+    offsets = []
+    header_end = None
+    position = 0
+    quotes = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if quotes % 2 == 0:
+                # Start of a new record; blank lines are skipped like pandas does
+                if line.strip(b'\r\n') == b'':
+                    position += len(line)
+                    continue
+                if header_end is not None:
+                    offsets.append(position)
+            quotes += line.count(b'"')
+            position += len(line)
+            if quotes % 2 == 0:
+                quotes = 0
+                if header_end is None:
+                    header_end = position
+    offsets.append(position)
+    return header_end or 0, offsets
+
+
+class LazyCsv:
+    """Random access to a CSV's rows by position without loading the file.
+
+    The byte offset of every row is stored once in {csv}.rowindex.npy and
+    memory-mapped afterwards; only the window around the requested row is
+    ever parsed into a DataFrame.
+    """
+
+    def __init__(self, path, dtype=None, window=WINDOW_ROWS):
+        """Open the CSV, building its row index if it is missing or stale."""
+        self.path = path
+        self.dtype = dtype
+        self.window = window
+        self.index_path = f"{path}.rowindex.npy"
+        self._windows = OrderedDict()
+
+        self._index = self._load_index()
+        self.header_end = int(self._index[2])
+        self.offsets = self._index[INDEX_META:]
+        with open(path, 'rb') as f:
+            self._header = f.read(self.header_end)
+        self.columns = list(pd.read_csv(BytesIO(self._header), nrows=0).columns)
+
+    def _load_index(self):
+        """Memory-map the row index, rebuilding it when the CSV changed since"""
+        stat = os.stat(self.path)
+        if os.path.exists(self.index_path):
+            index = np.load(self.index_path, mmap_mode='r')
+            if len(index) > INDEX_META and index[0] == stat.st_size and index[1] == stat.st_mtime_ns:
+                return index
+
+        print(f"Indexing rows of {self.path}...")
+        header_end, offsets = scan_row_offsets(self.path)
+        index = np.array([stat.st_size, stat.st_mtime_ns, header_end] + offsets, dtype=np.uint64)
+        tmp_path = f"{self.index_path}.tmp.npy"
+        np.save(tmp_path, index)
+        os.replace(tmp_path, self.index_path)
+        return np.load(self.index_path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def rows(self, start, stop):
+        """Parse rows [start, stop) into a DataFrame indexed by row position"""
+        start, stop = max(0, start), min(stop, len(self))
+        if start >= stop:
+            return pd.DataFrame(columns=self.columns)
+
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.offsets[start]))
+            data = f.read(int(self.offsets[stop]) - int(self.offsets[start]))
+        df = pd.read_csv(BytesIO(self._header + data), dtype=self.dtype)
+        df.index = pd.RangeIndex(start, start + len(df))
+        return df
+
+    def row(self, position):
+        """Return one row as a Series, decoding its whole window on a miss"""
+        window_start = position - position % self.window
+        if window_start in self._windows:
+            self._windows.move_to_end(window_start)
+        else:
+            self._windows[window_start] = self.rows(window_start, window_start + self.window)
+            while len(self._windows) > CACHED_WINDOWS:
+                self._windows.popitem(last=False)
+        return self._windows[window_start].loc[position]
+
+    def take(self, positions):
+        """Return the given rows as a DataFrame indexed by row position"""
+        positions = sorted(set(positions))
+        if not positions:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat([self.rows(position, position + 1) for position in positions])
+
+    def iter_chunks(self, usecols=None, chunksize=None):
+        """Stream the file in chunks; chunk indexes are row positions"""
+        return pd.read_csv(self.path, usecols=usecols, dtype=self.dtype, chunksize=chunksize or settings.import_chunk_rows)
+
+    def read_columns(self, columns):
+        """Load only the given columns for every row (the cheap, narrow ones)"""
+        columns = [column for column in columns if column in self.columns]
+        chunks = list(self.iter_chunks(usecols=columns))
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(chunks, ignore_index=True)[columns]
@@ -1,18 +1,30 @@
 from twikit import Client, TooManyRequests
 from datetime import datetime
+import sys
 import asyncio
 import aiohttp
 import re
+import argparse
+import contextlib
 from configparser import ConfigParser
-from config import QUERY, MINIMUM_TWEETS
-from text_utils import extract_links, print_tweet_structure
+from config import settings, settings_file, parse_args
+from text_utils import print_tweet_structure
 from tweet_api import get_tweets
-from media_utils import download_media_to_memory, download_profile_to_memory
+from tweet_pipeline import build_tweet_record, process_tweet_record
+from work_queue import open_work_queue
+from cpu_pool import CpuPool
 from gcp_utils import GCPStorage
+from domain_reputation import DomainReputationIndex
+from graceful_shutdown import GracefulShutdown, load_checkpoint, save_checkpoint, clear_checkpoint
+from page_archive import PageArchive
+from user_table import UserTable
+from near_duplicates import NearDuplicateIndex
+from streaming import stream as run_stream
+from tweet_sequence import TweetSequence
 
 
 def extract_query_hashtag(query_string):
-    """Extract the main hashtag from the query string in config.py."""
+    """Extract the main hashtag from a search query."""
     import re
     # Look for hashtag pattern in the query
     hashtag_match = re.search(r'#(\w+)', query_string)
@@ -21,187 +33,282 @@ def extract_query_hashtag(query_string):
     return ""
 
 
-# Define a main async function to wrap the core logic
-async def main():
-    # Login credentials
-    config = ConfigParser()
-    config.read('config.ini')
-    username = config['X']['username']
-    email = config['X']['email']
-    password = config['X']['password']
-
-    print(f'{datetime.now()} - Account details : {username} {email} {password}')
-    
-    # Extract the main hashtag from the QUERY in config.py
-    main_hashtag = extract_query_hashtag(QUERY)
-    print(f'{datetime.now()} - Using main hashtag from config: #{main_hashtag}')
-
-    # Initialize GCP storage
-    print(f'{datetime.now()} - Initializing GCP Storage...')
+def flush_users(users):
+    """Write the users first seen since the last flush; a failure only delays them to the next one"""
     try:
-        gcp = GCPStorage()
-        print(f'{datetime.now()} - GCP Storage initialized successfully')
+        users.flush()
+        return True
     except Exception as e:
-        print(f'{datetime.now()} - Error initializing GCP Storage: {e}')
-        print(f'{datetime.now()} - Cannot continue without cloud storage')
-        return
+        print(f'{datetime.now()} - Error upserting users: {e}')
+        return False
 
-    # Get latest tweet count from Firestore
-    tweet_count = 0
-    try:
-        # Query Firestore for the highest Tweet_count value
-        tweets_ref = gcp.db.collection('tweets')
-        query = tweets_ref.order_by('Tweet_count', direction='DESCENDING').limit(1)
-        results = query.stream()
-        
-        for doc in results:
-            tweet_data = doc.to_dict()
-            if 'Tweet_count' in tweet_data:
-                tweet_count = int(tweet_data['Tweet_count'])
-                print(f'{datetime.now()} - Found existing data in Firestore. Will continue from Tweet_count: {tweet_count}')
-                break
-    except Exception as e:
-        print(f'{datetime.now()} - Error reading from Firestore: {e}. Starting from 0.')
 
-    # Authenticate to X.com
-    client = Client(language='en-US')
+class Collector:
+    """Shared state of a collection run, and the per-tweet work for every query"""
 
-    # Use await for async methods
-    print(f'{datetime.now()} - Logging in...')
-    await client.login(auth_info_1=username, auth_info_2=email, password=password)
-    print(f'{datetime.now()} - Logged in successfully')
+    def __init__(self, gcp, session, cpu, queue, reputation, users, clusters, shutdown, sequence=None, replay=False):
+        self.gcp = gcp
+        self.session = session
+        self.cpu = cpu
+        self.queue = queue
+        self.reputation = reputation
+        self.users = users
+        self.clusters = clusters
+        self.shutdown = shutdown
+        # Tweet_count numbers, None when replaying; tweet_count counts this run's tweets
+        self.sequence = sequence
+        self.tweet_count = 0
+        self.replay = replay
 
-    # Create a session for downloading images
-    async with aiohttp.ClientSession() as session:
+    async def process_tweet(self, tweet, query):
+        """Number, record and save (or queue) one tweet found by query; False if a shutdown cut it short"""
+        self.tweet_count += 1
+        # The main hashtag of the query is stored with its tweets
+        main_hashtag = extract_query_hashtag(query)
+
+        # Debug tweet structure for first tweet
+        if self.tweet_count == 1:
+            print("\n----- Tweet Structure -----")
+            print_tweet_structure(tweet)
+            print("--------------------------\n")
+
+        # Leasing a new block is a Firestore transaction, kept off the event loop
+        number = None if self.replay else await asyncio.to_thread(self.sequence.next)
+        record = build_tweet_record(tweet, number, main_hashtag)
+        self.users.observe(record['User'])
+        record['Cluster_ID'] = self.clusters.add(record['Tweet_ID'], record['Text'])
+
+        if self.queue is not None:
+            # Fetch-only mode: media workers download, upload and save. The queue
+            # write is a blocking SQLite or Firestore call, kept off the event loop
+            await asyncio.to_thread(self.queue.enqueue, record['Tweet_ID'], record)
+            print(f"{datetime.now()} - Queued tweet {record['Tweet_ID']}")
+            return True
+        try:
+            # Tracked so a shutdown drains it instead of dropping it half-uploaded
+            await self.shutdown.track(process_tweet_record(self.session, self.gcp, self.cpu, self.reputation, record),
+                                      name=f"tweet {record['Tweet_ID']}")
+        except asyncio.CancelledError:
+            print(f"{datetime.now()} - Tweet {record['Tweet_ID']} did not finish before the drain deadline")
+            return False
+        except Exception as e:
+            print(f"{datetime.now()} - Error saving tweet to Firestore: {e}")
+        return True
+
+    def flush(self):
+        """Write the users seen and the near-duplicate index; False if some users are still unwritten"""
+        synced = flush_users(self.users)
+        # Pages only upsert to Firestore; the local table is rewritten here, at the end of a run
+        # or of a stream's save interval
+        self.users.save()
+        self.clusters.save()
+        return synced
+
+    async def collect_query(self, query, client=None, page_cursor=None, done_ids=None):
+        """Page through one query until minimum_tweets new tweets are in.
+
+        Returns the cursor and tweet IDs done on the current page, which is
+        where a stopped run resumes.
+        """
+        shutdown = self.shutdown
+        print(f'{datetime.now()} - Collecting "{query}", main hashtag #{extract_query_hashtag(query)}')
+
+        # Every page fetched from X is kept raw, so later changes can be replayed offline
+        archive = PageArchive(query)
+        if self.replay:
+            archived_pages = archive.pages()
+            print(f'{datetime.now()} - Replaying archived pages from {archive.path}')
+
+        done_ids = set(done_ids or [])
+        start_count = self.tweet_count
+        target_count = float('inf') if self.replay else self.tweet_count + settings.minimum_tweets
         tweets = None
-        target_count = tweet_count + MINIMUM_TWEETS
-        
-        while tweet_count < target_count:
+
+        while self.tweet_count < target_count and not shutdown.stopping:
+            if tweets is not None:
+                page_cursor = tweets.next_cursor
+                done_ids = set()
             try:
-                tweets = await get_tweets(client, tweets)
+                if self.replay:
+                    finished, tweets = True, next(archived_pages, None)
+                else:
+                    finished, tweets = await shutdown.interruptible(get_tweets(client, query, tweets, page_cursor))
+                    if finished and tweets:
+                        archive.record(page_cursor, tweets)
             except TooManyRequests as e:
                 rate_limit_reset = datetime.fromtimestamp(e.rate_limit_reset)
                 print(f'{datetime.now()} - Rate limit reached. Waiting until {rate_limit_reset}')
                 wait_time = rate_limit_reset - datetime.now()
-                await asyncio.sleep(wait_time.total_seconds())
+                await shutdown.sleep(wait_time.total_seconds())
                 continue
             except Exception as e:
                 print(f'{datetime.now()} - An error occurred: {e}')
                 break
 
+            if not finished:
+                break
+
             if not tweets:
                 print(f'{datetime.now()} - No more tweets found')
                 break
 
             for tweet in tweets:
-                tweet_count += 1
-                tweet_text = tweet.text.replace('\n', ' ') if tweet.text else ''
-                user_name = tweet.user.name if tweet.user else 'N/A'
-                created_at = tweet.created_at if tweet.created_at else 'N/A'
-                retweet_count = tweet.retweet_count if tweet.retweet_count is not None else 0
-                favorite_count = tweet.favorite_count if tweet.favorite_count is not None else 0
-                tweet_id = tweet.id if hasattr(tweet, 'id') else f"unknown_{tweet_count}"
-
-                # Debug tweet structure for first tweet
-                if tweet_count == 1:
-                    print("\n----- Tweet Structure -----")
-                    print_tweet_structure(tweet)
-                    print("--------------------------\n")
-                
-                # Debug tweet structure
-                print(f"\n{datetime.now()} - Processing tweet ID: {tweet_id}")
-                
-                # Extract t.co links from tweet text
-                t_co_links = extract_links(tweet_text)
-                t_co_links_str = '|'.join(t_co_links) if t_co_links else ''
-                print(f"Found t.co links: {t_co_links_str}")
-                
-                # Use the main hashtag from config.py
-                hashtags_str = main_hashtag
-                print(f"Using hashtag from config: #{hashtags_str}")
-
-                # Download and directly upload profile picture to GCP
-                profile_pic_path = ""
-                if hasattr(tweet.user, 'profile_image_url'): 
-                    profile_pic_url = tweet.user.profile_image_url
-                    # Get original size by removing _normal
-                    profile_pic_url = profile_pic_url.replace('_normal', '') if profile_pic_url else None
-                    print(f"Found profile image URL: {profile_pic_url}")
-                    
-                    if profile_pic_url:
-                        try:
-                            # Download to memory then upload directly to GCP
-                            profile_data = await download_profile_to_memory(session, profile_pic_url)
-                            if profile_data:
-                                # Upload directly to GCP from memory
-                                profile_pic_path = gcp.upload_profile_pic_from_memory(profile_data, tweet_id, user_name)
-                                print(f"{datetime.now()} - Uploaded profile picture to GCP")
-                        except Exception as e:
-                            print(f"{datetime.now()} - Error handling profile picture: {e}")
-
-                # Download and directly upload media content to GCP
-                media_paths = []
-                media_paths_str = ""
-                
-                if hasattr(tweet, 'media') and tweet.media:
-                    for i, media_item in enumerate(tweet.media):
-                        try:
-                            # Get media URL 
-                            media_url = None
-                            if hasattr(media_item, 'media_url'):
-                                media_url = media_item.media_url
-                                print(f"Found media URL: {media_url}")
-                            
-                            if not media_url:
-                                continue
-                                
-                            # Download to memory then upload directly to GCP
-                            media_data = await download_media_to_memory(session, media_url)
-                            if media_data:
-                                # Upload directly to GCP from memory
-                                cloud_path = gcp.upload_media_file_from_memory(media_data, tweet_id, i)
-                                media_paths.append(cloud_path)
-                                print(f"{datetime.now()} - Uploaded media {i} to GCP")
-                        except Exception as e:
-                            print(f"{datetime.now()} - Error handling media {i}: {e}")
-                
-                if media_paths:
-                    media_paths_str = '|'.join(media_paths)
-                
-                # Store tweet in Firestore
-                tweet_json = {
-                    'Tweet_count': tweet_count,
-                    'Username': user_name,
-                    'Text': tweet_text,
-                    'Created_At': str(created_at),
-                    'Retweets': retweet_count,
-                    'Likes': favorite_count,
-                    'Tweet_ID': tweet_id,
-                    'Profile_Pic': profile_pic_path,
-                    'Media_Files': media_paths_str,
-                    'T_co_Links': t_co_links_str,
-                    'Hashtags': hashtags_str,
-                    'is_disinfo': ''
-                }
-                
-                # Save directly to Firestore
-                try:
-                    gcp.save_tweet_json(tweet_json, str(tweet_id))
-                    print(f"{datetime.now()} - Saved tweet {tweet_id} to Firestore")
-                except Exception as e:
-                    print(f"{datetime.now()} - Error saving tweet to Firestore: {e}")
-
-                if tweet_count >= target_count:
+                if shutdown.stopping:
                     break
+                if str(tweet.id) in done_ids:
+                    continue
+                if not await self.process_tweet(tweet, query):
+                    break
+                done_ids.add(str(tweet.id))
 
-            print(f'{datetime.now()} - Got {tweet_count} tweets so far')
-            if tweet_count >= target_count:
-                break
+                if self.tweet_count >= target_count:
+                    break
+
+            flush_users(self.users)
+            print(f'{datetime.now()} - Got {self.tweet_count} tweets so far')
 
-        new_tweets_added = tweet_count - (tweet_count - MINIMUM_TWEETS) if tweet_count >= target_count else tweet_count
-        print(f'{datetime.now()} - Done! Added {new_tweets_added} new tweets. Total tweets: {tweet_count}')
+        print(f'{datetime.now()} - Done with "{query}"! Added {self.tweet_count - start_count} new tweets. Total this run: {self.tweet_count}')
+        return page_cursor, done_ids
+
+
+# Define a main async function to wrap the core logic
+async def main(enqueue_backend=None, replay=False, stream=False):
+    """Collect tweets for every configured query; with enqueue_backend set, only fetch and queue them for media_worker.py.
+
+    With replay, pages come from the local raw-page archive instead of X:
+    no login, no rate limit, no media download, and Tweet_count,
+    is_disinfo and the media paths of the stored documents are left alone. With stream, the newest tweets of every query
+    are polled until shutdown instead, see streaming.py.
+
+    Returns False when the run could not start or lost writes.
+    """
+    # Initialize GCP storage
+    print(f'{datetime.now()} - Initializing GCP Storage...')
+    try:
+        gcp = GCPStorage()
+        print(f'{datetime.now()} - GCP Storage initialized successfully')
+    except Exception as e:
+        print(f'{datetime.now()} - Error initializing GCP Storage: {e}')
+        print(f'{datetime.now()} - Cannot continue without cloud storage')
+        return False
+
+    # Load the local low-credibility domain list once, lookups are in-memory
+    reputation = DomainReputationIndex.from_file()
+
+    # Account fields ride along with every page; each user is upserted once per run
+    users = UserTable(gcp)
+
+    # Copy-paste variants get the Cluster_ID of the first tweet like them
+    clusters = NearDuplicateIndex()
+    print(f'{datetime.now()} - Near-duplicate index holds {len(clusters)} tweets')
+
+    # Tweet_count numbers come in blocks leased from a shared Firestore counter,
+    # so concurrent collectors never hand out the same one; replayed tweets keep theirs
+    sequence = None if replay else TweetSequence(gcp)
+
+    client = None
+    if not replay:
+        # Login credentials
+        config = ConfigParser(interpolation=None)
+        config.read(settings_file())
+        username = config['X']['username']
+        email = config['X']['email']
+        password = config['X']['password']
+
+        print(f'{datetime.now()} - Account details : {username} {email} {password}')
+
+        # Authenticate to X.com
+        client = Client(language='en-US')
+
+        # Use await for async methods
+        print(f'{datetime.now()} - Logging in...')
+        await client.login(auth_info_1=username, auth_info_2=email, password=password)
+        print(f'{datetime.now()} - Logged in successfully')
+
+    # Decoding and hashing run in worker processes, off the event loop; a
+    # replay only re-merges document fields, so it needs none
+    queue = None
+    cpu = None
+    if enqueue_backend:
+        queue = open_work_queue(enqueue_backend, gcp)
+        print(f'{datetime.now()} - Fetch-only mode, queueing tweets in {enqueue_backend}')
+    elif not replay:
+        cpu = CpuPool()
+
+    # Ctrl-C/SIGTERM stop pagination and let the current tweet finish
+    shutdown = GracefulShutdown().install()
+
+    # Resume the search where an interrupted run stopped, skipping the queries it finished;
+    # streaming resumes from its own watermarks instead
+    queries = list(settings.queries)
+    checkpoint = None if replay or stream else load_checkpoint()
+    resume = {}
+    if checkpoint and checkpoint.get('query') in queries:
+        queries = queries[queries.index(checkpoint['query']):]
+        resume = {'page_cursor': checkpoint.get('cursor'), 'done_ids': checkpoint.get('done_ids', [])}
+        print(f'{datetime.now()} - Resuming interrupted run of "{checkpoint["query"]}" at cursor {resume["page_cursor"]}')
+
+    # Where a stopped run resumes; query stays None when there is nothing to run
+    query = page_cursor = None
+    done_ids = set()
+
+    # Create a session for downloading images
+    timeout = aiohttp.ClientTimeout(total=settings.download_timeout_seconds)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        collector = Collector(gcp, session, cpu, queue, reputation, users, clusters, shutdown, sequence, replay)
+        if stream:
+            await run_stream(collector, client, queries, shutdown)
+        else:
+            for query in queries:
+                page_cursor, done_ids = await collector.collect_query(query, client, **resume)
+                resume = {}
+                if shutdown.stopping:
+                    break
+        synced = collector.flush()
+
+    if replay or stream or query is None:
+        pass
+    elif shutdown.stopping:
+        save_checkpoint({'query': query, 'cursor': page_cursor, 'done_ids': sorted(done_ids)})
+        print(f'{datetime.now()} - Stopped early, checkpoint saved for "{query}" at cursor {page_cursor}')
+    else:
+        clear_checkpoint()
+
+    if sequence is not None:
+        print(f'{datetime.now()} - Tweet_count sequence: {sequence.stats()}')
+    if queue is not None:
+        print(f'{datetime.now()} - Work queue: {queue.stats()}')
+        queue.close()
+    elif cpu is not None:
+        print(f'{datetime.now()} - CPU pool: {cpu.metrics()}')
+        cpu.shutdown()
+
+    if not synced:
+        print(f'{datetime.now()} - {len(users.dirty)} users could not be written to Firestore')
+    return synced
 
 
 # Run the main async function
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Collect tweets into Firestore and GCS')
+    parser.add_argument('--enqueue', choices=['sqlite', 'firestore'],
+                        help='Only fetch pages and queue tweets for media_worker.py')
+    parser.add_argument('--replay', action='store_true',
+                        help='Reprocess the archived raw pages of the queries instead of searching X')
+    parser.add_argument('--stream', action='store_true',
+                        help='Keep polling the newest tweets of every query until stopped, see streaming.py')
+    parser.add_argument('--profile', action='store_true',
+                        help='Sample stacks and time event loop callbacks, report and flamegraph in the profile_dir setting')
+    args = parse_args(parser)
+    if args.stream and args.replay:
+        parser.error('--stream polls X, it cannot be combined with --replay')
+
+    if args.profile:
+        from profiling import RunProfiler
+        profiler = RunProfiler()
+    else:
+        profiler = contextlib.nullcontext()
+    with profiler:
+        succeeded = asyncio.run(main(args.enqueue, args.replay, args.stream))
+    if not succeeded:
+        sys.exit(1)
\ No newline at end of file
@@ -1,35 +1,55 @@
 import os
+import hashlib
 import aiohttp
 from datetime import datetime
 import re
 
 async def download_profile_to_memory(session, profile_url):
-    """Download profile picture to memory instead of local file system"""
+    """Download profile picture to memory, returning (bytes, Content-Type header)"""
     if not profile_url:
-        return None
+        return None, None
         
     try:
         async with session.get(profile_url) as response:
             if response.status == 200:
-                return await response.read()
+                return await response.read(), response.headers.get('Content-Type')
     except Exception as e:
         print(f"Error downloading profile picture: {e}")
         
-    return None
+    return None, None
 
 async def download_media_to_memory(session, media_url):
-    """Download media file to memory instead of local file system"""
+    """Download media file to memory, returning (bytes, Content-Type header)"""
     if not media_url:
-        return None
+        return None, None
         
     try:
         async with session.get(media_url) as response:
             if response.status == 200:
-                return await response.read()
+                return await response.read(), response.headers.get('Content-Type')
     except Exception as e:
         print(f"Error downloading media: {e}")
         
-    return None
+    return None, None
+
+def image_fingerprint(content_bytes):
+    """Return sha256 and an 8x8 average hash of an image (CPU-bound, runs in the CPU pool)"""
+    from io import BytesIO
+    from PIL import Image
+
+    sha256 = hashlib.sha256(content_bytes).hexdigest()
+    try:
+        with Image.open(BytesIO(content_bytes)) as image:
+            # Decode at reduced scale where the format allows it
+            image.draft('L', (64, 64))
+            small = image.convert('L').resize((8, 8))
+            pixels = list(small.tobytes())
+    except Exception:
+        return {'sha256': sha256, 'ahash': ''}
+
+    average = sum(pixels) / len(pixels)
+    bits = ''.join('1' if pixel >= average else '0' for pixel in pixels)
+    return {'sha256': sha256, 'ahash': f"{int(bits, 2):016x}"}
 
 def ensure_dir_exists(directory):
     """Create directory if it doesn't exist."""
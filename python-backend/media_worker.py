@@ -0,0 +1,89 @@
+import asyncio
+import argparse
+import aiohttp
+from datetime import datetime
+from config import settings, parse_args
+from cpu_pool import CpuPool
+from gcp_utils import GCPStorage
+from domain_reputation import DomainReputationIndex
+from tweet_pipeline import process_tweet_record
+from work_queue import open_work_queue
+from graceful_shutdown import GracefulShutdown
+
+# How long to sleep when the queue is empty before polling again
+IDLE_POLL_SECONDS = 5
+
+
+async def process_job(queue, session, gcp, cpu, reputation, job):
+    """Process one leased tweet record and ack it, or hand it back for a retry"""
+    try:
+        await process_tweet_record(session, gcp, cpu, reputation, job.payload)
+    except asyncio.CancelledError:
+        # Cut off by the shutdown deadline: let another worker pick it up now
+        await asyncio.to_thread(queue.release, job)
+        raise
+    except Exception as e:
+        print(f"{datetime.now()} - Job {job.job_id} failed (attempt {job.attempts}): {e}")
+        await asyncio.to_thread(queue.fail, job, e)
+        return False
+    await asyncio.to_thread(queue.ack, job)
+    return True
+
+
+async def run_worker(backend=None, concurrency=None, exit_when_empty=False):
+    """Lease tweet records from the work queue and process up to concurrency of them at once"""
+    concurrency = concurrency or settings.media_worker_concurrency
+    gcp = GCPStorage()
+    queue = open_work_queue(backend, gcp)
+    reputation = DomainReputationIndex.from_file()
+    cpu = CpuPool()
+    processed = failed = 0
+    running = set()
+    shutdown = GracefulShutdown().install()
+
+    try:
+        timeout = aiohttp.ClientTimeout(total=settings.download_timeout_seconds)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                # Keep exactly concurrency records in flight, and lease nothing new once stopping
+                free = concurrency - len(running)
+                if free > 0 and not shutdown.stopping:
+                    for job in await asyncio.to_thread(queue.lease, free):
+                        running.add(shutdown.track(process_job(queue, session, gcp, cpu, reputation, job),
+                                                   name=f"job {job.job_id}"))
+
+                if not running:
+                    if exit_when_empty or shutdown.stopping:
+                        break
+                    await shutdown.sleep(IDLE_POLL_SECONDS)
+                    continue
+
+                done, running = await asyncio.wait(running, timeout=IDLE_POLL_SECONDS,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.result():
+                        processed += 1
+                    else:
+                        failed += 1
+                if done:
+                    print(f'{datetime.now()} - Worker: {processed} processed, {failed} failed, {len(running)} in flight')
+    finally:
+        print(f'{datetime.now()} - CPU pool: {cpu.metrics()}')
+        cpu.shutdown()
+        queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download and upload media for queued tweets')
+    parser.add_argument('--backend', choices=['sqlite', 'firestore'], help='Defaults to the queue_backend setting')
+    parser.add_argument('--concurrency', type=int, help='Defaults to the media_worker_concurrency setting')
+    parser.add_argument('--exit-when-empty', action='store_true', help='Stop once the queue is drained')
+    args = parse_args(parser)
+
+    asyncio.run(run_worker(args.backend, args.concurrency, args.exit_when_empty))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+try:
+    import magic
+except ImportError:
+    # libmagic is optional, signatures cover everything X serves
+    magic = None
+
+# Only this many leading bytes are ever inspected, whatever the file size
+LIBMAGIC_PREFIX_BYTES = 2048
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+}
+
+
+def sniff_signature(content_bytes):
+    """Match the first bytes against known media signatures, or return None"""
+    head = content_bytes[:16]
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        return 'video/quicktime' if head[8:12] == b'qt  ' else 'video/mp4'
+    return None
+
+
+def normalize_header_type(header_type):
+    """Strip parameters from a Content-Type header value"""
+    if not header_type:
+        return None
+    return header_type.split(';', 1)[0].strip().lower() or None
+
+
+def detect_content_type(content_bytes, header_type=None):
+    """Return the MIME type of a payload in constant time.
+
+    Magic numbers win, then a known Content-Type header from the download,
+    then libmagic on a bounded prefix.
+    """
+    if not content_bytes:
+        return normalize_header_type(header_type) or 'application/octet-stream'
+
+    content_type = sniff_signature(content_bytes)
+    if content_type:
+        return content_type
+
+    header_type = normalize_header_type(header_type)
+    if header_type in EXTENSIONS:
+        return header_type
+
+    if magic is not None:
+        try:
+            return magic.from_buffer(bytes(content_bytes[:LIBMAGIC_PREFIX_BYTES]), mime=True)
+        except Exception as e:
+            print(f"Error detecting content type: {e}")
+
+    return header_type or 'application/octet-stream'
+
+
+def extension_for(content_type, default='.jpg'):
+    """Return the file extension used for a MIME type"""
+    return EXTENSIONS.get(content_type, default)
@@ -0,0 +1,277 @@
+import os
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from config import settings, parse_args
+from review_queue import duplicate_keys, duplicate_key_text
+
+# Character shingles of the normalized text; 5 bytes pack exactly into one integer
+SHINGLE_SIZE = 5
+# 32 bands of 4 rows: pairs above ~0.42 estimated Jaccard usually share a band,
+# and candidates are then checked against THRESHOLD on the full signature
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.6
+# Only this many members of one LSH bucket are compared, exact copies fill buckets fast
+MAX_BUCKET_CANDIDATES = 50
+SIMILARITY_CHUNK = 100000
+
+# Fixed seed, so signatures stay comparable between runs and with the saved index
+_rng = np.random.default_rng(20250101)
+HASH_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+HASH_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+BAND_MIX = _rng.integers(1, 2**63, ROWS, dtype=np.uint64) | np.uint64(1)
+SHINGLE_WEIGHTS = np.uint64(256) ** np.arange(SHINGLE_SIZE, dtype=np.uint64)
+EMPTY = np.iinfo(np.uint32).max
+
+
+def shingles(normalized):
+    """Distinct character shingles of an already normalized text, as integers"""
+    data = normalized.encode('utf-8')
+    if not data:
+        return np.empty(0, dtype=np.uint64)
+    data = data.ljust(SHINGLE_SIZE, b' ')
+    windows = sliding_window_view(np.frombuffer(data, dtype=np.uint8), SHINGLE_SIZE)
+    return np.unique(windows.astype(np.uint64) @ SHINGLE_WEIGHTS)
+
+
+def minhash(values):
+    """MinHash signature of a shingle set, using multiply-shift hashes mod 2**64"""
+    if len(values) == 0:
+        return np.full(NUM_PERM, EMPTY, dtype=np.uint32)
+    with np.errstate(over='ignore'):
+        hashes = (HASH_A[:, None] * values[None, :] + HASH_B[:, None]) >> np.uint64(32)
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def signature(text):
+    """Signature of one raw tweet text"""
+    return minhash(shingles(duplicate_key_text(text)))
+
+
+def signatures(texts):
+    """Signatures for a Series of raw tweet texts, one row per text"""
+    normalized = duplicate_keys(texts.astype(object))
+    result = np.empty((len(normalized), NUM_PERM), dtype=np.uint32)
+    for row, text in enumerate(normalized):
+        result[row] = minhash(shingles(text))
+    return result
+
+
+def band_keys(sigs):
+    """One 64-bit key per band of each signature"""
+    bands = sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (bands * BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+def similarity(sigs, left, right):
+    """Estimated Jaccard similarity of signature pairs (left[i], right[i])"""
+    result = np.empty(len(left))
+    for start in range(0, len(left), SIMILARITY_CHUNK):
+        stop = start + SIMILARITY_CHUNK
+        result[start:stop] = (sigs[left[start:stop]] == sigs[right[start:stop]]).mean(axis=1)
+    return result
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index assigning each tweet to a near-duplicate cluster as it arrives.
+
+    A new tweet joins the cluster of its most similar indexed tweet when the
+    estimated Jaccard similarity reaches THRESHOLD, otherwise it starts a
+    cluster named after its own Tweet_ID. Existing clusters are never merged
+    here, so IDs already written to Firestore stay valid; cluster_corpus()
+    does the full transitive re-clustering.
+
+    Saved signatures are looked up through per-band sorted key arrays, tweets
+    added during this run through per-band dicts, until the next save().
+    """
+
+    def __init__(self, path=None):
+        path = path or settings.near_dup_index_file
+        self.path = path
+        ids, clusters, sigs = [], [], np.empty((0, NUM_PERM), dtype=np.uint32)
+        if path and os.path.exists(path):
+            with np.load(path) as saved:
+                ids, clusters, sigs = list(saved['ids']), list(saved['clusters']), saved['signatures']
+        self._load(ids, clusters, sigs)
+
+    def _load(self, ids, clusters, sigs):
+        self.ids = [str(tweet_id) for tweet_id in ids]
+        self.clusters = [str(cluster) for cluster in clusters]
+        self.positions = {tweet_id: position for position, tweet_id in enumerate(self.ids)}
+        self._sigs = np.array(sigs, dtype=np.uint32).reshape(-1, NUM_PERM)
+        self._size = len(self.ids)
+
+        keys = band_keys(self._sigs[:self._size])
+        # Tweets without text are never anyone's near-duplicate
+        searchable = np.flatnonzero(self._sigs[:self._size, 0] != EMPTY)
+        self._order = [searchable[np.argsort(keys[searchable, band], kind='stable')] for band in range(BANDS)]
+        self._sorted = [keys[order, band] for band, order in enumerate(self._order)]
+        self._recent = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return self._size
+
+    def _append(self, sig):
+        if self._size == len(self._sigs):
+            grown = np.empty((max(1024, 2 * len(self._sigs)), NUM_PERM), dtype=np.uint32)
+            grown[:self._size] = self._sigs[:self._size]
+            self._sigs = grown
+        self._sigs[self._size] = sig
+        self._size += 1
+        return self._size - 1
+
+    def candidates(self, sig):
+        """Positions sharing at least one LSH band with a signature"""
+        found = set()
+        for band, key in enumerate(band_keys(sig[None, :])[0]):
+            lo = np.searchsorted(self._sorted[band], key, side='left')
+            hi = np.searchsorted(self._sorted[band], key, side='right')
+            found.update(self._order[band][lo:min(hi, lo + MAX_BUCKET_CANDIDATES)].tolist())
+            found.update(self._recent[band].get(int(key), ())[:MAX_BUCKET_CANDIDATES])
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+    def match(self, sig):
+        """(position, similarity) of the most similar indexed tweet, or (None, 0.0)"""
+        if sig[0] == EMPTY:
+            return None, 0.0
+        positions = self.candidates(sig)
+        if not len(positions):
+            return None, 0.0
+        scores = (self._sigs[positions] == sig).mean(axis=1)
+        best = int(np.argmax(scores))
+        return int(positions[best]), float(scores[best])
+
+    def add(self, tweet_id, text, threshold=THRESHOLD):
+        """Index a tweet and return its Cluster_ID; re-adding a tweet returns its stored cluster"""
+        tweet_id = str(tweet_id)
+        if tweet_id in self.positions:
+            return self.clusters[self.positions[tweet_id]]
+
+        sig = signature(text)
+        position, score = self.match(sig)
+        cluster = self.clusters[position] if position is not None and score >= threshold else tweet_id
+
+        position = self._append(sig)
+        self.ids.append(tweet_id)
+        self.clusters.append(cluster)
+        self.positions[tweet_id] = position
+        if sig[0] != EMPTY:
+            for band, key in enumerate(band_keys(sig[None, :])[0]):
+                self._recent[band].setdefault(int(key), []).append(position)
+        return cluster
+
+    def replace(self, ids, clusters, sigs):
+        """Swap in a batch clustering of the whole corpus"""
+        self._load(ids, clusters, sigs)
+
+    def save(self):
+        """Write the index atomically; also folds this run's additions into the sorted arrays"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, ids=np.array(self.ids, dtype=str), clusters=np.array(self.clusters, dtype=str),
+                     signatures=self._sigs[:self._size])
+        os.replace(tmp_path, self.path)
+        self._load(self.ids, self.clusters, self._sigs[:self._size])
+
+
+def cluster_corpus(ids, texts, threshold=THRESHOLD):
+    """Cluster a whole corpus at once; returns (cluster_ids, signatures).
+
+    Within every LSH bucket each member is compared with the bucket's first
+    member, pairs at or above threshold are joined, and connected components
+    become clusters named after their first tweet in corpus order.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    ids = np.asarray(ids, dtype=str)
+    sigs = signatures(texts)
+    keys = band_keys(sigs)
+    searchable = np.flatnonzero(sigs[:, 0] != EMPTY)
+
+    left, right = [], []
+    for band in range(BANDS):
+        order = searchable[np.argsort(keys[searchable, band], kind='stable')]
+        sorted_keys = keys[order, band]
+        starts = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]] if len(order) else np.empty(0, dtype=bool)
+        heads = order[np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))]
+        pairs = heads != order
+        similar = similarity(sigs, heads[pairs], order[pairs]) >= threshold
+        left.append(heads[pairs][similar])
+        right.append(order[pairs][similar])
+
+    left, right = np.concatenate(left), np.concatenate(right)
+    graph = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)), shape=(len(ids), len(ids)))
+    _, labels = connected_components(graph, directed=False)
+    first = pd.Series(np.arange(len(ids))).groupby(labels).min()
+    return ids[first.reindex(labels).to_numpy()], sigs
+
+
+def load_corpus(csv_path=None):
+    """Tweet_ID, Text and any stored Cluster_ID, in collection order"""
+    if csv_path:
+        from lazy_csv import LazyCsv
+        corpus = LazyCsv(csv_path, dtype={'Tweet_ID': str, 'Cluster_ID': str}).read_columns(['Tweet_ID', 'Text', 'Cluster_ID', 'Tweet_count'])
+    else:
+        from tweet_store import TweetStore
+        corpus = TweetStore().query(columns=['Tweet_ID', 'Text', 'Cluster_ID', 'Tweet_count'])
+    if 'Tweet_count' in corpus:
+        corpus = corpus.sort_values('Tweet_count', kind='stable', na_position='last')
+    corpus = corpus.dropna(subset=['Tweet_ID']).drop_duplicates('Tweet_ID', keep='last')
+    return corpus.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Near-duplicate tweet clusters with MinHash/LSH')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('cluster', help='Re-cluster the whole corpus and rebuild the index')
+    batch.add_argument('--csv', help='Tweets CSV export; defaults to the local tweet store')
+    batch.add_argument('--threshold', type=float, default=THRESHOLD)
+    batch.add_argument('--to-firestore', action='store_true', help='Write changed Cluster_IDs to the tweet documents')
+    batch.add_argument('--to-store', action='store_true', help='Write changed Cluster_IDs to the local tweet store')
+
+    subparsers.add_parser('stats', help='Size of the saved index')
+    args = parse_args(parser)
+
+    index = NearDuplicateIndex()
+    if args.command == 'stats':
+        clusters = pd.Series(index.clusters, dtype=object)
+        sizes = clusters.value_counts()
+        print(f"{len(index)} tweets in {sizes.size} clusters, {int((sizes > 1).sum())} with near-duplicates")
+        return
+
+    start = datetime.now()
+    corpus = load_corpus(args.csv)
+    clusters, sigs = cluster_corpus(corpus['Tweet_ID'], corpus['Text'], args.threshold)
+    index.replace(corpus['Tweet_ID'], clusters, sigs)
+    index.save()
+
+    sizes = pd.Series(clusters).value_counts()
+    print(f"{datetime.now()} - Clustered {len(corpus)} tweets into {sizes.size} clusters "
+          f"({int((sizes > 1).sum())} with near-duplicates) in {datetime.now() - start}")
+
+    stored = corpus['Cluster_ID'] if 'Cluster_ID' in corpus else pd.Series(None, index=corpus.index)
+    changed = stored.fillna('').astype(str).to_numpy() != clusters
+    updates = dict(zip(corpus.loc[changed, 'Tweet_ID'].astype(str), clusters[changed]))
+    print(f"{len(updates)} tweets changed cluster")
+
+    if args.to_firestore and updates:
+        from gcp_utils import GCPStorage
+        GCPStorage().update_tweets_batch({tweet_id: {'Cluster_ID': cluster} for tweet_id, cluster in updates.items()})
+    if args.to_store and updates:
+        from tweet_store import TweetStore
+        store = TweetStore()
+        rows = store.get(list(updates))
+        rows['Cluster_ID'] = rows['Tweet_ID'].map(updates)
+        store.append(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from config import settings, parse_args
+
+
+def archive_path(query, directory=None):
+    """Return the archive file for a search query"""
+    directory = directory or settings.page_archive_dir
+    slug = re.sub(r'[^a-z0-9]+', '_', query.lower()).strip('_')[:40]
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(directory, f"{slug}-{digest}.jsonl.gz")
+
+
+def raw_tweet_id(data):
+    """Tweet ID of a raw GraphQL tweet result, None if it has none"""
+    if 'rest_id' not in data and 'tweet' in data:
+        # TweetWithVisibilityResults wraps the tweet one level down
+        data = data['tweet']
+    return data.get('rest_id')
+
+
+def page_key(page):
+    """The set of tweet IDs on an archived page; pages without IDs fall back to their raw content"""
+    ids = [raw_tweet_id(data) for data in page['tweets']]
+    if None in ids:
+        return json.dumps(page['tweets'], sort_keys=True)
+    return frozenset(ids)
+
+
+class ArchivedPage(list):
+    """A replayed page of tweets, with the cursors it was fetched with."""
+
+    def __init__(self, tweets, cursor=None, next_cursor=None):
+        super().__init__(tweets)
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+
+class PageArchive:
+    """Raw twikit search pages stored as gzipped JSONL, one line per page.
+
+    Every page is appended as its own gzip member, so a crash loses at most
+    the page being written and the file never needs rewriting.
+    """
+
+    def __init__(self, query, directory=None):
+        self.query = query
+        self.path = archive_path(query, directory)
+
+    def record(self, cursor, tweets):
+        """Append one fetched page, keyed by the cursor that fetched it"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        page = {
+            'query': self.query,
+            'cursor': cursor,
+            'next_cursor': getattr(tweets, 'next_cursor', None),
+            'fetched_at': datetime.now().isoformat(),
+            # The raw GraphQL tweet results, before any field mapping
+            'tweets': [tweet._data for tweet in tweets],
+        }
+        with gzip.open(self.path, 'at', encoding='utf-8', compresslevel=6) as f:
+            f.write(json.dumps(page, separators=(',', ':')) + '\n')
+
+    def raw_pages(self):
+        """Yield archived page dicts in fetch order, skipping pages holding the same tweets as an earlier one.
+
+        Pages are told apart by content rather than cursor: the first page
+        of every run is fetched without a cursor.
+        """
+        if not os.path.exists(self.path):
+            return
+        seen = set()
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    page = json.loads(line)
+                except ValueError:
+                    # Torn last line from an interrupted write
+                    continue
+                key = page_key(page)
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield page
+
+    def pages(self):
+        """Yield archived pages rebuilt into twikit Tweet objects, ready for the pipeline"""
+        from twikit.tweet import tweet_from_data
+
+        for page in self.raw_pages():
+            tweets = [tweet_from_data(None, {'result': data}) for data in page['tweets']]
+            yield ArchivedPage([tweet for tweet in tweets if tweet is not None],
+                               page['cursor'], page['next_cursor'])
+
+    def stats(self):
+        """Number of archived pages and tweets"""
+        pages = tweets = 0
+        for page in self.raw_pages():
+            pages += 1
+            tweets += len(page['tweets'])
+        return {'path': self.path, 'pages': pages, 'tweets': tweets}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect archived raw search pages')
+    parser.add_argument('query', nargs='?', help='Search query; defaults to every configured query')
+    args = parse_args(parser)
+
+    for query in [args.query] if args.query else settings.queries:
+        print(PageArchive(query).stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import os
+import sys
+import html
+import zlib
+import heapq
+import asyncio
+import threading
+from time import perf_counter
+from collections import Counter
+from datetime import datetime
+from config import settings
+
+# Report sizes
+TOP_ENTRIES = 15
+MAX_SLOW_CALLBACKS = 200
+# Flamegraph layout
+SVG_WIDTH = 1600
+SVG_ROW_HEIGHT = 16
+SVG_MIN_WIDTH = 0.5
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def frame_label(code):
+    """Short 'file:function' label for a code object"""
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def blocking_site(frame):
+    """'project frame -> leaf frame' for a stack, i.e. which of our lines called what blocked"""
+    leaf = frame
+    project = None
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(PROJECT_DIR):
+            project = frame
+            break
+        frame = frame.f_back
+    leaf_label = f"{frame_label(leaf.f_code)}:{leaf.f_lineno}"
+    if project is None or project is leaf:
+        return leaf_label
+    return f"{frame_label(project.f_code)}:{project.f_lineno} -> {leaf_label}"
+
+
+def callback_name(handle):
+    """Group event loop callbacks by the coroutine they step, or by function"""
+    callback = handle._callback
+    task = getattr(callback, '__self__', None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return getattr(coro, '__qualname__', None) or repr(coro)
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks of all threads at a fixed interval into folded-stack counts."""
+
+    def __init__(self, monitor, interval=None):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.monitor = monitor
+        self.interval = interval or settings.profile_sample_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._labels = {}
+
+    def _folded(self, frame, root):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = frame_label(code).replace(';', ':')
+            stack.append(label)
+            frame = frame.f_back
+        stack.append(root)
+        return ';'.join(reversed(stack))
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                self.stacks[self._folded(frame, names.get(thread_id, str(thread_id)))] += 1
+                if thread_id == self.monitor.loop_thread:
+                    self.monitor.sample(frame)
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class LoopMonitor:
+    """Times every event loop callback by wrapping asyncio's Handle._run.
+
+    Callbacks that hold the loop longer than slow_seconds are kept with the
+    stack samples taken while they ran, which name the blocking call.
+    """
+
+    def __init__(self, slow_seconds=None):
+        self.slow_seconds = slow_seconds or settings.slow_callback_seconds
+        self.loop_thread = None
+        self.callbacks = {}
+        self.slow = []
+        self.blocking = Counter()
+        self._current = None
+        self._original_run = None
+
+    def install(self):
+        self.loop_thread = threading.get_ident()
+        self._original_run = original_run = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            samples = monitor._current = Counter()
+            start = perf_counter()
+            try:
+                return original_run(handle)
+            finally:
+                monitor._current = None
+                monitor.record(handle, perf_counter() - start, samples)
+
+        asyncio.events.Handle._run = _run
+        return self
+
+    def uninstall(self):
+        if self._original_run is not None:
+            asyncio.events.Handle._run = self._original_run
+            self._original_run = None
+
+    def sample(self, frame):
+        """Called from the sampler thread with the loop thread's current frame"""
+        current = self._current
+        if current is not None:
+            current[blocking_site(frame)] += 1
+
+    def record(self, handle, elapsed, samples):
+        name = callback_name(handle)
+        stat = self.callbacks.get(name)
+        if stat is None:
+            stat = self.callbacks[name] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] = max(stat[2], elapsed)
+
+        if elapsed < self.slow_seconds:
+            return
+        sampled = sum(samples.values())
+        for site, count in samples.items():
+            # Split the blocked time between the sites seen while it ran
+            self.blocking[site] += elapsed * count / sampled
+        entry = (elapsed, id(samples), name, samples.most_common(3))
+        if len(self.slow) < MAX_SLOW_CALLBACKS:
+            heapq.heappush(self.slow, entry)
+        else:
+            heapq.heappushpop(self.slow, entry)
+
+
+def render_flamegraph(stacks, title):
+    """An SVG flamegraph from folded-stack counts, with hover titles"""
+    root = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    total = max(root['count'], 1)
+    scale = SVG_WIDTH / total
+    rects = []
+    depth_max = 0
+
+    def layout(node, name, x, depth):
+        nonlocal depth_max
+        width = node['count'] * scale
+        if width < SVG_MIN_WIDTH:
+            return
+        depth_max = max(depth_max, depth)
+        rects.append((name, x, depth, width, node['count']))
+        for child_name, child in sorted(node['children'].items()):
+            layout(child, child_name, x, depth + 1)
+            x += child['count'] * scale
+
+    x = 0.0
+    for name, child in sorted(root['children'].items()):
+        layout(child, name, x, 0)
+        x += child['count'] * scale
+
+    height = (depth_max + 3) * SVG_ROW_HEIGHT
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="{SVG_ROW_HEIGHT - 4}">{html.escape(title)}</text>',
+    ]
+    for name, x, depth, width, count in rects:
+        # Root frames at the bottom, like flamegraph.pl
+        y = height - (depth + 1) * SVG_ROW_HEIGHT
+        hue = 20 + zlib.crc32(name.encode('utf-8')) % 40
+        label = html.escape(name)
+        parts.append(
+            f'<g><title>{label} ({count} samples, {100 * count / total:.1f}%)</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{width:.2f}" height="{SVG_ROW_HEIGHT - 1}" fill="hsl({hue},85%,60%)"/>'
+        )
+        if width > 40:
+            text = html.escape(name[:int(width / 7)])
+            parts.append(f'<text x="{x + 2:.2f}" y="{y + SVG_ROW_HEIGHT - 4}">{text}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+class RunProfiler:
+    """Opt-in profiling of a whole collection run.
+
+    Use as a context manager around asyncio.run(). On exit it writes, under
+    the profile_dir setting, a text report (time per coroutine on the event loop, slow
+    callbacks and the calls that blocked them, hottest functions), the folded
+    stacks of all threads and an SVG flamegraph of them. Work in the CPU
+    pool's processes is not sampled.
+    """
+
+    def __init__(self, directory=None, interval=None, slow_seconds=None):
+        self.directory = directory or settings.profile_dir
+        self.monitor = LoopMonitor(slow_seconds)
+        self.sampler = StackSampler(self.monitor, interval)
+        self.started = None
+
+    def __enter__(self):
+        self.started = perf_counter()
+        self.monitor.install()
+        self.sampler.start()
+        print(f'{datetime.now()} - Profiling: sampling every {1000 * self.sampler.interval:.0f} ms, '
+              f'slow callbacks over {1000 * self.monitor.slow_seconds:.0f} ms')
+        return self
+
+    def __exit__(self, *exc):
+        self.sampler.stop()
+        self.monitor.uninstall()
+        self.write(perf_counter() - self.started)
+        return False
+
+    def report(self, wall_seconds):
+        """The end-of-run report as text"""
+        monitor = self.monitor
+        lines = [f"Run time {wall_seconds:.1f} s, {self.sampler.samples} samples"]
+
+        loop_busy = sum(stat[1] for stat in monitor.callbacks.values())
+        lines.append(f"\nEvent loop busy {loop_busy:.1f} s ({100 * loop_busy / max(wall_seconds, 1e-9):.0f}% of the run)")
+        lines.append(f"{'total s':>9} {'steps':>8} {'max ms':>9}  coroutine / callback")
+        ranked = sorted(monitor.callbacks.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (count, total, longest) in ranked[:TOP_ENTRIES]:
+            lines.append(f"{total:9.2f} {count:8d} {1000 * longest:9.1f}  {name}")
+
+        slow = sorted(monitor.slow, reverse=True)
+        lines.append(f"\nSlow callbacks (over {1000 * monitor.slow_seconds:.0f} ms): {len(slow)}"
+                     + (f", {MAX_SLOW_CALLBACKS} slowest kept" if len(slow) >= MAX_SLOW_CALLBACKS else ''))
+        for elapsed, _, name, sites in slow[:TOP_ENTRIES]:
+            lines.append(f"{1000 * elapsed:9.1f} ms  {name}")
+            for site, count in sites:
+                lines.append(f"{'':14}{count:4d}x {site}")
+
+        lines.append("\nTop blocking calls (loop time spent in slow callbacks, by sampled site)")
+        for site, seconds in monitor.blocking.most_common(TOP_ENTRIES):
+            lines.append(f"{seconds:9.2f} s  {site}")
+
+        leaves = Counter()
+        for stack, count in self.sampler.stacks.items():
+            frames = stack.split(';')
+            if len(frames) > 1:
+                leaves[f"{frames[0]}: {frames[-1]}"] += count
+        lines.append("\nHottest functions (samples on top of the stack, per thread)")
+        for leaf, count in leaves.most_common(TOP_ENTRIES):
+            lines.append(f"{count:9d}  {leaf}")
+        return '\n'.join(lines)
+
+    def write(self, wall_seconds):
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        report = self.report(wall_seconds)
+
+        with open(f"{stem}.txt", 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+        # Folded stacks, the input format of flamegraph.pl and speedscope
+        with open(f"{stem}.folded", 'w', encoding='utf-8') as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(f"{stem}.svg", 'w', encoding='utf-8') as f:
+            f.write(render_flamegraph(self.sampler.stacks, f"Collection run {os.path.basename(stem)}"))
+
+        print(f"\n----- Profile -----\n{report}\n-------------------")
+        print(f'{datetime.now()} - Profile written to {stem}.txt, .folded and .svg')
@@ -0,0 +1,115 @@
+import os
+import re
+import pandas as pd
+from baseline_classifier import BaselineClassifier, parse_labels
+from config import settings
+
+
+# Links, mentions/hashtags and punctuation, in the order they are blanked out
+NORMALIZE_PATTERNS = [r'https?://\S+', r'[@#]\w+', r'[^\w\s]']
+_NORMALIZE_REGEXES = [re.compile(pattern) for pattern in NORMALIZE_PATTERNS]
+
+
+def duplicate_keys(texts):
+    """Normalize tweet texts so copy-pasted variants share the same key"""
+    texts = texts.fillna('').str.lower()
+    for pattern in NORMALIZE_PATTERNS:
+        texts = texts.str.replace(pattern, ' ', regex=True)
+    return texts.str.split().str.join(' ')
+
+
+def duplicate_key_text(text):
+    """duplicate_keys for a single text, without the pandas overhead"""
+    text = text.lower() if isinstance(text, str) else ''
+    for regex in _NORMALIZE_REGEXES:
+        text = regex.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def load_scorer(model_path=None):
+    """Load the saved baseline model, or None when it was never trained"""
+    model_path = model_path or settings.baseline_model_file
+    if os.path.exists(model_path):
+        return BaselineClassifier.load(model_path)
+    return None
+
+
+def score_pending(df, pending_mask, model_path=None, model=None):
+    """Get disinfo_score for unlabeled rows, from the CSV or the saved baseline model"""
+    if 'disinfo_score' in df.columns and df.loc[pending_mask, 'disinfo_score'].notna().any():
+        return df.loc[pending_mask, 'disinfo_score']
+
+    if model is None:
+        model = load_scorer(model_path)
+    if model is not None:
+        texts = df.loc[pending_mask, 'Text'].fillna('')
+        return pd.Series(model.predict_proba(texts), index=texts.index)
+
+    return pd.Series(float('nan'), index=df.index[pending_mask])
+
+
+def cluster_keys(df, pending_mask):
+    """Cluster of each pending row: Cluster_ID from ingestion, else its normalized text"""
+    clusters = pd.Series(None, index=df.index[pending_mask], dtype=object)
+    if 'Cluster_ID' in df.columns:
+        clusters = df.loc[pending_mask, 'Cluster_ID'].astype(object)
+    missing = clusters.isna() | (clusters.astype(str) == '')
+    if missing.any():
+        clusters[missing] = duplicate_keys(df.loc[missing.index[missing], 'Text'])
+    return clusters.astype(str)
+
+
+def summarize_for_queue(chunk, model=None):
+    """Reduce a chunk of tweets to the narrow columns build_review_queue needs.
+
+    Text is replaced by a hashed cluster key and a score, so the queue for a
+    large export can be built chunk by chunk without keeping any text around.
+    """
+    pending_mask = parse_labels(chunk['is_disinfo']).isna()
+    summary = chunk[['Tweet_ID', 'is_disinfo']].copy()
+    summary['Cluster_ID'] = None
+    summary['disinfo_score'] = float('nan')
+    if pending_mask.any():
+        keys = cluster_keys(chunk, pending_mask)
+        summary.loc[pending_mask, 'Cluster_ID'] = pd.util.hash_pandas_object(keys, index=False).map('{:016x}'.format)
+        summary.loc[pending_mask, 'disinfo_score'] = score_pending(chunk, pending_mask, model=model)
+    return summary
+
+
+def build_review_queue(df, scores=None):
+    """Order unlabeled tweets by model uncertainty, showing each near-duplicate cluster once.
+
+    Returns a list of (representative_index, member_indices) tuples. Labeling the
+    representative is meant to be propagated to the other members of its cluster.
+    """
+    pending_mask = parse_labels(df['is_disinfo']).isna()
+    if not pending_mask.any():
+        return []
+
+    if scores is None:
+        scores = score_pending(df, pending_mask)
+
+    pending = pd.DataFrame(index=df.index[pending_mask])
+
+    # Prefer clusters computed at ingestion, fall back to normalized-text duplicates
+    pending['cluster'] = cluster_keys(df, pending_mask)
+
+    # 1.0 at p=0.5, 0.0 when the model is certain. Unscored rows sort last.
+    pending['uncertainty'] = (1 - (2 * scores.reindex(pending.index) - 1).abs()).fillna(-1.0)
+    pending['position'] = range(len(pending))
+
+    # Representative = most uncertain member of each cluster
+    ranked = pending.sort_values(['uncertainty', 'position'], ascending=[False, True])
+    representatives = ranked.drop_duplicates('cluster')
+    sizes = pending['cluster'].value_counts()
+    members = pending.groupby('cluster', sort=False).groups
+
+    representatives = representatives.assign(size=representatives['cluster'].map(sizes))
+    representatives = representatives.sort_values(
+        ['uncertainty', 'size', 'position'], ascending=[False, False, True]
+    )
+
+    return [
+        (idx, [m for m in members[cluster] if m != idx])
+        for idx, cluster in zip(representatives.index, representatives['cluster'])
+    ]
@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import argparse
+from collections import Counter
+from datetime import datetime
+import numpy as np
+from config import settings, parse_args
+
+# Okapi BM25 parameters, the usual defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_LIMIT = 20
+
+_URL_RE = re.compile(r'https?://\S+')
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase word tokens of a tweet; links are dropped, '#f1' and '@f1' index as 'f1'"""
+    if not isinstance(text, str):
+        return []
+    return _TOKEN_RE.findall(_URL_RE.sub(' ', text.lower()))
+
+
+def encode_postings(offsets, docs):
+    """Delta-encode each term's sorted doc numbers, the first of a run stays absolute"""
+    deltas = docs.astype(np.int64)
+    deltas[1:] -= docs[:-1].astype(np.int64)
+    starts = offsets[:-1][np.diff(offsets) > 0]
+    deltas[starts] = docs[starts]
+    return deltas.astype(np.uint32)
+
+
+def decode_postings(offsets, deltas):
+    """Inverse of encode_postings"""
+    totals = np.cumsum(deltas, dtype=np.int64)
+    lengths = np.diff(offsets)
+    # Running total just before each run, subtracted so every run restarts at zero
+    before = np.where(offsets[:-1] > 0, totals[np.maximum(offsets[:-1], 1) - 1], 0)
+    return (totals - np.repeat(before, lengths)).astype(np.uint32)
+
+
+class SearchIndex:
+    """Inverted index over tweet texts with BM25 ranking.
+
+    Postings are CSR arrays: the doc numbers of term t are
+    docs[offsets[t]:offsets[t+1]], sorted, with term frequencies alongside.
+    Tweets added since the last save() sit in a small per-term delta that
+    queries read as well; save() folds it into the arrays and writes them
+    delta-encoded and compressed.
+    """
+
+    def __init__(self, path=None):
+        path = path or settings.search_index_file
+        self.path = path
+        self.terms = []
+        self.term_ids = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.empty(0, dtype=np.uint32)
+        self.tfs = np.empty(0, dtype=np.uint16)
+        self.doc_ids = []
+        self.positions = {}
+        self._lengths = []
+        self._length_array = None
+        self._delta = {}
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with np.load(self.path) as saved:
+            self.terms = saved['terms'].tolist()
+            self.offsets = saved['offsets'].astype(np.int64)
+            self.docs = decode_postings(self.offsets, saved['docs'])
+            self.tfs = saved['tfs']
+            self.doc_ids = saved['doc_ids'].tolist()
+            self._lengths = saved['lengths'].tolist()
+            self._length_array = saved['lengths'].astype(np.float64)
+        self.term_ids = {term: number for number, term in enumerate(self.terms)}
+        self.positions = {tweet_id: doc for doc, tweet_id in enumerate(self.doc_ids)}
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __contains__(self, tweet_id):
+        return str(tweet_id) in self.positions
+
+    def add(self, tweet_id, text):
+        """Index one tweet; tweets already indexed are skipped. Returns whether it was added"""
+        tweet_id = str(tweet_id)
+        if tweet_id in self.positions:
+            return False
+        doc = len(self.doc_ids)
+        tokens = tokenize(text)
+        for term, count in Counter(tokens).items():
+            docs, tfs = self._delta.setdefault(term, ([], []))
+            docs.append(doc)
+            tfs.append(min(count, np.iinfo(np.uint16).max))
+        self.doc_ids.append(tweet_id)
+        self.positions[tweet_id] = doc
+        self._lengths.append(len(tokens))
+        self._length_array = None
+        return True
+
+    def add_many(self, tweet_ids, texts):
+        """Index a batch of tweets, return how many were new"""
+        return sum(self.add(tweet_id, text) for tweet_id, text in zip(tweet_ids, texts))
+
+    def postings(self, term):
+        """(doc numbers, term frequencies) of a term, saved and unsaved"""
+        number = self.term_ids.get(term)
+        if number is None:
+            docs, tfs = np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint16)
+        else:
+            start, stop = self.offsets[number], self.offsets[number + 1]
+            docs, tfs = self.docs[start:stop], self.tfs[start:stop]
+        if term in self._delta:
+            delta_docs, delta_tfs = self._delta[term]
+            docs = np.concatenate([docs, np.asarray(delta_docs, dtype=np.uint32)])
+            tfs = np.concatenate([tfs, np.asarray(delta_tfs, dtype=np.uint16)])
+        return docs, tfs
+
+    def search(self, query, limit=DEFAULT_LIMIT, match_all=False):
+        """Best matching tweets for a keyword query as [(Tweet_ID, score)], best first.
+
+        With match_all, only tweets containing every query term are returned.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        total = len(self.doc_ids)
+        if not terms or not total:
+            return []
+        if self._length_array is None:
+            self._length_array = np.asarray(self._lengths, dtype=np.float64)
+        lengths = self._length_array
+        average_length = max(lengths.mean(), 1.0)
+
+        matched_docs, weights = [], []
+        for term in terms:
+            docs, tfs = self.postings(term)
+            if not len(docs):
+                if match_all:
+                    return []
+                continue
+            idf = np.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            tfs = tfs.astype(np.float64)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average_length)
+            matched_docs.append(docs)
+            weights.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        if not matched_docs:
+            return []
+
+        # Dense accumulation over all docs: linear in the corpus, but no sorting
+        docs = np.concatenate(matched_docs)
+        scores = np.bincount(docs, weights=np.concatenate(weights), minlength=total)
+        if match_all:
+            scores[np.bincount(docs, minlength=total) < len(terms)] = 0
+        candidates = np.flatnonzero(scores > 0)
+        scores = scores[candidates]
+
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return [(self.doc_ids[doc], float(score)) for doc, score in zip(candidates[order], scores[order])]
+
+    def _merge_delta(self):
+        """Fold the unsaved postings into the CSR arrays"""
+        if not self._delta:
+            return
+        base_terms = np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+        for term in self._delta:
+            if term not in self.term_ids:
+                self.term_ids[term] = len(self.terms)
+                self.terms.append(term)
+        delta_terms = np.concatenate([np.full(len(docs), self.term_ids[term]) for term, (docs, _) in self._delta.items()])
+        delta_docs = np.concatenate([np.asarray(docs, dtype=np.uint32) for docs, _ in self._delta.values()])
+        delta_tfs = np.concatenate([np.asarray(tfs, dtype=np.uint16) for _, tfs in self._delta.values()])
+
+        # Every unsaved doc number is above every saved one, so a stable sort
+        # by term keeps each term's doc numbers sorted
+        terms = np.concatenate([base_terms, delta_terms])
+        order = np.argsort(terms, kind='stable')
+        self.docs = np.concatenate([self.docs, delta_docs])[order]
+        self.tfs = np.concatenate([self.tfs, delta_tfs])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self.terms)))]).astype(np.int64)
+        self._delta = {}
+
+    def save(self):
+        """Merge unsaved tweets and write the index atomically"""
+        self._merge_delta()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                terms=np.array(self.terms, dtype=str),
+                offsets=self.offsets,
+                docs=encode_postings(self.offsets, self.docs),
+                tfs=self.tfs,
+                doc_ids=np.array(self.doc_ids, dtype=str),
+                lengths=np.minimum(np.asarray(self._lengths, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16),
+            )
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        """Sizes of the index"""
+        return {'path': self.path, 'tweets': len(self.doc_ids), 'terms': len(self.term_ids) + sum(term not in self.term_ids for term in self._delta),
+                'postings': int(len(self.docs) + sum(len(docs) for docs, _ in self._delta.values()))}
+
+
+def iter_corpus(csv_path=None, chunk_size=None):
+    """Yield (tweet_ids, texts) batches from a CSV export or the local tweet store"""
+    chunk_size = chunk_size or settings.import_chunk_rows
+    if csv_path:
+        from lazy_csv import LazyCsv
+        for chunk in LazyCsv(csv_path, dtype={'Tweet_ID': str}).iter_chunks(usecols=['Tweet_ID', 'Text'], chunksize=chunk_size):
+            chunk = chunk.dropna(subset=['Tweet_ID'])
+            yield chunk['Tweet_ID'].tolist(), chunk['Text'].tolist()
+    else:
+        from tweet_store import TweetStore
+        corpus = TweetStore().query(columns=['Tweet_ID', 'Text'])
+        for start in range(0, len(corpus), chunk_size):
+            chunk = corpus.iloc[start:start + chunk_size]
+            yield chunk['Tweet_ID'].tolist(), chunk['Text'].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keyword search over collected tweets')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, description in (('build', 'Rebuild the index from scratch'), ('update', 'Index tweets not indexed yet')):
+        source = subparsers.add_parser(name, help=description)
+        source.add_argument('--csv', help='Tweets CSV export; defaults to the local tweet store')
+    search = subparsers.add_parser('search', help='Rank tweets for a keyword query with BM25')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    search.add_argument('--all', action='store_true', help='Only tweets containing every term')
+    search.add_argument('--show', action='store_true', help='Print user and text from the local tweet store')
+    subparsers.add_parser('stats')
+    args = parse_args(parser)
+
+    if args.command == 'build' and os.path.exists(settings.search_index_file):
+        os.remove(settings.search_index_file)
+    index = SearchIndex()
+
+    if args.command in ('build', 'update'):
+        added = 0
+        for tweet_ids, texts in iter_corpus(args.csv):
+            added += index.add_many(tweet_ids, texts)
+        index.save()
+        print(f"{datetime.now()} - Indexed {added} new tweets, {len(index)} in total")
+    elif args.command == 'search':
+        start = time.perf_counter()
+        results = index.search(args.query, args.limit, args.all)
+        print(f"{len(results)} results in {1000 * (time.perf_counter() - start):.1f} ms")
+        texts = {}
+        if args.show and results:
+            from tweet_store import TweetStore
+            found = TweetStore().get([tweet_id for tweet_id, _ in results], columns=['Username', 'Text'])
+            texts = {row.Tweet_ID: f"{row.Username}: {row.Text}" for row in found.itertuples()}
+        for tweet_id, score in results:
+            print(f"{score:7.3f}  {tweet_id}  {texts.get(tweet_id, '')}".rstrip())
+    else:
+        print(index.stats())
+
+
+if __name__ == "__main__":
+    main()
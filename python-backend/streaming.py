@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import heapq
+import argparse
+from time import time
+from datetime import datetime, timezone
+from twikit import TooManyRequests
+from config import settings, parse_args
+from page_archive import PageArchive
+
+# Tweet IDs are snowflakes: milliseconds since this epoch, shifted left 22 bits
+SNOWFLAKE_EPOCH_MS = 1288834974657
+# Pause between the pages of one poll
+PAGE_PAUSE_SECONDS = 2
+# The near-duplicate index and users table are written at most this often
+STATE_SAVE_SECONDS = 300
+
+_TIME_BOUND_RE = re.compile(r'\s*\b(?:since|until|since_id|max_id):\S+')
+
+
+def snowflake_time(tweet_id):
+    """UTC datetime a tweet ID was issued"""
+    return datetime.fromtimestamp(((int(tweet_id) >> 22) + SNOWFLAKE_EPOCH_MS) / 1000, tz=timezone.utc)
+
+
+def streaming_query(query, since_id=None, max_id=None):
+    """The query without its fixed date bounds, limited to tweets after since_id and up to max_id"""
+    query = _TIME_BOUND_RE.sub('', query).strip()
+    if since_id:
+        query = f"{query} since_id:{since_id}"
+    if max_id:
+        query = f"{query} max_id:{max_id}"
+    return query
+
+
+class QueryWatermark:
+    """Streaming state of one query: newest tweet ingested and the arrival rate seen so far.
+
+    gap is a (since_id, max_id) range of tweets older than since_id that a
+    poll could not page back to, or None.
+    """
+
+    def __init__(self, query, since_id=None, rate=None, interval=None, gap=None):
+        self.query = query
+        self.since_id = since_id
+        self.gap = tuple(gap) if gap else None
+        # Tweets per second, smoothed over polls
+        self.rate = rate
+        self.interval = interval or settings.stream_min_poll_seconds
+        self.last_poll = None
+
+    def observe(self, new_tweets, now, behind=False):
+        """Update the arrival rate after a poll and return the seconds until the next one.
+
+        The interval aims at stream_target_tweets_per_poll new tweets per
+        poll, within the configured bounds. A poll that ran out of pages
+        before reaching the watermark polls again as soon as allowed.
+        """
+        elapsed = max(now - self.last_poll, 1.0) if self.last_poll else None
+        self.last_poll = now
+        if elapsed is not None:
+            observed = new_tweets / elapsed
+            smoothing = settings.stream_rate_smoothing
+            self.rate = observed if self.rate is None else smoothing * observed + (1 - smoothing) * self.rate
+
+        low, high = settings.stream_min_poll_seconds, settings.stream_max_poll_seconds
+        if behind:
+            self.interval = low
+        elif self.rate:
+            self.interval = min(max(settings.stream_target_tweets_per_poll / self.rate, low), high)
+        elif elapsed is not None:
+            # Nothing seen yet on this query: back off geometrically
+            self.interval = min(max(self.interval * 2, low), high)
+        return self.interval
+
+    def to_dict(self):
+        return {'since_id': self.since_id, 'gap': list(self.gap) if self.gap else None,
+                'rate': self.rate, 'interval': self.interval,
+                'newest_at': snowflake_time(self.since_id).isoformat() if self.since_id else None}
+
+
+def load_watermarks(queries, path=None):
+    """Watermarks for the queries, from the state file of a previous stream run"""
+    path = path or settings.stream_state_file
+    saved = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading stream state {path}: {e}")
+    watermarks = {}
+    for query in queries:
+        state = saved.get(query, {})
+        watermarks[query] = QueryWatermark(query, state.get('since_id'), state.get('rate'),
+                                          state.get('interval'), state.get('gap'))
+    return watermarks
+
+
+def save_watermarks(watermarks, path=None):
+    """Atomically write the watermarks, keeping those of queries no longer streamed"""
+    path = path or settings.stream_state_file
+    state = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+    state.update({query: watermark.to_dict() for query, watermark in watermarks.items()})
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+async def fetch_range(client, watermark, archive, shutdown, since_id=None, max_id=None):
+    """Latest tweets of a query with since_id < ID <= max_id, newest first.
+
+    Pages back at most stream_max_pages_per_poll pages; the first poll of a
+    query (no since_id) only takes the newest page. Returns (tweets,
+    complete), complete when the search ran out of results, i.e. every
+    tweet down to since_id was fetched.
+    """
+    query = streaming_query(watermark.query, since_id, max_id)
+    tweets = []
+    page = None
+    for _ in range(settings.stream_max_pages_per_poll):
+        if page is None:
+            finished, page = await shutdown.interruptible(client.search_tweet(query, product='Latest'))
+            cursor = f"latest:{since_id or 0}:{max_id or 0}:{int(time())}"
+        else:
+            if not await shutdown.sleep(PAGE_PAUSE_SECONDS):
+                return tweets, False
+            cursor = page.next_cursor
+            finished, page = await shutdown.interruptible(page.next())
+        if not finished:
+            return tweets, False
+        if not page:
+            return tweets, True
+        archive.record(cursor, page)
+        tweets.extend(tweet for tweet in page if since_id is None or int(tweet.id) > since_id)
+        if since_id is None:
+            return tweets, True
+    return tweets, False
+
+
+async def poll(collector, client, watermark, archive, shutdown):
+    """One poll of a query, return (tweets ingested, whether a gap is left).
+
+    A poll that hits its page limit before reaching since_id leaves a gap
+    below the oldest tweet it fetched. The gap is kept in the watermark and
+    filled, newest first, by the following polls before since_id moves on,
+    so a burst is collected in full rather than skipped.
+    """
+    ingested = 0
+    if watermark.gap:
+        gap_since, gap_max = watermark.gap
+        tweets, complete = await fetch_range(client, watermark, archive, shutdown, gap_since, gap_max)
+        for tweet in sorted(tweets, key=lambda tweet: int(tweet.id), reverse=True):
+            if shutdown.stopping or not await collector.process_tweet(tweet, watermark.query):
+                return ingested, True
+            # Newest first, so what is left of the gap is always one ID range
+            watermark.gap = (gap_since, int(tweet.id) - 1)
+            ingested += 1
+        if complete:
+            watermark.gap = None
+        return ingested, watermark.gap is not None
+
+    since_id = int(watermark.since_id) if watermark.since_id else None
+    tweets, complete = await fetch_range(client, watermark, archive, shutdown, since_id)
+    tweets.sort(key=lambda tweet: int(tweet.id))
+    if tweets and not complete and since_id is not None and not shutdown.stopping:
+        watermark.gap = (since_id, int(tweets[0].id) - 1)
+    for tweet in tweets:
+        if shutdown.stopping or not await collector.process_tweet(tweet, watermark.query):
+            break
+        # Oldest first, so the watermark never passes a tweet not ingested yet
+        watermark.since_id = str(tweet.id)
+        ingested += 1
+    return ingested, watermark.gap is not None
+
+
+async def stream(collector, client, queries, shutdown):
+    """Poll product='Latest' for every query until shutdown, ingesting only tweets past each watermark.
+
+    Queries are polled one at a time, each when its interval is up, so a
+    busy hashtag is polled every stream_min_poll_seconds and a quiet one
+    backs off to stream_max_poll_seconds.
+    """
+    watermarks = load_watermarks(queries)
+    archives = {query: PageArchive(query) for query in queries}
+    # (due time, position, query); the position keeps equal due times in config order
+    schedule = [(time(), position, query) for position, query in enumerate(queries)]
+    heapq.heapify(schedule)
+    last_save = time()
+
+    print(f'{datetime.now()} - Streaming {len(queries)} queries, polling every '
+          f'{settings.stream_min_poll_seconds:.0f}-{settings.stream_max_poll_seconds:.0f} s')
+
+    while schedule and not shutdown.stopping:
+        due, position, query = heapq.heappop(schedule)
+        if not await shutdown.sleep(due - time()):
+            break
+        watermark = watermarks[query]
+        filling = watermark.gap is not None
+
+        try:
+            ingested, gap = await poll(collector, client, watermark, archives[query], shutdown)
+        except TooManyRequests as e:
+            # The budget is shared by all queries, so every poll waits for the reset
+            reset = datetime.fromtimestamp(e.rate_limit_reset)
+            print(f'{datetime.now()} - Rate limit reached. Waiting until {reset}')
+            heapq.heappush(schedule, (time(), position, query))
+            await shutdown.sleep(e.rate_limit_reset - time())
+            continue
+        except Exception as e:
+            print(f'{datetime.now()} - Error polling "{query}": {e}')
+            heapq.heappush(schedule, (time() + watermark.interval, position, query))
+            continue
+
+        if filling:
+            # Backfill is not arrival, so it leaves the rate estimate alone
+            interval = settings.stream_min_poll_seconds
+            print(f'{datetime.now()} - "{query}": backfilled {ingested} tweets'
+                  + (f', gap left down to ID {watermark.gap[0]}' if gap else ', gap closed')
+                  + f', next poll in {interval:.0f} s')
+        else:
+            interval = watermark.observe(ingested, time(), gap)
+            lag = f", newest {(datetime.now(timezone.utc) - snowflake_time(watermark.since_id)).total_seconds():.0f} s old" if ingested else ''
+            print(f'{datetime.now()} - "{query}": {ingested} new tweets{lag}, '
+                  f'{60 * (watermark.rate or 0):.1f}/min, next poll in {interval:.0f} s'
+                  + (' (page limit hit, older tweets backfilled next)' if gap else ''))
+        heapq.heappush(schedule, (time() + interval, position, query))
+
+        save_watermarks(watermarks)
+        # The caller flushes once more on shutdown
+        if ingested and time() - last_save >= STATE_SAVE_SECONDS:
+            collector.flush()
+            last_save = time()
+
+    save_watermarks(watermarks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the streaming watermarks of the configured queries')
+    parse_args(parser)
+    for query, watermark in load_watermarks(settings.queries).items():
+        print(f"{query}\n    {streaming_query(query, watermark.since_id)}\n    {watermark.to_dict()}")
+        if watermark.gap:
+            print(f"    backfilling: {streaming_query(query, *watermark.gap)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+from dataclasses import fields
+
+import pytest
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run each test in its own directory, with the shared settings restored afterwards"""
+    saved = {field.name: getattr(settings, field.name) for field in fields(settings)}
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    for name, value in saved.items():
+        setattr(settings, name, value)
@@ -0,0 +1,230 @@
+"""In-memory doubles for the Firestore and Cloud Storage calls the backend makes"""
+import threading
+import contextlib
+from datetime import datetime, timedelta, timezone
+
+
+class FakeRef:
+    def __init__(self, collection, doc_id, db=None):
+        self.collection = collection
+        self.id = doc_id
+        self.db = db
+
+    def set(self, data, merge=False):
+        batch = self.db.batch()
+        batch.set(self, data, merge=merge)
+        batch.commit()
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self.id, self.db.documents.get(self.collection, {}).get(self.id))
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append(('merge' if merge else 'set', ref, data))
+
+    def update(self, ref, data):
+        self.writes.append(('update', ref, data))
+
+    def delete(self, ref):
+        self.writes.append(('delete', ref, None))
+
+    def commit(self):
+        with self.db.lock:
+            self.db.commits.append(len(self.writes))
+            if any(ref.id in self.db.failing for _, ref, _ in self.writes):
+                raise RuntimeError('write rejected')
+            for op, ref, data in self.writes:
+                documents = self.db.documents.setdefault(ref.collection, {})
+                if op == 'delete':
+                    documents.pop(ref.id, None)
+                elif op == 'set':
+                    documents[ref.id] = dict(data)
+                else:
+                    documents.setdefault(ref.id, {}).update(data)
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeRef(self.name, doc_id, self.db)
+
+    def select(self, field_paths):
+        return self
+
+    def stream(self):
+        for doc_id, data in list(self.db.documents.get(self.name, {}).items()):
+            yield FakeSnapshot(doc_id, data)
+
+
+class FakeFirestore:
+    """Batches commit into documents; a batch touching an ID in failing is rejected whole"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.documents = {}
+        self.commits = []
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs, field_paths=None):
+        for ref in refs:
+            data = self.documents.get(ref.collection, {}).get(ref.id)
+            if data is not None and field_paths:
+                data = {field: data[field] for field in field_paths if field in data}
+            yield FakeSnapshot(ref.id, data)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, data=b'', age=timedelta(days=2)):
+        self.bucket = bucket
+        self.name = name
+        self.data = data
+        self.size = len(data)
+        self.updated = datetime.now(timezone.utc) - age
+
+    def delete(self):
+        self.bucket.client.check(self.name)
+        self.bucket.blobs.pop(self.name, None)
+
+    def download_as_bytes(self):
+        return self.data
+
+
+class FakePage:
+    def __init__(self, blobs, prefixes):
+        self.blobs = blobs
+        self.prefixes = prefixes
+
+    def __iter__(self):
+        return iter(self.blobs)
+
+
+class FakeBlobIterator:
+    """Single-page listing with the folder prefixes a delimiter produces"""
+
+    def __init__(self, blobs, prefixes):
+        self.pages = [FakePage(blobs, prefixes)]
+
+    def __iter__(self):
+        return iter(self.pages[0].blobs)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.blobs = {}
+
+    def blob(self, name):
+        return self.blobs.get(name) or FakeBlob(self, name)
+
+    def add(self, name, data=b'x', age=timedelta(days=2)):
+        self.blobs[name] = FakeBlob(self, name, data, age)
+        return self.blobs[name]
+
+    def list_blobs(self, prefix='', delimiter=None):
+        return self.client.list_blobs(self.name, prefix=prefix, delimiter=delimiter)
+
+    def copy_blob(self, blob, destination, new_name):
+        self.client.check(new_name)
+        copied = destination.add(new_name, blob.data)
+        copied.updated = blob.updated
+        return copied
+
+
+class FakeStorage:
+    """Buckets of blobs; any operation on a name containing one of failing raises"""
+
+    def __init__(self, failing=()):
+        self.buckets = {}
+        self.failing = set(failing)
+
+    def check(self, name):
+        if any(part in name for part in self.failing):
+            raise RuntimeError(f'storage error on {name}')
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket(self, name))
+
+    def list_blobs(self, bucket_name, prefix='', delimiter=None):
+        blobs, prefixes = [], []
+        for name in sorted(self.bucket(bucket_name).blobs):
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                folder = prefix + rest.split(delimiter, 1)[0] + delimiter
+                if folder not in prefixes:
+                    prefixes.append(folder)
+            else:
+                blobs.append(self.bucket(bucket_name).blobs[name])
+        return FakeBlobIterator(blobs, prefixes)
+
+    def batch(self):
+        return contextlib.nullcontext()
+
+
+def fake_gcp(failing_documents=(), failing_blobs=()):
+    """A GCPStorage on top of the in-memory doubles, so its real batch writers run"""
+    from gcp_utils import GCPStorage
+
+    gcp = GCPStorage.__new__(GCPStorage)
+    gcp.db = FakeFirestore(failing_documents)
+    gcp.storage_client = FakeStorage(failing_blobs)
+    gcp.buckets = {'data': 'data', 'images': 'images', 'profiles': 'profiles'}
+    return gcp
+
+
+def raw_tweet(tweet_id, text='hello', user_id='7', screen_name='ann'):
+    """A GraphQL tweet result as the search returns it and the page archive stores it"""
+    user_legacy = {
+        'created_at': 'Mon Jan 01 00:00:00 +0000 2024', 'name': screen_name.title(), 'screen_name': screen_name,
+        'profile_image_url_https': f'https://pbs.twimg.com/profile_images/{user_id}/p_normal.jpg',
+        'location': '', 'description': '', 'entities': {'description': {'urls': []}},
+        'pinned_tweet_ids_str': [], 'verified': False, 'possibly_sensitive': False, 'can_dm': False,
+        'can_media_tag': False, 'want_retweets': False, 'default_profile': True, 'default_profile_image': False,
+        'has_custom_timelines': False, 'followers_count': 10, 'fast_followers_count': 0,
+        'normal_followers_count': 10, 'friends_count': 5, 'favourites_count': 0, 'listed_count': 0,
+        'media_count': 0, 'statuses_count': 100, 'is_translator': False, 'translator_type': 'none',
+        'withheld_in_countries': [],
+    }
+    return {
+        '__typename': 'Tweet',
+        'rest_id': str(tweet_id),
+        'core': {'user_results': {'result': {'rest_id': user_id, 'is_blue_verified': False, 'legacy': user_legacy}}},
+        'legacy': {
+            'created_at': 'Tue Jan 02 00:00:00 +0000 2024', 'full_text': text, 'lang': 'en',
+            'favorite_count': 1, 'retweet_count': 2, 'reply_count': 0, 'quote_count': 0,
+            'is_quote_status': False, 'possibly_sensitive': False, 'entities': {'hashtags': [], 'urls': []},
+        },
+    }
+
+
+def search_tweets(tweet_ids, **fields):
+    """twikit Tweet objects built from raw results, as a search page holds them"""
+    from twikit.tweet import tweet_from_data
+
+    return [tweet_from_data(None, {'result': raw_tweet(tweet_id, **fields)}) for tweet_id in tweet_ids]
@@ -0,0 +1,51 @@
+import os
+import sys
+import subprocess
+import numpy as np
+import pandas as pd
+from baseline_classifier import BaselineClassifier, normalize_text, parse_labels
+from review_queue import load_scorer
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def labeled_tweets(n=40):
+    texts, labels = [], []
+    for i in range(n):
+        if i % 2:
+            texts.append(f"miracle cure they hide from you number {i} http://x.co/{i}")
+            labels.append('true')
+        else:
+            texts.append(f"race results and lap times from qualifying {i} @team")
+            labels.append('false')
+    return pd.DataFrame({'Tweet_ID': [str(i) for i in range(n)], 'Text': texts, 'is_disinfo': labels})
+
+
+def test_normalize_text():
+    assert normalize_text('Look @Someone https://t.co/abc NOW') == 'look  mentiontoken   urltoken  now'
+    assert normalize_text(None) == ''
+
+
+def test_parse_labels():
+    labels = parse_labels(pd.Series(['True', 'no', '', None, '1.0']))
+    assert labels.tolist()[:2] == [1.0, 0.0]
+    assert np.isnan(labels[2]) and np.isnan(labels[3])
+    assert labels[4] == 1.0
+
+
+def test_model_trained_by_the_cli_loads_in_another_module(workdir):
+    labeled_tweets().to_csv('t.csv', index=False)
+    # Trained and saved by the script itself, where its functions live in __main__
+    subprocess.run([sys.executable, os.path.join(BACKEND, 'baseline_classifier.py'), 'train', 't.csv', '--model', 'm.joblib'],
+                   check=True, cwd=workdir, capture_output=True)
+
+    model = load_scorer('m.joblib')
+    scores = model.predict_proba(['another miracle cure they hide', 'lap times from qualifying'])
+    assert scores[0] > 0.5 > scores[1]
+
+
+def test_save_load_round_trip(workdir):
+    df = labeled_tweets()
+    model = BaselineClassifier().fit(df['Text'], parse_labels(df['is_disinfo']))
+    model.save('m.joblib')
+    assert np.allclose(BaselineClassifier.load('m.joblib').predict_proba(df['Text']), model.predict_proba(df['Text']))
@@ -0,0 +1,75 @@
+import pytest
+from config import settings
+from blob_layout import (media_blob_path, media_path_candidates, media_prefix, migrate_media_layout,
+                         parse_media_blob_path, rewrite_media_path)
+from fakes import fake_gcp
+
+
+def test_new_uploads_keep_the_flat_layout_by_default():
+    assert settings.media_key_scheme == 'flat'
+    assert media_blob_path('123', 'a.jpg') == 'media/123/a.jpg'
+
+
+@pytest.mark.parametrize('scheme', ['flat', 'hashed', 'reversed'])
+def test_every_layout_parses_back(scheme):
+    path = media_blob_path('1234567', 'tweet_1234567_media_0.jpg', scheme)
+    assert parse_media_blob_path(path) == ('1234567', 'tweet_1234567_media_0.jpg')
+    assert media_prefix('1234567', 'reversed') == 'media/7654/1234567/'
+
+
+def test_stored_paths_are_rewritten_and_resolved():
+    flat = 'gs://images/media/42/tweet_42_media_0.jpg'
+    hashed = rewrite_media_path(flat, 'hashed')
+    assert hashed == 'gs://images/' + media_blob_path('42', 'tweet_42_media_0.jpg', 'hashed')
+    assert media_path_candidates(flat, 'hashed')[:2] == [flat, hashed]
+    assert rewrite_media_path('local/file.jpg', 'hashed') == 'local/file.jpg'
+
+
+def migration_fixture(**failing):
+    gcp = fake_gcp(**failing)
+    images = gcp.storage_client.bucket('images')
+    documents = gcp.db.documents.setdefault('tweets', {})
+    for tweet_id in ('11', '22', '33'):
+        for index in range(2):
+            images.add(media_blob_path(tweet_id, f'tweet_{tweet_id}_media_{index}.jpg', 'flat'))
+        documents[tweet_id] = {'Media_Files': '|'.join(
+            f'gs://images/media/{tweet_id}/tweet_{tweet_id}_media_{index}.jpg' for index in range(2))}
+    return gcp
+
+
+def test_migration_copies_rewrites_then_deletes(monkeypatch):
+    gcp = migration_fixture()
+    assert len(migrate_media_layout(gcp, 'hashed', dry_run=True)) == 3
+    assert len(gcp.storage_client.bucket('images').blobs) == 6
+
+    assert sorted(migrate_media_layout(gcp, 'hashed', dry_run=False, max_workers=2)) == ['11', '22', '33']
+    blobs = set(gcp.storage_client.bucket('images').blobs)
+    assert blobs == {media_blob_path(t, f'tweet_{t}_media_{i}.jpg', 'hashed') for t in ('11', '22', '33') for i in range(2)}
+    for tweet_id, document in gcp.db.documents['tweets'].items():
+        for path in document['Media_Files'].split('|'):
+            assert path[len('gs://images/'):] in blobs
+
+
+def test_old_blobs_stay_when_the_document_rewrite_fails(monkeypatch):
+    import gcp_utils
+    monkeypatch.setattr(gcp_utils.time, 'sleep', lambda seconds: None)
+    gcp = migration_fixture(failing_documents={'22'})
+
+    assert sorted(migrate_media_layout(gcp, 'hashed', dry_run=False, max_workers=2)) == ['11', '33']
+    # Tweet 22 still points at its flat keys, and they still exist
+    blobs = gcp.storage_client.bucket('images').blobs
+    for path in gcp.db.documents['tweets']['22']['Media_Files'].split('|'):
+        assert path[len('gs://images/'):] in blobs
+    assert media_blob_path('22', 'tweet_22_media_0.jpg', 'hashed') in blobs
+
+    # Rerunning finishes the move once Firestore accepts the write
+    gcp.db.failing = set()
+    assert migrate_media_layout(gcp, 'hashed', dry_run=False) == ['22']
+    assert 'media/22/tweet_22_media_0.jpg' not in blobs
+
+
+def test_nothing_moves_for_a_tweet_whose_copy_failed():
+    gcp = migration_fixture(failing_blobs={'tweet_33_media_1'})
+    assert sorted(migrate_media_layout(gcp, 'hashed', dry_run=False)) == ['11', '22']
+    assert gcp.db.documents['tweets']['33']['Media_Files'].startswith('gs://images/media/33/')
+    assert 'media/33/tweet_33_media_0.jpg' in gcp.storage_client.bucket('images').blobs
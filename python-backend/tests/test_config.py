@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import config
+import gcp_utils
+from config import configure, load_settings, settings
+from fakes import fake_gcp
+from label_sync import sync_labels
+
+
+@pytest.fixture(autouse=True)
+def no_settings_file(monkeypatch):
+    monkeypatch.setattr(config, '_settings_file', None)
+
+
+def write_config(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_file_then_environment_then_set_flags():
+    write_config('config.ini', '[X]\nusername = u\n[settings]\nminimum_tweets = 50\nmedia_worker_concurrency = 16\n'
+                               'review_delete_from_gcs = yes\nqueries =\n    (#f1) lang:en\n    (#motogp) lang:en since:2025-01-01\n')
+    environ = {'COLLECTOR_MEDIA_WORKER_CONCURRENCY': '4', 'COLLECTOR_DOWNLOAD_TIMEOUT_SECONDS': '5'}
+
+    loaded = load_settings(overrides=['media_worker_concurrency=2', 'queries=#a;#b'], environ=environ)
+    assert loaded.minimum_tweets == 50
+    assert loaded.media_worker_concurrency == 2
+    assert loaded.download_timeout_seconds == 5.0
+    assert loaded.review_delete_from_gcs is True
+    assert loaded.queries == ('#a', '#b')
+
+    # Lines starting with '#' are queries, not comments
+    loaded = load_settings(environ={})
+    assert loaded.queries == ('(#f1) lang:en', '(#motogp) lang:en since:2025-01-01')
+    assert loaded.media_worker_concurrency == 16
+    assert load_settings(environ={'COLLECTOR_CONFIG': 'missing.ini'}).minimum_tweets == 10
+
+
+@pytest.mark.parametrize('override, message', [
+    ('minimum_tweets=ten', "expects int, got 'ten'"),
+    ('review_delete_from_gcs=maybe', 'expects true or false'),
+    ('media_key_scheme=nested', 'must be one of flat, hashed, reversed'),
+    ('no_such_setting=1', "Unknown setting 'no_such_setting'"),
+    ('minimum_tweets', 'Expected NAME=VALUE'),
+])
+def test_bad_values_are_rejected(override, message):
+    with pytest.raises(ValueError, match=message):
+        load_settings(overrides=[override], environ={})
+
+
+def test_parse_args_reports_bad_settings_as_usage_errors(capsys):
+    parser = config.argparse.ArgumentParser()
+    with pytest.raises(SystemExit):
+        config.parse_args(parser, ['--set', 'cpu_workers=many'])
+    assert "expects int, got 'many'" in capsys.readouterr().err
+
+
+def test_parallel_writes_follow_the_one_workers_setting(monkeypatch):
+    assert settings.firestore_write_workers > 1
+    configure(overrides={'firestore_write_workers': 3}, environ={})
+    executors = []
+    real_executor = gcp_utils.ThreadPoolExecutor
+
+    def recording_executor(max_workers):
+        executors.append(max_workers)
+        return real_executor(max_workers=max_workers)
+
+    monkeypatch.setattr(gcp_utils, 'ThreadPoolExecutor', recording_executor)
+    gcp = fake_gcp()
+    for tweet_id in ('1', '2'):
+        gcp.db.collection('tweets').document(tweet_id).set({'is_disinfo': ''})
+    pd.DataFrame({'Tweet_ID': ['1', '2'], 'is_disinfo': ['true', 'false']}).to_csv('r.csv', index=False)
+
+    assert sync_labels(gcp, 'r.csv') == {'1': 'true', '2': 'false'}
+    assert gcp.db.documents['tweets']['2'] == {'is_disinfo': 'false'}
+    # The last executor is the write one; the first reads the current labels
+    assert executors[-1] == 3
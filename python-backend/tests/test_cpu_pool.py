@@ -0,0 +1,40 @@
+import asyncio
+import os
+from io import BytesIO
+import pytest
+from PIL import Image
+from cpu_pool import SHARED_MEMORY_THRESHOLD, CpuPool
+from media_utils import image_fingerprint
+
+
+def noisy_png(size=256):
+    image = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = CpuPool(max_workers=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_payloads_big_and_small_give_the_in_process_result(pool):
+    big = noisy_png()
+    small = noisy_png(8)
+    assert len(big) >= SHARED_MEMORY_THRESHOLD > len(small)
+
+    async def run():
+        return await asyncio.gather(pool.run(image_fingerprint, big), pool.run(image_fingerprint, small))
+
+    assert asyncio.run(run()) == [image_fingerprint(big), image_fingerprint(small)]
+    assert pool.metrics()['completed'] >= 2 and pool.metrics()['in_flight'] == 0
+
+
+def test_worker_errors_reach_the_caller_and_are_counted(pool):
+    failed = pool.failed
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run(int, 'not a number'))
+    assert pool.failed == failed + 1
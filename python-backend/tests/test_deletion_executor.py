@@ -0,0 +1,51 @@
+import pandas as pd
+from blob_layout import media_prefix
+from deletion_executor import DeletionExecutor, ReviewedUsers, build_username_index, row_file_paths
+from fakes import fake_gcp
+
+
+def review_frame():
+    return pd.DataFrame({
+        'Tweet_ID': ['1', '2', '3'],
+        'Username': ['ann', 'bob', 'ann'],
+        'Profile_Pic': ['profile_pics/ann.jpg', 'gs://profiles/users/bob/profile_bob.jpg', 'profile_pics/ann.jpg'],
+        'Media_Files': ['media/1_0.jpg|media/1_1.jpg', None, ''],
+    })
+
+
+def test_username_index_and_row_paths():
+    df = review_frame()
+    index = build_username_index(df)
+    assert {user: list(rows) for user, rows in index.items()} == {'ann': [0, 2], 'bob': [1]}
+    assert row_file_paths(df, index['ann']) == {'profile_pics/ann.jpg', 'media/1_0.jpg', 'media/1_1.jpg'}
+
+
+def test_rows_lose_local_files_and_blobs_in_every_layout(workdir):
+    (workdir / 'media').mkdir()
+    (workdir / 'media' / '1_0.jpg').write_bytes(b'x')
+    gcp = fake_gcp()
+    images = gcp.storage_client.bucket('images')
+    for scheme in ('flat', 'hashed'):
+        images.add(media_prefix('1', scheme) + 'tweet_1_media_0.jpg')
+    images.add(media_prefix('2', 'flat') + 'tweet_2_media_0.jpg')
+    profiles = gcp.storage_client.bucket('profiles')
+    profiles.add('users/ann/profile_ann.jpg')
+
+    executor = DeletionExecutor(gcp, max_workers=2)
+    executor.delete_rows(review_frame(), [0], delete_user_prefix=True)
+    executor.close()
+
+    assert not (workdir / 'media' / '1_0.jpg').exists()
+    assert list(images.blobs) == ['media/2/tweet_2_media_0.jpg']
+    assert profiles.blobs == {}
+
+
+def test_reviewed_users_persist(workdir):
+    users = ReviewedUsers('r.csv')
+    users.add('ann')
+    users.add('ann')
+    users.close()
+    reopened = ReviewedUsers('r.csv')
+    assert 'ann' in reopened and 'bob' not in reopened
+    assert (workdir / 'r.csv.reviewed_users.txt').read_text() == 'ann\n'
+    reopened.close()
@@ -0,0 +1,40 @@
+import sys
+import pandas as pd
+import domain_reputation
+from domain_reputation import DomainReputationIndex, normalize_host
+
+
+def test_normalize_host():
+    assert normalize_host('https://WWW.Example.com:8080/path?q=1') == 'example.com'
+    assert normalize_host('news.example.com.') == 'news.example.com'
+    assert normalize_host('') == ''
+
+
+def test_lookup_walks_up_to_the_registrable_domain():
+    index = DomainReputationIndex({'bad.com': 'low', 'site.co.uk': 'mixed'})
+    assert index.lookup('https://news.bad.com/a') == ('bad.com', 'low')
+    assert index.lookup('http://a.b.site.co.uk/') == ('site.co.uk', 'mixed')
+    assert index.lookup('https://notbad.com') is None
+    # A public suffix alone never matches a listed domain under it
+    assert DomainReputationIndex(['co.uk']).lookup('bbc.co.uk') is None
+
+
+def test_annotate_tweet():
+    index = DomainReputationIndex(['bad.com'])
+    tweet = index.annotate_tweet({}, ['https://www.bad.com/x', 'https://good.org', ''])
+    assert tweet == {'Link_Domains': 'bad.com|good.org', 'Low_Cred_Domains': 'bad.com', 'has_low_cred_link': True}
+
+
+def test_cli_annotates_the_export_in_place(workdir, monkeypatch):
+    (workdir / 'low_cred_domains.txt').write_text('# list\nbad.com,low\n')
+    pd.DataFrame({'Tweet_ID': ['1', '2', '3'],
+                  'Expanded_Links': ['https://bad.com/a|https://ok.org', 'https://ok.org', None]}).to_csv('export.csv', index=False)
+    monkeypatch.setattr(sys, 'argv', ['domain_reputation.py', 'export.csv'])
+
+    domain_reputation.main()
+
+    df = pd.read_csv('export.csv', dtype=str, keep_default_na=False)
+    assert list(df['Low_Cred_Domains']) == ['bad.com', '', '']
+    assert list(df['Link_Domains']) == ['bad.com|ok.org', 'ok.org', '']
+    assert list(df['has_low_cred_link']) == ['True', 'False', 'False']
+    assert sorted(p.name for p in workdir.iterdir()) == ['export.csv', 'low_cred_domains.txt']
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+import gcp_utils
+from gcp_utils import BatchWriteError, GCPStorage, dataframe_to_records, tweet_document_id
+from fakes import FakeFirestore
+
+
+@pytest.fixture
+def gcp(monkeypatch):
+    # Retries back off with time.sleep; the fake fails deterministically anyway
+    monkeypatch.setattr(gcp_utils.time, 'sleep', lambda seconds: None)
+    storage = GCPStorage.__new__(GCPStorage)
+    storage.db = FakeFirestore()
+    return storage
+
+
+def test_records_turn_nan_into_none_and_ids_undo_the_float_upcast():
+    df = pd.DataFrame({'Tweet_ID': [1.0, np.nan], 'Likes': [3, np.nan]})
+    records = dataframe_to_records(df)
+    assert records[1] == {'Tweet_ID': None, 'Likes': None}
+    assert tweet_document_id(records[0]['Tweet_ID'], 'unknown_0') == '1'
+    assert tweet_document_id(None, 'unknown_1') == 'unknown_1'
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_batches_are_split_and_committed(gcp, workers):
+    updates = {str(i): {'is_disinfo': 'true'} for i in range(23)}
+    assert gcp.update_tweets_batch(updates, batch_size=5, max_workers=workers) == 23
+    assert sorted(gcp.db.commits) == [3, 5, 5, 5, 5]
+    assert len(gcp.db.documents['tweets']) == 23
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_documents_failing_after_retries_are_reported(gcp, workers):
+    gcp.db.failing = {'7', '12'}
+    with pytest.raises(BatchWriteError) as error:
+        gcp.update_tweets_batch({str(i): {'Likes': i} for i in range(20)}, batch_size=5, max_workers=workers)
+    assert sorted(error.value.failed_ids) == ['12', '7']
+    assert error.value.written == 18
+    # The other members of the rejected batches were written one by one
+    assert set(gcp.db.documents['tweets']) == {str(i) for i in range(20)} - {'7', '12'}
+
+
+def test_users_go_to_their_own_collection(gcp):
+    assert gcp.upsert_users_batch({'u1': {'Followers': 3}}) == 1
+    assert gcp.db.documents == {'users': {'u1': {'Followers': 3}}}
@@ -0,0 +1,55 @@
+import csv
+from datetime import timedelta
+from blob_layout import media_prefix
+from gcs_gc import profile_owner, run_gc
+from fakes import fake_gcp
+
+
+def test_profile_owner_checks_every_folder_depth():
+    assert profile_owner('users/a/b/profile_a/b.jpg', {'a/b'}) == ('a/b', True)
+    assert profile_owner('users/a/b/profile_a/b.jpg', {'a'}) == ('a', True)
+    assert profile_owner('users/a/b/profile_a/b.jpg', set()) == ('a/b', False)
+    assert profile_owner('users/gone/profile_gone.png', {'other'}) == ('gone', False)
+
+
+def gc_fixture():
+    gcp = fake_gcp()
+    gcp.db.documents['tweets'] = {
+        '1': {'Tweet_ID': '1', 'Username': 'live/user'},
+        '2': {'Tweet_ID': '2', 'Username': 'live'},
+    }
+    images = gcp.storage_client.bucket('images')
+    images.add(media_prefix('1', 'hashed') + 'tweet_1_media_0.jpg')
+    images.add(media_prefix('9', 'flat') + 'tweet_9_media_0.jpg', b'12345')
+    images.add(media_prefix('8', 'hashed') + 'tweet_8_media_0.jpg', age=timedelta(hours=1))
+    profiles = gcp.storage_client.bucket('profiles')
+    profiles.add('users/live/user/profile_live/user.jpg')
+    profiles.add('users/live/profile_live.jpg')
+    profiles.add('users/gone, "quoted"/profile_gone, "quoted".jpg')
+    return gcp
+
+
+def test_dry_run_reports_orphans_without_deleting(workdir):
+    gcp = gc_fixture()
+    results = run_gc(gcp, dry_run=True, max_workers=2, report_path='report.csv')
+
+    assert {(prefix, status) for _, prefix, _, _, status in results} == {
+        (media_prefix('8', 'hashed'), 'too recent'),
+        (media_prefix('9', 'flat'), 'would delete'),
+        ('users/gone, "quoted"/', 'would delete'),
+    }
+    assert len(gcp.storage_client.bucket('images').blobs) == 3
+    with open('report.csv', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['bucket', 'prefix', 'blobs', 'bytes', 'status']
+    assert ['profiles', 'users/gone, "quoted"/', '1', '1', 'would delete'] in rows
+
+
+def test_delete_keeps_live_users_whose_name_contains_a_slash(workdir):
+    gcp = gc_fixture()
+    run_gc(gcp, dry_run=False, max_workers=2)
+
+    assert sorted(gcp.storage_client.bucket('profiles').blobs) == [
+        'users/live/profile_live.jpg', 'users/live/user/profile_live/user.jpg']
+    assert sorted(gcp.storage_client.bucket('images').blobs) == [
+        media_prefix('1', 'hashed') + 'tweet_1_media_0.jpg', media_prefix('8', 'hashed') + 'tweet_8_media_0.jpg']
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+import main
+from config import settings
+from graceful_shutdown import GracefulShutdown, clear_checkpoint, load_checkpoint, save_checkpoint
+from fakes import fake_gcp
+
+
+def test_checkpoint_round_trip(workdir):
+    assert load_checkpoint() is None
+    save_checkpoint({'query': 'q', 'cursor': 'c', 'done_ids': ['1']})
+    assert load_checkpoint() == {'query': 'q', 'cursor': 'c', 'done_ids': ['1']}
+    clear_checkpoint()
+    assert load_checkpoint() is None
+    (workdir / settings.checkpoint_file).write_text('{"query": ')
+    assert load_checkpoint() is None
+
+
+def test_stop_interrupts_waits_and_drains_tracked_work():
+    async def run():
+        shutdown = GracefulShutdown(drain_seconds=0.05).install()
+        finished = []
+
+        async def work(seconds):
+            await asyncio.sleep(seconds)
+            finished.append(seconds)
+
+        short = shutdown.track(work(0.01))
+        long = shutdown.track(work(10))
+        sleeper = asyncio.create_task(shutdown.sleep(10))
+        await asyncio.sleep(0)
+        shutdown._on_signal(15)
+
+        assert await sleeper is False
+        assert shutdown.stopping
+        await short
+        with pytest.raises(asyncio.CancelledError):
+            await long
+        return finished
+
+    assert asyncio.run(run()) == [0.01]
+
+
+class StoppedShutdown(GracefulShutdown):
+    """A shutdown already requested when the run starts"""
+
+    def install(self):
+        super().install()
+        self.stop_event.set()
+        return self
+
+
+class FakeClient:
+    def __init__(self, language=None):
+        pass
+
+    async def login(self, **credentials):
+        pass
+
+
+@pytest.fixture
+def collector_env(workdir, monkeypatch):
+    (workdir / 'config.ini').write_text('[X]\nusername = u\nemail = e\npassword = p\n')
+    gcp = fake_gcp()
+    monkeypatch.setattr(main, 'GCPStorage', lambda: gcp)
+    monkeypatch.setattr(main, 'Client', FakeClient)
+    monkeypatch.setattr(main, 'CpuPool', lambda: type('Pool', (), {'metrics': dict, 'shutdown': lambda self: None})())
+    return gcp
+
+
+def test_stop_with_no_query_to_run_keeps_the_checkpoint(collector_env, monkeypatch):
+    monkeypatch.setattr(main, 'GracefulShutdown', StoppedShutdown)
+    # The checkpointed query is no longer configured, so nothing runs
+    settings.queries = ()
+    save_checkpoint({'query': 'old', 'cursor': 'c', 'done_ids': []})
+
+    assert asyncio.run(main.main()) is True
+    assert load_checkpoint() == {'query': 'old', 'cursor': 'c', 'done_ids': []}
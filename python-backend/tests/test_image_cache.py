@@ -0,0 +1,36 @@
+from PIL import Image
+from image_cache import ImageCache
+from image_utils import compose_grid
+
+
+def save_image(path, size=(800, 600), color='red'):
+    Image.new('RGB', size, color).save(path)
+    return str(path)
+
+
+def test_images_are_decoded_to_thumbnails(workdir):
+    cache = ImageCache(thumb_size=(100, 100))
+    image = cache.get(save_image(workdir / 'a.jpg'))
+    assert image.mode == 'RGB' and max(image.size) <= 100
+    assert cache.get(str(workdir / 'missing.jpg')) is None
+    cache.close()
+
+
+def test_prefetch_is_bounded_and_least_recently_used_goes_first(workdir):
+    paths = [save_image(workdir / f'{i}.png', (40, 40)) for i in range(4)]
+    cache = ImageCache(max_items=2, thumb_size=(20, 20))
+    cache.prefetch(paths[:2])
+    cache.get(paths[0])
+    cache.prefetch([paths[2], None])
+    assert list(cache._entries) == [paths[0], paths[2]]
+    assert cache.get(paths[2]).size == (20, 20)
+    cache.close()
+
+
+def test_compose_grid_lays_out_rows_with_captions():
+    tiles = [Image.new('RGB', (10, 10), 'blue')] * 4 + [None]
+    grid = compose_grid(tiles, [str(i) for i in range(5)], columns=3, tile_size=(10, 10))
+    assert grid.size == (30, 2 * (10 + 24))
+    assert grid.getpixel((5, 24 + 5)) == (0, 0, 255)
+    # The missing image leaves its tile blank
+    assert grid.getpixel((15, 34 + 24 + 5)) == (255, 255, 255)
@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+from gcp_utils import BatchWriteError
+from label_journal import LabelJournal
+
+
+class FakeGcp:
+    """Records batched writes; IDs in fail are reported as failed"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.labels = {}
+        self.deleted = []
+
+    def update_tweets_batch(self, updates, batch_size=None):
+        failed = [tid for tid in updates if tid in self.fail]
+        self.labels.update({tid: fields for tid, fields in updates.items() if tid not in self.fail})
+        if failed:
+            raise BatchWriteError(failed, len(updates) - len(failed))
+        return len(updates)
+
+    def delete_tweets_batch(self, tweet_ids, batch_size=None):
+        failed = [tid for tid in tweet_ids if tid in self.fail]
+        self.deleted += [tid for tid in tweet_ids if tid not in self.fail]
+        if failed:
+            raise BatchWriteError(failed, len(tweet_ids) - len(failed))
+        return len(tweet_ids)
+
+
+def write_export(path):
+    pd.DataFrame({'Tweet_ID': ['101', '102', '103'], 'Text': ['a', 'b', 'c'],
+                  'is_disinfo': [None, None, 'false']}).to_csv(path, index=False)
+
+
+def test_latest_decision_wins_and_survives_compaction(workdir):
+    journal = LabelJournal('j.jsonl', compact_every=3)
+    journal.record('1', label='true')
+    journal.record('2', action='delete')
+    journal.record('1', label='false')
+    journal.close()
+
+    reopened = LabelJournal('j.jsonl')
+    assert len(list(reopened.entries())) == 2
+    assert reopened.latest()['1']['label'] == 'false'
+    assert reopened.deleted_ids() == {'2'}
+    reopened.close()
+
+
+def test_partial_last_line_is_skipped(workdir):
+    journal = LabelJournal('j.jsonl')
+    journal.record('1', label='true')
+    journal.close()
+    with open('j.jsonl', 'a') as f:
+        f.write('{"tweet_id": "2", "act')
+    assert list(LabelJournal('j.jsonl').latest()) == ['1']
+
+
+def test_merge_then_replay_round_trip(workdir):
+    write_export('export.csv')
+    journal = LabelJournal.for_dataset('export.csv')
+    journal.record('101', label='true')
+    journal.record('102', action='delete')
+
+    assert journal.checkpoint_csv('export.csv', chunksize=2) == 2
+    merged = pd.read_csv('export.csv', dtype=str)
+    assert merged['Tweet_ID'].tolist() == ['101', '103']
+    assert merged['is_disinfo'].tolist() == ['true', 'false']
+    # Merged entries wait in the unsynced file, the journal starts empty
+    assert list(journal.entries()) == []
+    assert set(journal.latest(include_unsynced=True)) == {'101', '102'}
+
+    gcp = FakeGcp()
+    assert journal.replay_to_firestore(gcp) == (1, 1)
+    assert gcp.labels == {'101': {'is_disinfo': 'true'}}
+    assert gcp.deleted == ['102']
+    assert journal.latest(include_unsynced=True) == {}
+    journal.close()
+
+
+def test_failed_replay_keeps_only_the_failed_entries(workdir):
+    write_export('export.csv')
+    journal = LabelJournal.for_dataset('export.csv')
+    journal.record('101', label='true')
+    journal.record('103', label='true')
+    journal.record('102', action='delete')
+    journal.checkpoint_csv('export.csv')
+
+    with pytest.raises(BatchWriteError) as error:
+        journal.replay_to_firestore(FakeGcp(fail={'103', '102'}))
+    assert sorted(error.value.failed_ids) == ['102', '103']
+    assert set(journal.latest(include_unsynced=True)) == {'102', '103'}
+
+    gcp = FakeGcp()
+    assert journal.replay_to_firestore(gcp) == (1, 1)
+    assert gcp.labels == {'103': {'is_disinfo': 'true'}} and gcp.deleted == ['102']
+    journal.close()
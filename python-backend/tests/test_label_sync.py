@@ -0,0 +1,43 @@
+import pandas as pd
+from label_journal import LabelJournal
+from label_sync import diff_labels, load_local_labels, sync_labels
+
+
+class FakeGcp:
+    def __init__(self, remote):
+        self.remote = remote
+        self.updates = None
+
+    def get_tweet_fields(self, tweet_ids, field_paths):
+        return {tid: self.remote[tid] for tid in tweet_ids if tid in self.remote}
+
+    def update_tweets_batch(self, updates, max_workers=None, merge=True):
+        self.updates = (updates, merge)
+        return len(updates)
+
+
+def test_diff_ignores_unchanged_and_missing_tweets():
+    changes, missing = diff_labels({'1': 'true', '2': 'false', '3': 'true'},
+                                   {'1': {'is_disinfo': 'True'}, '2': {'is_disinfo': ''}})
+    assert changes == {'2': 'false'}
+    assert missing == 1
+
+
+def test_sync_pushes_only_changed_labels_journal_included(workdir):
+    pd.DataFrame({'Tweet_ID': ['1', '2', '3', '4'], 'is_disinfo': ['true', 'false', None, 'maybe']}).to_csv('r.csv', index=False)
+    journal = LabelJournal.for_dataset('r.csv')
+    journal.record('3', label='true')
+    journal.close()
+    assert load_local_labels('r.csv') == {'1': 'true', '2': 'false', '3': 'true'}
+
+    gcp = FakeGcp({'1': {'is_disinfo': 'true'}, '2': {'is_disinfo': 'true'}, '3': {}})
+    assert sync_labels(gcp, 'r.csv') == {'2': 'false', '3': 'true'}
+    # update, not merge: a tweet deleted remotely meanwhile is not recreated
+    assert gcp.updates == ({'2': {'is_disinfo': 'false'}, '3': {'is_disinfo': 'true'}}, False)
+
+
+def test_dry_run_writes_nothing(workdir):
+    pd.DataFrame({'Tweet_ID': ['1'], 'is_disinfo': ['true']}).to_csv('r.csv', index=False)
+    gcp = FakeGcp({'1': {}})
+    assert sync_labels(gcp, 'r.csv', dry_run=True) == {'1': 'true'}
+    assert gcp.updates is None
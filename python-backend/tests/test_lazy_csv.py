@@ -0,0 +1,44 @@
+import pandas as pd
+
+from label_journal import LabelJournal
+from lazy_csv import LazyCsv, TWEET_DTYPES
+
+# An ID past int64 and one with a leading zero only survive as strings
+IDS = ['19000000000000000000001', '0102', '103', '104']
+
+
+def write_export(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('Tweet_ID,Text,is_disinfo\n')
+        f.write(f'{IDS[0]},"two\nlines",True\n')
+        f.write(f'{IDS[1]},b,False\n')
+        f.write(f'{IDS[2]},c,\n')
+        f.write(f'{IDS[3]},d,\n')
+
+
+def test_rows_and_chunks_keep_ids_and_labels_as_strings():
+    write_export('export.csv')
+    dataset = LazyCsv('export.csv', dtype=TWEET_DTYPES, window=2)
+
+    assert len(dataset) == 4
+    assert dataset.row(0)['Text'] == 'two\nlines'
+    assert [dataset.row(i)['Tweet_ID'] for i in range(4)] == IDS
+    assert dataset.row(1)['is_disinfo'] == 'False'
+    for chunk in dataset.iter_chunks(chunksize=2):
+        assert chunk['Tweet_ID'].map(type).eq(str).all()
+    assert dataset.read_columns(['Tweet_ID'])['Tweet_ID'].tolist() == IDS
+
+
+def test_checkpoint_reads_chunks_with_the_same_types():
+    write_export('export.csv')
+    journal = LabelJournal.for_dataset('export.csv')
+    journal.record('103', label='true')
+
+    # Single-row chunks: an unlabeled chunk must not turn into floats or booleans
+    assert journal.checkpoint_csv('export.csv', chunksize=1) == 4
+    journal.close()
+
+    dataset = LazyCsv('export.csv', dtype=TWEET_DTYPES)
+    assert dataset.read_columns(['Tweet_ID'])['Tweet_ID'].tolist() == IDS
+    labels = pd.read_csv('export.csv', dtype=str, keep_default_na=False)['is_disinfo'].tolist()
+    assert labels == ['True', 'False', 'true', '']
@@ -0,0 +1,43 @@
+import pytest
+import mime_utils
+from mime_utils import detect_content_type, extension_for
+
+
+@pytest.mark.parametrize('head, expected', [
+    (b'\xff\xd8\xff\xe0rest', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n....', 'image/png'),
+    (b'GIF89a......', 'image/gif'),
+    (b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'image/webp'),
+    (b'\x00\x00\x00\x18ftypmp42', 'video/mp4'),
+    (b'\x00\x00\x00\x14ftypqt  ', 'video/quicktime'),
+])
+def test_signatures_win_over_the_header(head, expected):
+    assert detect_content_type(head + b'\x00' * 1000, 'text/html; charset=utf-8') == expected
+
+
+def test_known_header_then_fallback(monkeypatch):
+    assert detect_content_type(b'unknown bytes', 'Image/PNG; q=1') == 'image/png'
+    assert detect_content_type(b'', 'image/gif') == 'image/gif'
+    monkeypatch.setattr(mime_utils, 'magic', None)
+    assert detect_content_type(b'unknown bytes', 'text/plain') == 'text/plain'
+    assert detect_content_type(b'unknown bytes') == 'application/octet-stream'
+
+
+def test_libmagic_sees_only_a_bounded_prefix(monkeypatch):
+    seen = []
+
+    class FakeMagic:
+        @staticmethod
+        def from_buffer(data, mime):
+            seen.append(len(data))
+            return 'application/pdf'
+
+    monkeypatch.setattr(mime_utils, 'magic', FakeMagic)
+    assert detect_content_type(b'%PDF' + b'x' * 10 ** 6) == 'application/pdf'
+    assert seen == [mime_utils.LIBMAGIC_PREFIX_BYTES]
+
+
+def test_extensions():
+    assert extension_for('video/quicktime') == '.mov'
+    assert extension_for('application/pdf') == '.jpg'
+    assert extension_for('application/pdf', '.mp4') == '.mp4'
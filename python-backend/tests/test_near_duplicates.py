@@ -0,0 +1,35 @@
+import pandas as pd
+
+from near_duplicates import NearDuplicateIndex, cluster_corpus
+
+BASE = 'Breaking: the election results were rigged in three states, share before they delete this'
+TEXTS = [
+    BASE,
+    'The dog park on Elm street reopens next Saturday with a new fence and water fountains',
+    BASE + ' https://t.co/abc123',
+    'BREAKING: the election results were rigged in three states!! share before they delete this',
+    '',
+    '',
+]
+IDS = ['1', '2', '3', '4', '5', '6']
+
+
+def test_cluster_corpus_joins_near_identical_texts():
+    clusters, sigs = cluster_corpus(IDS, pd.Series(TEXTS))
+
+    assert sigs.shape == (6, 128)
+    # Copies cluster under the first tweet; unrelated and empty texts stay alone
+    assert clusters.tolist() == ['1', '2', '1', '1', '5', '6']
+
+
+def test_index_assigns_clusters_and_survives_a_reload():
+    index = NearDuplicateIndex('near_dups.npz')
+    assert [index.add(tweet_id, text) for tweet_id, text in zip(IDS, TEXTS)] == ['1', '2', '1', '1', '5', '6']
+    assert index.add('3', 'anything') == '1'
+    index.save()
+
+    reloaded = NearDuplicateIndex('near_dups.npz')
+    assert len(reloaded) == 6
+    # Saved tweets are found through the sorted band arrays after a reload
+    assert reloaded.add('7', BASE + ' RT please') == '1'
+    assert reloaded.add('8', 'Completely different words about the weather in Montreal today') == '8'
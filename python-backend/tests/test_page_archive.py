@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+import main
+import tweet_pipeline
+from config import settings
+from page_archive import PageArchive, page_key
+from tweet_pipeline import build_tweet_record, process_tweet_record
+from domain_reputation import DomainReputationIndex
+from fakes import fake_gcp, search_tweets
+
+
+class Page(list):
+    next_cursor = None
+
+
+def archive_pages(archive, *pages):
+    for cursor, tweet_ids in pages:
+        archive.record(cursor, Page(search_tweets(tweet_ids)))
+
+
+def test_pages_are_deduplicated_by_content_not_cursor(workdir):
+    archive = PageArchive('(#f1) lang:en')
+    # Two runs both fetch their first page without a cursor
+    archive_pages(archive, (None, ['3', '2']), ('c1', ['1']), (None, ['5', '4']), ('c2', ['2', '3']))
+
+    assert [[tweet['rest_id'] for tweet in page['tweets']] for page in archive.raw_pages()] == [['3', '2'], ['1'], ['5', '4']]
+    assert [[tweet.id for tweet in page] for page in archive.pages()] == [['3', '2'], ['1'], ['5', '4']]
+    assert archive.stats()['tweets'] == 5
+
+
+def test_torn_last_line_is_skipped(workdir):
+    archive = PageArchive('q')
+    archive_pages(archive, (None, ['1']))
+    import gzip
+    with gzip.open(archive.path, 'at') as f:
+        f.write('{"query": "q", "cur')
+    assert len(list(archive.raw_pages())) == 1
+    assert page_key({'tweets': [{'tweet': {'rest_id': '9'}}]}) == frozenset({'9'})
+
+
+def test_replayed_record_only_merges_derived_fields(monkeypatch):
+    async def no_media(*args):
+        raise AssertionError('replay must not touch media')
+
+    monkeypatch.setattr(tweet_pipeline, 'upload_record_media', no_media)
+    gcp = fake_gcp()
+    gcp.db.documents['tweets'] = {'9': {'Tweet_count': 4, 'is_disinfo': 'true', 'Profile_Pic': 'gs://p/users/ann/a.jpg',
+                                        'Media_Files': 'gs://i/media/9/m.jpg'}}
+    record = build_tweet_record(search_tweets(['9'], text='see https://bad.com/x')[0], None, 'f1')
+    record['Expanded_Links'] = ['https://bad.com/x']
+
+    asyncio.run(process_tweet_record(None, gcp, None, DomainReputationIndex(['bad.com']), record))
+
+    document = gcp.db.documents['tweets']['9']
+    assert document['Tweet_count'] == 4 and document['is_disinfo'] == 'true'
+    assert document['Profile_Pic'] == 'gs://p/users/ann/a.jpg' and document['Media_Files'] == 'gs://i/media/9/m.jpg'
+    assert document['Low_Cred_Domains'] == 'bad.com' and document['Text'] == 'see https://bad.com/x'
+
+
+def test_replay_runs_without_a_cpu_pool_or_login(workdir, monkeypatch):
+    def no_pool():
+        raise AssertionError('replay must not start worker processes')
+
+    gcp = fake_gcp()
+    monkeypatch.setattr(main, 'GCPStorage', lambda: gcp)
+    monkeypatch.setattr(main, 'CpuPool', no_pool)
+    monkeypatch.setattr(main, 'print_tweet_structure', lambda tweet: None)
+    settings.queries = ('(#f1) lang:en',)
+    archive_pages(PageArchive(settings.queries[0]), (None, ['1', '2']), (None, ['1', '2']))
+
+    assert asyncio.run(main.main(replay=True)) is True
+    assert sorted(gcp.db.documents['tweets']) == ['1', '2']
+    assert 'Tweet_count' not in gcp.db.documents['tweets']['1']
@@ -0,0 +1,50 @@
+import asyncio
+import glob
+import time
+
+from profiling import RunProfiler, render_flamegraph
+
+
+async def blocks_the_loop():
+    await asyncio.sleep(0)
+    time.sleep(0.08)
+
+
+async def run():
+    await asyncio.gather(blocks_the_loop(), asyncio.sleep(0.01))
+
+
+def test_profile_names_the_blocking_call_and_writes_the_reports():
+    original_run = asyncio.events.Handle._run
+    with RunProfiler('profiles', interval=0.005, slow_seconds=0.05) as profiler:
+        asyncio.run(run())
+
+    monitor = profiler.monitor
+    assert asyncio.events.Handle._run is original_run
+    assert monitor.callbacks['blocks_the_loop'][0] >= 1
+    elapsed, _, name, sites = max(monitor.slow)
+    assert name == 'blocks_the_loop' and elapsed >= 0.08
+    # The sampled site points at the test's own line that slept
+    assert any('test_profiling.py:blocks_the_loop' in site for site, _ in sites)
+    assert sum(monitor.blocking.values()) > 0.07
+
+    stems = {path.rsplit('.', 1)[0] for path in glob.glob('profiles/profile-*')}
+    assert len(stems) == 1
+    stem = stems.pop()
+    with open(f"{stem}.txt", encoding='utf-8') as f:
+        report = f.read()
+    assert 'Slow callbacks (over 50 ms): ' in report and 'blocks_the_loop' in report
+    with open(f"{stem}.folded", encoding='utf-8') as f:
+        assert all(line.rsplit(' ', 1)[1].strip().isdigit() for line in f)
+    with open(f"{stem}.svg", encoding='utf-8') as f:
+        assert f.read().startswith('<svg')
+
+
+def test_flamegraph_widths_follow_the_sample_counts():
+    svg = render_flamegraph({'MainThread;a.py:main;a.py:work': 3, 'MainThread;a.py:main': 1, 'worker;b.py:<w>': 4}, 'run')
+
+    assert '<title>MainThread (4 samples, 50.0%)</title>' in svg
+    assert '<title>a.py:work (3 samples, 37.5%)</title>' in svg
+    # Labels are escaped
+    assert '<title>b.py:&lt;w&gt; (4 samples, 50.0%)</title>' in svg
+    assert 'width="800.00"' in svg
@@ -0,0 +1,32 @@
+import pandas as pd
+from review_queue import build_review_queue, duplicate_key_text, duplicate_keys, summarize_for_queue
+
+
+def test_duplicate_key_text_matches_the_vectorized_keys():
+    texts = pd.Series(['BREAKING: vote NOW! https://t.co/x #news', '  breaking vote now  @bot', None])
+    assert duplicate_keys(texts).tolist() == [duplicate_key_text(text) for text in texts]
+    assert duplicate_key_text(texts[0]) == 'breaking vote now'
+
+
+def test_queue_puts_the_most_uncertain_cluster_first_and_shows_it_once():
+    df = pd.DataFrame({
+        'Tweet_ID': ['1', '2', '3', '4', '5'],
+        'Text': ['sure thing', 'coin flip!', 'Coin flip', 'labeled', 'fairly sure'],
+        'is_disinfo': [None, None, None, 'true', None],
+    })
+    scores = pd.Series({0: 0.99, 1: 0.6, 2: 0.5, 4: 0.8})
+
+    queue = build_review_queue(df, scores)
+
+    # Row 2 is the most uncertain member of the coin flip cluster and stands for row 1
+    assert queue == [(2, [1]), (4, []), (0, [])]
+
+
+def test_summary_keeps_no_text_and_hashes_cluster_keys():
+    chunk = pd.DataFrame({'Tweet_ID': ['1', '2', '3'], 'Text': ['Same text!', 'same text', 'other'],
+                          'is_disinfo': [None, None, 'false'], 'disinfo_score': [0.4, 0.7, None]})
+    summary = summarize_for_queue(chunk)
+    assert 'Text' not in summary
+    assert summary.at[0, 'Cluster_ID'] == summary.at[1, 'Cluster_ID']
+    assert summary.at[2, 'Cluster_ID'] is None
+    assert summary['disinfo_score'].tolist()[:2] == [0.4, 0.7]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from search_index import SearchIndex, decode_postings, encode_postings, tokenize
+
+
+def test_postings_round_trip_with_empty_runs():
+    # Terms 0..3 hold [2, 5, 9], [], [0, 7], [4]
+    offsets = np.array([0, 3, 3, 5, 6], dtype=np.int64)
+    docs = np.array([2, 5, 9, 0, 7, 4], dtype=np.uint32)
+
+    deltas = encode_postings(offsets, docs)
+
+    assert deltas.tolist() == [2, 3, 4, 0, 7, 4]
+    assert decode_postings(offsets, deltas).tolist() == docs.tolist()
+    assert decode_postings(np.zeros(1, dtype=np.int64), encode_postings(np.zeros(1, dtype=np.int64), docs[:0])).tolist() == []
+
+
+def test_tokenize_drops_links_and_hashtag_signs():
+    assert tokenize('Go #F1 @Team https://t.co/x!') == ['go', 'f1', 'team']
+    assert tokenize(None) == []
+
+
+def test_search_ranks_by_bm25_across_saved_and_unsaved_tweets():
+    index = SearchIndex('search.npz')
+    assert index.add_many(['1', '2', '3'], [
+        'vaccine vaccine side effects hidden',
+        'vaccine appointment booked for tuesday in the city centre near the station',
+        'race results from the grand prix',
+    ]) == 3
+    assert not index.add('1', 'again')
+    index.save()
+
+    reloaded = SearchIndex('search.npz')
+    assert reloaded.add('4', 'hidden vaccine files')
+    assert len(reloaded) == 4 and '4' in reloaded
+
+    results = reloaded.search('vaccine')
+    assert [tweet_id for tweet_id, _ in results] == ['1', '4', '2']
+    assert results[0][1] > results[1][1] > results[2][1] > 0
+    assert [tweet_id for tweet_id, _ in reloaded.search('hidden vaccine', match_all=True)] == ['4', '1']
+    assert reloaded.search('vaccine prix', match_all=True) == []
+    assert reloaded.search('vaccine', limit=1)[0][0] == '1'
+    assert reloaded.search('unknown') == []
+
+    # Folding the delta in and reloading gives the same ranking
+    reloaded.save()
+    assert SearchIndex('search.npz').search('vaccine') == results
@@ -0,0 +1,105 @@
+import re
+import asyncio
+
+import streaming
+from config import settings
+from fakes import search_tweets
+from graceful_shutdown import GracefulShutdown
+from page_archive import PageArchive
+from streaming import QueryWatermark, load_watermarks, poll, save_watermarks, streaming_query
+
+PAGE_SIZE = 2
+
+
+class FakePage(list):
+    def __init__(self, ids, rest):
+        super().__init__(search_tweets(ids))
+        self.rest = rest
+        self.next_cursor = f"after:{ids[-1]}" if ids else None
+
+    async def next(self):
+        return FakePage(self.rest[:PAGE_SIZE], self.rest[PAGE_SIZE:])
+
+
+class FakeSearch:
+    """Latest search over a growing set of tweet IDs, honouring since_id and max_id"""
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.queries = []
+
+    async def search_tweet(self, query, product):
+        assert product == 'Latest'
+        self.queries.append(query)
+        since = re.search(r'since_id:(\d+)', query)
+        until = re.search(r'max_id:(\d+)', query)
+        ids = sorted((i for i in self.ids if (not since or i > int(since.group(1))) and (not until or i <= int(until.group(1)))),
+                     reverse=True)
+        ids = [str(i) for i in ids]
+        return FakePage(ids[:PAGE_SIZE], ids[PAGE_SIZE:])
+
+
+class FakeCollector:
+    def __init__(self, fail_on=()):
+        self.ingested = []
+        self.fail_on = set(fail_on)
+
+    async def process_tweet(self, tweet, query):
+        if tweet.id in self.fail_on:
+            return False
+        self.ingested.append(tweet.id)
+        return True
+
+
+def run_polls(client, collector, watermark, count):
+    async def run():
+        shutdown = GracefulShutdown().install()
+        archive = PageArchive(watermark.query)
+        return [await poll(collector, client, watermark, archive, shutdown) for _ in range(count)]
+    return asyncio.run(run())
+
+
+def test_streaming_query_replaces_the_date_bounds():
+    query = '(#f1) lang:en until:2025-05-05 since:2025-01-01 -filter:retweets'
+    assert streaming_query(query, 5, 9) == '(#f1) lang:en -filter:retweets since_id:5 max_id:9'
+
+
+def test_page_limit_leaves_a_gap_that_later_polls_backfill(monkeypatch):
+    monkeypatch.setattr(streaming, 'PAGE_PAUSE_SECONDS', 0)
+    settings.stream_max_pages_per_poll = 2
+    client = FakeSearch(range(1, 11))
+    collector = FakeCollector()
+    watermark = QueryWatermark('#f1', since_id='2')
+
+    # A burst of 8 tweets: the poll stops after 2 pages, newest first
+    assert run_polls(client, collector, watermark, 1) == [(4, True)]
+    assert collector.ingested == ['7', '8', '9', '10']
+    assert watermark.since_id == '10' and watermark.gap == (2, 6)
+
+    client.ids += [11, 12]
+    results = run_polls(client, collector, watermark, 3)
+
+    # The gap is filled newest first, then the stream moves past the watermark again
+    assert results == [(4, True), (0, False), (2, False)]
+    assert collector.ingested == ['7', '8', '9', '10', '6', '5', '4', '3', '11', '12']
+    assert [query.split(' ', 1)[1] for query in client.queries] == [
+        'since_id:2', 'since_id:2 max_id:6', 'since_id:2 max_id:2', 'since_id:10']
+    assert watermark.since_id == '12' and watermark.gap is None
+    assert len(list(PageArchive('#f1').raw_pages())) == 5
+
+
+def test_a_failed_tweet_keeps_the_rest_of_the_gap(monkeypatch):
+    monkeypatch.setattr(streaming, 'PAGE_PAUSE_SECONDS', 0)
+    settings.stream_max_pages_per_poll = 5
+    collector = FakeCollector(fail_on={'4'})
+    watermark = QueryWatermark('#f1', since_id='10', gap=(2, 6))
+
+    assert run_polls(FakeSearch(range(1, 11)), collector, watermark, 1) == [(2, True)]
+    assert collector.ingested == ['6', '5']
+    assert watermark.gap == (2, 4)
+
+    # The gap survives a restart
+    save_watermarks({'#f1': watermark})
+    restored = load_watermarks(['#f1', '#motogp'])
+    assert restored['#f1'].gap == (2, 4) and restored['#f1'].since_id == '10'
+    assert restored['#motogp'].since_id is None
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fakes import fake_gcp
+from tweet_sequence import TweetSequence, migrate, plan_migration
+
+
+@pytest.fixture
+def gcp(monkeypatch):
+    """A fake project whose counter leases run under one lock, like the Firestore transaction"""
+    gcp = fake_gcp()
+    lock = threading.Lock()
+    leases = []
+
+    def lease(self, size, floor=0):
+        with lock:
+            snapshot = self.counter.get()
+            start = max(int(snapshot.to_dict()['next']) if snapshot.exists else 1, floor)
+            self.counter.set({'next': start + size})
+            leases.append((start, size))
+            return start
+
+    monkeypatch.setattr(TweetSequence, '_lease', lease)
+    gcp.leases = leases
+    return gcp
+
+
+def test_concurrent_collectors_never_share_a_number(gcp):
+    first, second = TweetSequence(gcp, block_size=10), TweetSequence(gcp, block_size=10)
+    assert [first.next(), second.next(), first.next()] == [1, 11, 2]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        numbers = list(executor.map(lambda n: (first if n % 2 else second).next(), range(200)))
+
+    assert len(set(numbers)) == 200 and not {1, 2, 11} & set(numbers)
+    assert first.blocks + second.blocks == len(gcp.leases)
+    # Only the unused rest of each collector's current block is a gap
+    leased = gcp.db.documents['counters']['tweets']['next'] - 1
+    assert leased - 203 == first.stats()['left_in_block'] + second.stats()['left_in_block']
+
+
+def test_plan_keeps_the_oldest_holder_of_each_number():
+    counts = {'30': 1, '10': 1, '20': 2, '40': None, 'unknown_0': 2, '5': 3}
+
+    assert plan_migration(counts) == ['30', '40', 'unknown_0']
+
+
+def test_migrate_renumbers_past_the_highest_count(gcp):
+    tweets = gcp.db.documents['tweets'] = {'10': {'Tweet_count': 1}, '30': {'Tweet_count': 1}, '20': {'Tweet_count': 7},
+                                           '40': {'Text': 'no count'}}
+    gcp.db.documents['counters'] = {'tweets': {'next': 3}}
+
+    assert migrate(gcp, dry_run=True) == 2
+    assert tweets['30']['Tweet_count'] == 1 and not gcp.leases
+
+    assert migrate(gcp) == 2
+    assert {doc_id: doc['Tweet_count'] for doc_id, doc in tweets.items()} == {'10': 1, '30': 8, '20': 7, '40': 9}
+    assert tweets['40']['Text'] == 'no count'
+    # New collectors continue after the renumbered range
+    assert TweetSequence(gcp).next() == 10
+    assert migrate(gcp) == 0
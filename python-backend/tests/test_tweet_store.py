@@ -0,0 +1,69 @@
+import pandas as pd
+
+from tweet_store import TweetStore
+
+
+def tweets(start, count, **fields):
+    rows = [{
+        'Tweet_ID': str(start + i),
+        'Tweet_count': start + i,
+        'Username': f"user{i % 3}",
+        'Text': f"tweet {start + i}",
+        'Created_At': 'Mon Mar 03 10:00:00 +0000 2025',
+        'Hashtags': '#f1',
+        'is_disinfo': '',
+    } for i in range(count)]
+    for row in rows:
+        row.update(fields)
+    return rows
+
+
+def test_import_csv_writes_the_indexes_once(tmp_path, monkeypatch):
+    pd.DataFrame(tweets(100, 10)).to_csv('export.csv', index=False)
+    saved = []
+    save_index = TweetStore._save_index
+    monkeypatch.setattr(TweetStore, '_save_index', lambda self, key, index: (saved.append(key), save_index(self, key, index)))
+
+    store = TweetStore('store')
+    assert store.import_csv('export.csv', chunk_size=3) == 10
+
+    assert sorted(saved) == ['Tweet_ID', 'Username']
+    assert store.stats() == {'files': 4, 'rows': 10, 'tweets': 10}
+    # A fresh store reads the indexes back from disk
+    reloaded = TweetStore('store')
+    assert sorted(reloaded.get(['101', '109'])['Tweet_ID']) == ['101', '109']
+    assert sorted(reloaded.query(username='user1')['Tweet_ID']) == ['101', '104', '107']
+
+
+def test_import_firestore_indexes_every_chunk(monkeypatch):
+    class Doc:
+        def __init__(self, data):
+            self.data = data
+
+        def to_dict(self):
+            return self.data
+
+    class Gcp:
+        class db:
+            @staticmethod
+            def collection(name):
+                assert name == 'tweets'
+                return type('Collection', (), {'stream': staticmethod(lambda: [Doc(row) for row in tweets(200, 5)])})
+
+    store = TweetStore('store')
+    assert store.import_firestore(Gcp, chunk_size=2) == 5
+    assert sorted(TweetStore('store').get([str(i) for i in range(200, 205)])['Tweet_ID']) == [str(i) for i in range(200, 205)]
+
+
+def test_append_supersedes_and_compact_keeps_the_newest_copy():
+    store = TweetStore('store')
+    store.append(pd.DataFrame(tweets(100, 3)))
+    store.append(pd.DataFrame(tweets(101, 1, is_disinfo='True')))
+
+    assert store.get(['101'])['is_disinfo'].tolist() == ['true']
+    store.compact()
+
+    assert store.stats() == {'files': 1, 'rows': 3, 'tweets': 3}
+    reloaded = TweetStore('store')
+    assert reloaded.get(['101'])['is_disinfo'].tolist() == ['true']
+    assert reloaded.query(labeled=True)['Tweet_ID'].tolist() == ['101']
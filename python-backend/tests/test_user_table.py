@@ -0,0 +1,74 @@
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from fakes import fake_gcp
+from gcp_utils import BatchWriteError
+from user_table import UserTable, aggregate_accounts, read_user_table, user_features
+
+
+def user(user_id, **fields):
+    return SimpleNamespace(id=user_id, screen_name=f"u{user_id}", name=f"User {user_id}", **fields)
+
+
+def test_failed_users_stay_dirty_and_the_table_is_written_on_save(monkeypatch):
+    monkeypatch.setattr('gcp_utils.time.sleep', lambda seconds: None)
+    gcp = fake_gcp(failing_documents={'2'})
+    users = UserTable(gcp, path='users.parquet')
+    assert users.observe(user_features(user(1, followers_count=10)))
+    assert users.observe(user_features(user(2)))
+    # Later sightings of a user are not written again
+    assert not users.observe(user_features(user(1, followers_count=99)))
+
+    with pytest.raises(BatchWriteError):
+        users.flush()
+    assert users.dirty == {'2'}
+    assert gcp.db.documents['users']['1']['Followers'] == 10
+    assert not os.path.exists('users.parquet')
+
+    gcp.db.failing.clear()
+    assert users.flush() == 1
+    assert users.flush() == 0
+
+    assert users.save() == 2
+    assert users.save() == 0
+    assert sorted(read_user_table('users.parquet')['User_ID']) == ['1', '2']
+
+    # A second run merges its users into the table instead of replacing it
+    later = UserTable(path='users.parquet')
+    later.observe(user_features(user(1, followers_count=20)))
+    later.observe(user_features(user(3)))
+    later.save()
+    table = read_user_table('users.parquet').set_index('User_ID')
+    assert sorted(table.index) == ['1', '2', '3']
+    assert table.loc['1', 'Followers'] == 20
+
+
+def test_aggregate_accounts_flags_shared_texts_and_avatars():
+    tweets = pd.DataFrame({
+        'User_ID': ['1', '1', '2', '3', None],
+        'Username': ['a', 'a', 'b', 'c', 'legacy'],
+        'Text': ['Vote now! https://t.co/x', 'vote now', 'VOTE NOW', 'unrelated', 'old tweet'],
+        'Created_At': ['Mon Mar 03 10:00:00 +0000 2025', 'Wed Mar 05 10:00:00 +0000 2025',
+                       'Mon Mar 03 11:00:00 +0000 2025', 'Mon Mar 03 12:00:00 +0000 2025',
+                       'Mon Mar 03 13:00:00 +0000 2025'],
+        'Profile_Pic_Hash': ['aa', 'aa', 'aa', 'bb', ''],
+    })
+    users = pd.DataFrame({'User_ID': ['1'], 'User_Created_At': ['Mon Jan 01 00:00:00 +0000 2024'],
+                          'Statuses': [100], 'Followers': [50], 'Following': [0],
+                          'Verified': [False], 'Blue_Verified': [True], 'Default_Profile_Image': [False]})
+
+    signals = aggregate_accounts(tweets, users)
+
+    assert sorted(signals.index) == ['1', '2', '3', 'legacy']
+    assert signals.loc['1', 'Tweets'] == 2
+    assert signals.loc['1', 'Posting_Rate'] == 1.0
+    assert signals.loc['1', 'Duplicate_Text_Ratio'] == 0.5
+    assert signals.loc['2', 'Shared_Text_Ratio'] == 1.0
+    assert signals.loc['3', 'Shared_Text_Ratio'] == 0.0
+    assert signals.loc['1', 'Avatar_Group'] == signals.loc['2', 'Avatar_Group'] == 'aa'
+    assert signals.loc['1', 'Avatar_Group_Size'] == 2
+    assert signals.loc['3', 'Avatar_Group'] == ''
+    assert signals.loc['1', 'Follower_Ratio'] == 50
@@ -0,0 +1,91 @@
+import asyncio
+import tempfile
+import pytest
+from video_utils import download_video_to_file, get_video_variants, select_video_variant
+
+
+class FakeContent:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error:
+            raise self.error
+
+
+class FakeResponse:
+    def __init__(self, chunks, error=None, status=200, content_length=None):
+        self.status = status
+        self.content_length = content_length
+        self.headers = {'Content-Type': 'video/mp4'}
+        self.content = FakeContent(chunks, error)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.timeouts = []
+
+    def get(self, url, timeout=None):
+        self.timeouts.append(timeout)
+        return self.response
+
+
+@pytest.fixture
+def tmpdir_files(workdir, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(workdir))
+    return lambda: sorted(path.name for path in workdir.iterdir())
+
+
+def test_variants_and_selection():
+    item = type('Media', (), {'video_info': {'variants': [
+        {'content_type': 'video/mp4', 'bitrate': 2176000, 'url': 'hi'},
+        {'content_type': 'application/x-mpegURL', 'url': 'hls'},
+        {'content_type': 'video/mp4', 'bitrate': 632000, 'url': 'mid'},
+        {'content_type': 'video/mp4', 'bitrate': 256000, 'url': 'lo'},
+    ]}})()
+    variants = get_video_variants(item)
+    assert sorted(variants) == [(256000, 'lo'), (632000, 'mid'), (2176000, 'hi')]
+    assert select_video_variant(variants, 600000) == 'mid'
+    assert select_video_variant(variants, 5000000) == 'hi'
+    assert select_video_variant([]) is None
+
+
+def test_download_streams_to_a_file_without_a_total_timeout(tmpdir_files):
+    session = FakeSession(FakeResponse([b'ab', b'cd']))
+    path, content_type = asyncio.run(download_video_to_file(session, 'url', max_bytes=10))
+    with open(path, 'rb') as f:
+        assert f.read() == b'abcd'
+    assert content_type == 'video/mp4'
+    timeout = session.timeouts[0]
+    assert timeout.total is None and timeout.sock_read and timeout.sock_connect
+
+
+def test_failed_download_leaves_no_temp_file(tmpdir_files):
+    session = FakeSession(FakeResponse([b'ab'], error=ConnectionResetError('reset')))
+    assert asyncio.run(download_video_to_file(session, 'url', max_bytes=10)) == (None, None)
+    assert tmpdir_files() == []
+
+
+def test_cancelled_download_leaves_no_temp_file(tmpdir_files):
+    session = FakeSession(FakeResponse([b'ab'], error=asyncio.CancelledError()))
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(download_video_to_file(session, 'url', max_bytes=10))
+    assert tmpdir_files() == []
+
+
+def test_oversized_video_is_dropped(tmpdir_files):
+    session = FakeSession(FakeResponse([b'abcd'] * 3))
+    assert asyncio.run(download_video_to_file(session, 'url', max_bytes=10)) == (None, None)
+    assert tmpdir_files() == []
+    session = FakeSession(FakeResponse([], content_length=11))
+    assert asyncio.run(download_video_to_file(session, 'url', max_bytes=10)) == (None, None)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import pytest
+import work_queue
+import media_worker
+from work_queue import SQLiteWorkQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(workdir, clock):
+    queue = SQLiteWorkQueue('queue.sqlite3', lease_seconds=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def test_enqueue_is_idempotent_and_a_lease_hides_the_job(queue):
+    queue.enqueue('1', {'Tweet_ID': '1'})
+    queue.enqueue('1', {'Tweet_ID': 'changed'})
+    [job] = queue.lease(5)
+    assert (job.job_id, job.payload, job.attempts) == ('1', {'Tweet_ID': '1'}, 1)
+    assert queue.lease(5) == []
+    queue.ack(job)
+    assert queue.stats() == {'ready': 0, 'leased_or_waiting': 0, 'dead': 0}
+
+
+def test_expired_lease_goes_to_another_worker_then_to_dead_letters(queue, clock):
+    queue.enqueue('1', {'n': 1})
+    first = queue.lease()[0]
+
+    # The worker died: once the lease runs out the job is handed out again
+    clock.now += 61
+    second = queue.lease()[0]
+    assert second.attempts == 2 and second.token != first.token
+    # The first worker's late ack no longer owns the job
+    queue.ack(first)
+    assert queue.stats()['leased_or_waiting'] == 1
+
+    clock.now += 61
+    assert queue.lease() == []
+    assert queue.stats() == {'ready': 0, 'leased_or_waiting': 0, 'dead': 1}
+
+    assert queue.requeue_dead() == 1
+    assert queue.lease()[0].attempts == 1
+
+
+def test_failures_back_off_then_dead_letter(queue, clock):
+    queue.enqueue('1', {})
+    job = queue.lease()[0]
+    queue.fail(job, 'boom')
+    assert queue.lease() == []
+    clock.now += work_queue.RETRY_BASE_SECONDS
+    job = queue.lease()[0]
+    queue.fail(job, 'boom again')
+    assert queue.stats()['dead'] == 1
+    assert queue.conn.execute('SELECT last_error FROM dead_letters').fetchone()[0] == 'boom again'
+
+
+def test_release_does_not_count_the_attempt(queue):
+    queue.enqueue('1', {})
+    queue.release(queue.lease()[0])
+    assert queue.lease()[0].attempts == 1
+
+
+class ThreadRecordingQueue:
+    """Records which thread each queue call ran on"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, threading.get_ident()))
+
+
+def test_cancelled_job_is_released_off_the_event_loop(monkeypatch):
+    async def stuck(*args):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(media_worker, 'process_tweet_record', stuck)
+    queue = ThreadRecordingQueue()
+
+    async def run():
+        task = asyncio.create_task(media_worker.process_job(queue, None, None, None, None, work_queue.Job('1', {}, 1, 't')))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert [name for name, _ in queue.calls] == ['release']
+    assert queue.calls[0][1] != loop_thread
+
+
+def test_fetch_only_mode_enqueues_off_the_event_loop(monkeypatch):
+    import main
+    from main import Collector
+
+    monkeypatch.setattr(main, 'print_tweet_structure', lambda tweet: None)
+    user = SimpleNamespace(id='7', name='ann', screen_name='ann', profile_image_url=None)
+    tweet = SimpleNamespace(id='42', text='hello', user=user, media=None, created_at='now',
+                            retweet_count=0, favorite_count=0, urls=None)
+    users = SimpleNamespace(observe=lambda features: True)
+    clusters = SimpleNamespace(add=lambda tweet_id, text: 'c1')
+    sequence = SimpleNamespace(next=lambda: 5)
+    queue = ThreadRecordingQueue()
+    collector = Collector(None, None, None, queue, None, users, clusters, None, sequence)
+
+    async def run():
+        assert await collector.process_tweet(tweet, '(#f1) lang:en')
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert [name for name, _ in queue.calls] == ['enqueue']
+    assert queue.calls[0][1] != loop_thread
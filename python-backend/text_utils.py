@@ -6,6 +6,19 @@ def extract_links(text):
     pattern = r'https?://t\.co/\w+'
     return re.findall(pattern, text)
 
+def extract_expanded_links(tweet):
+    """Get the destination URLs X already resolved for the tweet's t.co links"""
+    urls = getattr(tweet, 'urls', None) or []
+    expanded = []
+    for url in urls:
+        if isinstance(url, dict):
+            link = url.get('expanded_url') or url.get('url')
+        else:
+            link = getattr(url, 'expanded_url', None)
+        if link:
+            expanded.append(link)
+    return expanded
+
 def extract_hashtags(text):
     """Extract hashtags from tweet text"""
     if not text:
@@ -1,15 +1,14 @@
 from datetime import datetime
 import asyncio
 from random import randint
-from config import QUERY
 
 # Make get_tweets an async function
-async def get_tweets(client, tweets): 
+async def get_tweets(client, query, tweets, cursor=None): 
     if tweets is None:
         #* get tweets
         print(f'{datetime.now()} - Getting tweets...')
-        # Use await for async methods
-        tweets = await client.search_tweet(QUERY, product='Top')
+        # Use await for async methods, a cursor resumes an interrupted run
+        tweets = await client.search_tweet(query, product='Top', cursor=cursor)
     else:
         wait_time = randint(8, 15)
         print(f'{datetime.now()} - Getting next tweets after {wait_time} seconds ...')
@@ -0,0 +1,169 @@
+import asyncio
+from datetime import datetime
+from text_utils import extract_links, extract_expanded_links
+from media_utils import download_media_to_memory, download_profile_to_memory, image_fingerprint
+from video_utils import get_video_variants, handle_video
+from user_table import user_features
+
+
+def build_tweet_record(tweet, tweet_count, hashtag):
+    """Copy everything needed from a twikit tweet into a plain, JSON-serializable dict.
+
+    The record holds the text fields plus the media URLs still to be downloaded,
+    so it can be processed in this process or queued for a media worker.
+    """
+    tweet_text = tweet.text.replace('\n', ' ') if tweet.text else ''
+
+    profile_pic_url = None
+    if hasattr(tweet.user, 'profile_image_url') and tweet.user.profile_image_url:
+        # Get original size by removing _normal
+        profile_pic_url = tweet.user.profile_image_url.replace('_normal', '')
+
+    media = []
+    for media_item in getattr(tweet, 'media', None) or []:
+        media.append({
+            'type': getattr(media_item, 'type', 'photo'),
+            'media_url': getattr(media_item, 'media_url', None),
+            'variants': get_video_variants(media_item),
+        })
+
+    user = user_features(tweet.user)
+
+    return {
+        'Tweet_count': tweet_count,
+        'Username': tweet.user.name if tweet.user else 'N/A',
+        'User_ID': user.get('User_ID'),
+        'Text': tweet_text,
+        'Created_At': str(tweet.created_at if tweet.created_at else 'N/A'),
+        'Retweets': tweet.retweet_count if tweet.retweet_count is not None else 0,
+        'Likes': tweet.favorite_count if tweet.favorite_count is not None else 0,
+        'Tweet_ID': tweet.id if hasattr(tweet, 'id') else f"unknown_{tweet_count}",
+        'T_co_Links': extract_links(tweet_text),
+        'Expanded_Links': extract_expanded_links(tweet),
+        'Hashtags': hashtag,
+        'Profile_Pic_Url': profile_pic_url,
+        'Media': media,
+        # Account fields for the users collection, not part of the tweet document
+        'User': user,
+    }
+
+
+async def upload_record_media(session, gcp, cpu, record):
+    """Download and upload a record's profile picture and media, return the media fields of its document.
+
+    Media errors are logged and skipped.
+    """
+    tweet_id = record['Tweet_ID']
+    user_name = record['Username']
+
+    # Download and directly upload profile picture to GCP
+    profile_pic_path = ""
+    profile_pic_hash = ""
+    profile_pic_url = record.get('Profile_Pic_Url')
+    if profile_pic_url:
+        print(f"Found profile image URL: {profile_pic_url}")
+        try:
+            # Download to memory then upload directly to GCP
+            profile_data, profile_type = await download_profile_to_memory(session, profile_pic_url)
+            if profile_data:
+                profile_pic_path = await asyncio.to_thread(
+                    gcp.upload_profile_pic_from_memory, profile_data, tweet_id, user_name, profile_type
+                )
+                print(f"{datetime.now()} - Uploaded profile picture to GCP")
+                profile_pic_hash = (await cpu.run(image_fingerprint, profile_data))['ahash']
+        except Exception as e:
+            print(f"{datetime.now()} - Error handling profile picture: {e}")
+
+    # Download and directly upload media content to GCP
+    media_paths = []
+    video_paths = []
+    media_hashes = []
+
+    for i, media_item in enumerate(record.get('Media') or []):
+        try:
+            # Videos and GIFs: upload a size-capped variant plus a keyframe thumbnail
+            if media_item['type'] in ('video', 'animated_gif'):
+                video_path, thumbnail_path = await handle_video(session, gcp, cpu, media_item['variants'], tweet_id, i)
+                if video_path:
+                    video_paths.append(video_path)
+                if thumbnail_path:
+                    media_paths.append(thumbnail_path)
+                    continue
+                # Without a thumbnail, fall back to the poster frame below
+
+            media_url = media_item.get('media_url')
+            if not media_url:
+                continue
+            print(f"Found media URL: {media_url}")
+
+            # Download to memory then upload directly to GCP
+            media_data, media_type = await download_media_to_memory(session, media_url)
+            if media_data:
+                cloud_path = await asyncio.to_thread(
+                    gcp.upload_media_file_from_memory, media_data, tweet_id, i, media_type
+                )
+                media_paths.append(cloud_path)
+                print(f"{datetime.now()} - Uploaded media {i} to GCP")
+                media_hashes.append((await cpu.run(image_fingerprint, media_data))['ahash'])
+        except Exception as e:
+            print(f"{datetime.now()} - Error handling media {i}: {e}")
+
+    return {
+        'Profile_Pic': profile_pic_path,
+        'Profile_Pic_Hash': profile_pic_hash,
+        'Media_Files': '|'.join(media_paths),
+        'Video_Files': '|'.join(video_paths),
+        'Media_Hashes': '|'.join(media_hashes),
+    }
+
+
+async def process_tweet_record(session, gcp, cpu, reputation, record):
+    """Download and upload a record's media, then write its tweet document to Firestore.
+
+    Replayed records (no Tweet_count) skip the media: their document keeps
+    the stored paths and only the derived fields are merged into it.
+    Media errors are logged and skipped; a failed Firestore write raises so
+    the caller can retry the whole record.
+    """
+    tweet_id = record['Tweet_ID']
+    user_name = record['Username']
+    print(f"\n{datetime.now()} - Processing tweet ID: {tweet_id}")
+
+    # Replayed records carry no Tweet_count: their media is already in GCS
+    # and the stored document keeps its ordering and any human label
+    replayed = record['Tweet_count'] is None
+    media_fields = {} if replayed else await upload_record_media(session, gcp, cpu, record)
+
+    tweet_json = {
+        'Tweet_count': record['Tweet_count'],
+        'Username': user_name,
+        'User_ID': record.get('User_ID'),
+        'Text': record['Text'],
+        'Created_At': record['Created_At'],
+        'Retweets': record['Retweets'],
+        'Likes': record['Likes'],
+        'Tweet_ID': tweet_id,
+        **media_fields,
+        'T_co_Links': '|'.join(record['T_co_Links']),
+        'Expanded_Links': '|'.join(record['Expanded_Links']),
+        'Hashtags': record['Hashtags'],
+        'is_disinfo': ''
+    }
+
+    # Near-duplicate cluster assigned at ingestion, see near_duplicates.py
+    if record.get('Cluster_ID'):
+        tweet_json['Cluster_ID'] = record['Cluster_ID']
+
+    # Flag links to low-credibility domains
+    reputation.annotate_tweet(tweet_json, record['Expanded_Links'])
+    if tweet_json['has_low_cred_link']:
+        print(f"Links to low-credibility domains: {tweet_json['Low_Cred_Domains']}")
+
+    # Only the re-derived fields are merged into a replayed document
+    if replayed:
+        del tweet_json['Tweet_count']
+        del tweet_json['is_disinfo']
+
+    await asyncio.to_thread(gcp.save_tweet_json, tweet_json, str(tweet_id), replayed)
+    print(f"{datetime.now()} - Saved tweet {tweet_id} to Firestore")
+    return tweet_json
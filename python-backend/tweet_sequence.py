@@ -0,0 +1,150 @@
+import sys
+import argparse
+import threading
+from datetime import datetime
+from config import settings, parse_args
+
+COUNTER_COLLECTION = 'counters'
+TWEET_COUNTER = 'tweets'
+
+
+def highest_tweet_count(gcp):
+    """The highest Tweet_count stored in Firestore, 0 for an empty collection"""
+    query = gcp.db.collection('tweets').order_by('Tweet_count', direction='DESCENDING').limit(1)
+    for doc in query.stream():
+        return int(doc.to_dict().get('Tweet_count') or 0)
+    return 0
+
+
+def tweet_id_order(doc_id):
+    """Sort key of a tweet document ID: tweet IDs are snowflakes, so numeric order is posting order"""
+    return (0, int(doc_id)) if str(doc_id).isdigit() else (1, str(doc_id))
+
+
+class TweetSequence:
+    """Tweet_count numbers that stay unique across concurrent collectors.
+
+    A Firestore counter document holds the next unleased number. Each
+    collector leases a block of block_size numbers from it in a transaction
+    and hands them out locally, so it only touches the counter once per
+    block. Numbers increase within a collector and blocks interleave
+    across collectors; the unused rest of a block is left as a gap.
+    """
+
+    def __init__(self, gcp, block_size=None, name=TWEET_COUNTER):
+        self.gcp = gcp
+        self.block_size = block_size or settings.tweet_count_block_size
+        self.counter = gcp.db.collection(COUNTER_COLLECTION).document(name)
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+        self.blocks = 0
+
+    def _lease(self, size, floor=0):
+        """Reserve [start, start + size) on the counter, with start at least floor.
+
+        The first lease seeds the counter from the stored tweets.
+        """
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def lease(transaction):
+            snapshot = self.counter.get(transaction=transaction)
+            if snapshot.exists:
+                start = max(int(snapshot.to_dict()['next']), floor)
+            else:
+                start = max(highest_tweet_count(self.gcp) + 1, floor)
+                print(f"{datetime.now()} - Starting the {self.counter.id} counter at {start}")
+            transaction.set(self.counter, {'next': start + size, 'updated_at': firestore.SERVER_TIMESTAMP})
+            return start
+
+        return lease(self.gcp.db.transaction())
+
+    def next(self):
+        """The next Tweet_count, leasing a new block when this one is used up"""
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._lease(self.block_size)
+                self._end = self._next + self.block_size
+                self.blocks += 1
+            number = self._next
+            self._next += 1
+            return number
+
+    def reserve(self, count, floor=0):
+        """A contiguous range of count numbers, leased in one go, none below floor"""
+        start = self._lease(count, floor)
+        return range(start, start + count)
+
+    def stats(self):
+        return {'counter': self.counter.id, 'block_size': self.block_size, 'blocks_leased': self.blocks,
+                'left_in_block': max(self._end - self._next, 0)}
+
+
+def plan_migration(counts):
+    """Tweet documents that need a new Tweet_count, in the order to number them.
+
+    counts maps document ID to its stored Tweet_count (None if missing).
+    The oldest tweet holding a number keeps it; later tweets sharing it,
+    and tweets without one, are renumbered in tweet ID order.
+    """
+    kept = set()
+    renumber = []
+    for doc_id in sorted(counts, key=lambda doc_id: (counts[doc_id] is None, counts[doc_id] or 0, tweet_id_order(doc_id))):
+        count = counts[doc_id]
+        if count is None or count in kept:
+            renumber.append(doc_id)
+        else:
+            kept.add(count)
+    return sorted(renumber, key=tweet_id_order)
+
+
+def migrate(gcp, dry_run=False):
+    """Make every stored Tweet_count unique and start the counter past the highest one"""
+    counts = {}
+    for doc in gcp.db.collection('tweets').select(['Tweet_count']).stream():
+        value = (doc.to_dict() or {}).get('Tweet_count')
+        counts[doc.id] = None if value is None else int(value)
+    renumber = plan_migration(counts)
+    highest = max((count for count in counts.values() if count is not None), default=0)
+    print(f"{datetime.now()} - {len(counts)} tweets, highest Tweet_count {highest}, "
+          f"{len(renumber)} duplicate or missing counts to renumber")
+    if dry_run:
+        return len(renumber)
+
+    # Leased past the highest stored number, which also moves a counter
+    # lagging behind it; collectors running meanwhile lease after this range
+    sequence = TweetSequence(gcp)
+    numbers = sequence.reserve(len(renumber), floor=highest + 1)
+    if renumber:
+        # update, not merge: a tweet deleted since the scan is not recreated
+        gcp.update_tweets_batch({doc_id: {'Tweet_count': number} for doc_id, number in zip(renumber, numbers)}, merge=False)
+    print(f"{datetime.now()} - Counter {sequence.counter.id} now at {sequence.counter.get().to_dict()['next']}")
+    return len(renumber)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tweet_count counter shared by concurrent collectors')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Show the counter and the highest stored Tweet_count')
+    migrate_parser = subparsers.add_parser('migrate', help='Renumber duplicate or missing Tweet_counts and start the counter after the highest')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='Only count the documents to renumber')
+    args = parse_args(parser)
+
+    from gcp_utils import GCPStorage, BatchWriteError
+    gcp = GCPStorage()
+    if args.command == 'migrate':
+        try:
+            migrate(gcp, args.dry_run)
+        except BatchWriteError as e:
+            # Rerunning renumbers whatever is still duplicated or missing
+            print(f"{datetime.now()} - Migration incomplete: {e}; run it again")
+            sys.exit(1)
+    else:
+        snapshot = gcp.db.collection(COUNTER_COLLECTION).document(TWEET_COUNTER).get()
+        print(f"Counter: {snapshot.to_dict() if snapshot.exists else 'not created yet'}")
+        print(f"Highest stored Tweet_count: {highest_tweet_count(gcp)}")
+
+
+if __name__ == "__main__":
+    main()
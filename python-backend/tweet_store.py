@@ -0,0 +1,414 @@
+import os
+import time
+import glob
+import argparse
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from lazy_csv import TWEET_DTYPES
+from config import settings, parse_args
+
+# Rows are sorted by Username inside each file, so with small row groups the
+# min/max statistics of most groups exclude any one user
+ROW_GROUP_SIZE = 4096
+TWIKIT_DATE_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+# Columns outside this schema are not stored; every part file has exactly these
+STORE_SCHEMA = pa.schema([
+    ('Tweet_ID', pa.string()),
+    ('Tweet_count', pa.int64()),
+    ('Username', DICTIONARY),
+    ('User_ID', pa.string()),
+    ('Text', pa.string()),
+    ('Created_At', pa.string()),
+    ('Created_Ts', pa.timestamp('us', tz='UTC')),
+    ('Retweets', pa.int64()),
+    ('Likes', pa.int64()),
+    ('Profile_Pic', pa.string()),
+    ('Profile_Pic_Hash', pa.string()),
+    ('Media_Files', pa.string()),
+    ('Video_Files', pa.string()),
+    ('Media_Hashes', pa.string()),
+    ('T_co_Links', pa.string()),
+    ('Expanded_Links', pa.string()),
+    ('Hashtags', DICTIONARY),
+    ('Cluster_ID', pa.string()),
+    ('is_disinfo', pa.string()),
+    ('Link_Domains', pa.string()),
+    ('Low_Cred_Domains', pa.string()),
+    ('has_low_cred_link', pa.bool_()),
+    ('disinfo_score', pa.float64()),
+    # Write order; the highest _seq wins when a tweet was stored more than once
+    ('_seq', pa.int64()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('query', pa.string()), ('month', pa.string())]), flavor='hive')
+
+
+def parse_created_at(values):
+    """Parse Created_At strings (twikit's format, or anything pandas understands) to UTC timestamps"""
+    parsed = pd.to_datetime(values, format=TWIKIT_DATE_FORMAT, errors='coerce', utc=True)
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], errors='coerce', utc=True, format='mixed')
+    return parsed
+
+
+def to_utc(value):
+    """Timestamp for a date string or datetime, treating naive values as UTC"""
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+
+def normalize_label(value):
+    """Map is_disinfo values from CSVs and Firestore to 'true', 'false' or ''"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    value = str(value).strip().lower()
+    return value if value in ('true', 'false') else ''
+
+
+def conform(df, seq):
+    """Return df as a table with exactly STORE_SCHEMA, plus its partition keys"""
+    df = df.reset_index(drop=True)
+    columns = {}
+    for field in STORE_SCHEMA:
+        name = field.name
+        if name == '_seq':
+            values = pd.Series(seq, index=df.index, dtype='int64')
+        elif name == 'Created_Ts':
+            values = parse_created_at(df['Created_At'].astype(object)) if 'Created_At' in df else pd.Series(pd.NaT, index=df.index)
+        elif name not in df:
+            values = pd.Series(None, index=df.index, dtype=object)
+        elif name == 'is_disinfo':
+            values = df[name].map(normalize_label)
+        elif name == 'Tweet_ID':
+            values = df[name].map(lambda v: None if pd.isna(v) else str(int(v)) if isinstance(v, float) else str(v))
+        elif pa.types.is_integer(field.type):
+            values = pd.to_numeric(df[name], errors='coerce').astype('Int64')
+        elif pa.types.is_floating(field.type):
+            values = pd.to_numeric(df[name], errors='coerce')
+        elif pa.types.is_boolean(field.type):
+            values = df[name].map(lambda v: str(v).strip().lower() == 'true' if pd.notna(v) else None)
+        else:
+            values = df[name].map(lambda v: None if pd.isna(v) else str(v))
+        columns[name] = values
+
+    table = pa.Table.from_pandas(pd.DataFrame(columns), schema=STORE_SCHEMA, preserve_index=False)
+
+    months = columns['Created_Ts'].dt.strftime('%Y-%m').fillna('unknown')
+    queries = columns['Hashtags'].fillna('').replace('', 'none')
+    return table, queries, months
+
+
+class TweetStore:
+    """Local Parquet copy of the tweets, partitioned by query and month.
+
+    Layout: {directory}/query={hashtag}/month={YYYY-MM}/part-*.parquet, plus
+    _index/tweet_ids.parquet and _index/usernames.parquet mapping keys to
+    (file, row_group) so point lookups read single row groups.
+    """
+
+    def __init__(self, directory=None):
+        directory = directory or settings.tweet_store_dir
+        self.directory = directory
+        self.index_dir = os.path.join(directory, '_index')
+        self._indexes = {}
+
+    # Indexes
+
+    def _index_path(self, key):
+        return os.path.join(self.index_dir, f"{key.lower()}s.parquet")
+
+    def _load_index(self, key):
+        """Return the (key, file, row_group) index for Tweet_ID or Username"""
+        if key not in self._indexes:
+            path = self._index_path(key)
+            if os.path.exists(path):
+                self._indexes[key] = pq.read_table(path).to_pandas()
+            else:
+                self._indexes[key] = pd.DataFrame({key: pd.Series(dtype=object), 'file': pd.Series(dtype=object),
+                                                   'row_group': pd.Series(dtype='int32')})
+        return self._indexes[key]
+
+    def _save_index(self, key, index):
+        os.makedirs(self.index_dir, exist_ok=True)
+        index = index.drop_duplicates().reset_index(drop=True)
+        table = pa.Table.from_pandas(index, preserve_index=False)
+        pq.write_table(table, self._index_path(key), use_dictionary=['file'], compression='zstd')
+        self._indexes[key] = index
+
+    def _index_entries(self, table, relative_path):
+        """Build the index rows for one freshly written part file"""
+        row_groups = pd.Series(range(table.num_rows), dtype='int64') // ROW_GROUP_SIZE
+        entries = {}
+        for key in ('Tweet_ID', 'Username'):
+            values = table.column(key).to_pandas().astype(object)
+            entries[key] = pd.DataFrame({
+                key: values,
+                'file': relative_path,
+                'row_group': row_groups.astype('int32'),
+            }).dropna(subset=[key]).drop_duplicates()
+        return entries
+
+    # Writing
+
+    def _write_part(self, table, query, month, seq, number):
+        """Write one sorted part file and return its index rows"""
+        relative_path = os.path.join(f"query={query}", f"month={month}", f"part-{seq}-{number}.parquet")
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Dictionary columns can't be sort keys, sort on the decoded names
+        keys = pa.table({'user': table.column('Username').cast(pa.string()), 'ts': table.column('Created_Ts')})
+        table = table.take(pc.sort_indices(keys, sort_keys=[('user', 'ascending'), ('ts', 'ascending')]))
+        pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression='zstd',
+                       use_dictionary=['Username', 'Hashtags', 'is_disinfo'], write_statistics=True)
+        return self._index_entries(table, relative_path)
+
+    def _write_parts(self, df, new_entries):
+        """Write df as part files, adding their index rows to new_entries"""
+        if df is None or df.empty:
+            return 0
+
+        seq = time.time_ns()
+        table, queries, months = conform(df, seq)
+        keys = pd.DataFrame({'query': queries, 'month': months})
+
+        for number, ((query, month), group) in enumerate(keys.groupby(['query', 'month'], sort=False)):
+            part = table.take(pa.array(group.index.to_numpy()))
+            for key, entries in self._write_part(part, query, month, seq, number).items():
+                new_entries[key].append(entries)
+
+        print(f"{datetime.now()} - Stored {table.num_rows} tweets in {self.directory}")
+        return table.num_rows
+
+    def _extend_indexes(self, new_entries):
+        """Merge index rows into both index files, rewriting each file once"""
+        for key, entries in new_entries.items():
+            if entries:
+                self._save_index(key, pd.concat([self._load_index(key)] + entries, ignore_index=True))
+
+    def append(self, df):
+        """Add tweets as new part files; newer copies of a Tweet_ID supersede older ones"""
+        new_entries = {'Tweet_ID': [], 'Username': []}
+        total = self._write_parts(df, new_entries)
+        self._extend_indexes(new_entries)
+        return total
+
+    def import_csv(self, csv_path, chunk_size=None):
+        """Append an exported CSV in chunks, never holding the whole file.
+
+        The index rows of every chunk are kept and written once at the end; if
+        the import dies midway, compact rebuilds the indexes from the part files.
+        """
+        total = 0
+        chunk_size = chunk_size or settings.import_chunk_rows
+        new_entries = {'Tweet_ID': [], 'Username': []}
+        for chunk in pd.read_csv(csv_path, dtype=TWEET_DTYPES, chunksize=chunk_size):
+            total += self._write_parts(chunk, new_entries)
+        self._extend_indexes(new_entries)
+        return total
+
+    def import_firestore(self, gcp, chunk_size=None):
+        """Append the whole tweets collection, chunk_size documents at a time, indexing once at the end"""
+        chunk_size = chunk_size or settings.import_chunk_rows
+        total = 0
+        batch = []
+        new_entries = {'Tweet_ID': [], 'Username': []}
+        for doc in gcp.db.collection('tweets').stream():
+            batch.append(doc.to_dict())
+            if len(batch) >= chunk_size:
+                total += self._write_parts(pd.DataFrame(batch), new_entries)
+                batch = []
+        if batch:
+            total += self._write_parts(pd.DataFrame(batch), new_entries)
+        self._extend_indexes(new_entries)
+        return total
+
+    # Reading
+
+    @staticmethod
+    def _latest(table):
+        """Keep the newest copy of each Tweet_ID"""
+        if table.num_rows == 0:
+            return table.to_pandas()
+        df = table.to_pandas()
+        if '_seq' in df:
+            df = df.sort_values('_seq').drop_duplicates('Tweet_ID', keep='last')
+        return df.drop(columns=[c for c in ('_seq',) if c in df]).reset_index(drop=True)
+
+    def _read_row_groups(self, locations, expression=None, columns=None):
+        """Read only the given (file, row_group) pairs, filtering rows with expression"""
+        file_format = ds.ParquetFileFormat()
+        filesystem = pafs.LocalFileSystem()
+        tables = []
+        for relative_path, group in locations.groupby('file'):
+            path = os.path.join(self.directory, relative_path)
+            if not os.path.exists(path):
+                continue
+            fragment = file_format.make_fragment(path, filesystem=filesystem, row_groups=sorted(set(group['row_group'].tolist())))
+            tables.append(fragment.to_table(schema=STORE_SCHEMA, filter=expression, columns=columns))
+        if not tables:
+            return STORE_SCHEMA.empty_table().select(columns) if columns else STORE_SCHEMA.empty_table()
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    def dataset(self):
+        """The whole store as a pyarrow dataset with query/month partition columns"""
+        return ds.dataset(self.directory, format='parquet', partitioning=PARTITIONING,
+                          schema=pa.unify_schemas([STORE_SCHEMA, PARTITIONING.schema]))
+
+    def get(self, tweet_ids, columns=None):
+        """Fetch tweets by Tweet_ID, reading only the row groups that hold them"""
+        tweet_ids = [str(tweet_id) for tweet_id in tweet_ids]
+        index = self._load_index('Tweet_ID')
+        locations = index[index['Tweet_ID'].isin(tweet_ids)]
+        columns = self._with_keys(columns)
+        table = self._read_row_groups(locations, pc.field('Tweet_ID').isin(tweet_ids), columns)
+        return self._latest(table)
+
+    @staticmethod
+    def _with_keys(columns):
+        """Always read the columns needed to keep only the newest copy of a tweet"""
+        if columns is None:
+            return None
+        return list(dict.fromkeys(list(columns) + ['Tweet_ID', '_seq']))
+
+    def query(self, username=None, hashtag=None, start=None, end=None, labeled=None, columns=None):
+        """Filter the store, pruning partitions and row groups before any rows are decoded.
+
+        start/end bound Created_Ts (end exclusive); labeled=True keeps tweets with
+        an is_disinfo label, labeled=False keeps the unlabeled ones.
+        """
+        expression = pc.scalar(True)
+        if start is not None:
+            start = to_utc(start)
+            expression &= pc.field('Created_Ts') >= pa.scalar(start, type=STORE_SCHEMA.field('Created_Ts').type)
+        if end is not None:
+            end = to_utc(end)
+            expression &= pc.field('Created_Ts') < pa.scalar(end, type=STORE_SCHEMA.field('Created_Ts').type)
+        if labeled is True:
+            expression &= pc.field('is_disinfo').isin(['true', 'false'])
+        elif labeled is False:
+            expression &= ~pc.field('is_disinfo').isin(['true', 'false'])
+        columns = self._with_keys(columns)
+
+        if username is not None:
+            # Username index: jump straight to the row groups holding the user
+            index = self._load_index('Username')
+            locations = index[index['Username'] == username]
+            locations = locations[locations['file'].map(lambda path: self._in_partitions(path, hashtag, start, end))]
+            table = self._read_row_groups(locations, expression & (pc.field('Username') == username), columns)
+            return self._latest(table)
+
+        partition_filter = pc.scalar(True)
+        if hashtag is not None:
+            partition_filter &= pc.field('query') == hashtag
+        if start is not None:
+            partition_filter &= (pc.field('month') >= start.strftime('%Y-%m')) | (pc.field('month') == 'unknown')
+        if end is not None:
+            partition_filter &= pc.field('month') <= end.strftime('%Y-%m')
+        table = self.dataset().to_table(filter=partition_filter & expression, columns=columns)
+        if columns is None:
+            table = table.drop_columns(['query', 'month'])
+        return self._latest(table)
+
+    @staticmethod
+    def _in_partitions(relative_path, hashtag, start, end):
+        """Check a part file's query/month directories against the query bounds"""
+        parts = dict(part.split('=', 1) for part in relative_path.replace('\\', '/').split('/')[:2])
+        if hashtag is not None and parts['query'] != hashtag:
+            return False
+        month = parts['month']
+        if month == 'unknown':
+            return True
+        if start is not None and month < start.strftime('%Y-%m'):
+            return False
+        if end is not None and month > end.strftime('%Y-%m'):
+            return False
+        return True
+
+    # Maintenance
+
+    def compact(self):
+        """Rewrite each partition as one deduplicated, sorted file and rebuild the indexes"""
+        seq = time.time_ns()
+        new_entries = {'Tweet_ID': [], 'Username': []}
+        for partition in sorted(glob.glob(os.path.join(self.directory, 'query=*', 'month=*'))):
+            old_files = sorted(glob.glob(os.path.join(partition, '*.parquet')))
+            if not old_files:
+                continue
+            table = pa.concat_tables([pq.read_table(path, schema=STORE_SCHEMA) for path in old_files])
+            latest = pa.Table.from_pandas(self._latest(table).assign(_seq=seq), schema=STORE_SCHEMA, preserve_index=False)
+
+            relative = os.path.relpath(partition, self.directory).replace('\\', '/').split('/')
+            query, month = relative[0].split('=', 1)[1], relative[1].split('=', 1)[1]
+            for key, entries in self._write_part(latest, query, month, seq, 0).items():
+                new_entries[key].append(entries)
+            for path in old_files:
+                os.remove(path)
+
+        for key, entries in new_entries.items():
+            self._save_index(key, pd.concat(entries, ignore_index=True) if entries else self._load_index(key).iloc[0:0])
+        print(f"{datetime.now()} - Compacted {self.directory}")
+
+    def stats(self):
+        """Number of part files, stored rows and distinct tweets"""
+        files = glob.glob(os.path.join(self.directory, 'query=*', 'month=*', '*.parquet'))
+        rows = sum(pq.ParquetFile(path).metadata.num_rows for path in files)
+        return {'files': len(files), 'rows': rows, 'tweets': self._load_index('Tweet_ID')['Tweet_ID'].nunique()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local columnar tweet store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='Import a CSV export, or Firestore when no file is given')
+    import_parser.add_argument('csv', nargs='?')
+    query_parser = subparsers.add_parser('query', help='Query the store and print or save the matching tweets')
+    query_parser.add_argument('--user')
+    query_parser.add_argument('--hashtag')
+    query_parser.add_argument('--since', help='Created_At lower bound, e.g. 2025-03-01')
+    query_parser.add_argument('--until', help='Created_At upper bound (exclusive)')
+    query_parser.add_argument('--labeled', action='store_true')
+    query_parser.add_argument('--unlabeled', action='store_true')
+    query_parser.add_argument('--ids', nargs='+', help='Look up specific Tweet_IDs')
+    query_parser.add_argument('--out', help='Write the result to this CSV instead of printing it')
+    subparsers.add_parser('compact', help='Merge part files and drop superseded copies')
+    subparsers.add_parser('stats')
+    parser.add_argument('--store', help='Store directory; defaults to the tweet_store_dir setting')
+    args = parse_args(parser)
+
+    store = TweetStore(args.store)
+    if args.command == 'import':
+        if args.csv:
+            total = store.import_csv(args.csv)
+        else:
+            from gcp_utils import GCPStorage
+            total = store.import_firestore(GCPStorage())
+        print(f"{datetime.now()} - Imported {total} tweets")
+    elif args.command == 'query':
+        start = time.perf_counter()
+        if args.ids:
+            df = store.get(args.ids)
+        else:
+            labeled = True if args.labeled else False if args.unlabeled else None
+            df = store.query(args.user, args.hashtag, args.since, args.until, labeled)
+        print(f"{len(df)} tweets in {1000 * (time.perf_counter() - start):.1f} ms")
+        if args.out:
+            df.to_csv(args.out, index=False)
+        else:
+            print(df[['Tweet_ID', 'Username', 'Created_At', 'is_disinfo', 'Text']].to_string(index=False))
+    elif args.command == 'compact':
+        store.compact()
+    else:
+        print(store.stats())
+
+
+if __name__ == "__main__":
+    main()
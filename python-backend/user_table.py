@@ -0,0 +1,240 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from config import settings, parse_args
+
+# Account fields copied from twikit's User, which arrives with every search page
+USER_FIELDS = [
+    ('User_ID', 'id'),
+    ('Screen_Name', 'screen_name'),
+    ('Username', 'name'),
+    ('User_Created_At', 'created_at'),
+    ('Followers', 'followers_count'),
+    ('Following', 'following_count'),
+    ('Statuses', 'statuses_count'),
+    ('Favourites', 'favourites_count'),
+    ('Media_Count', 'media_count'),
+    ('Listed', 'listed_count'),
+    ('Verified', 'verified'),
+    ('Blue_Verified', 'is_blue_verified'),
+    ('Default_Profile', 'default_profile'),
+    ('Default_Profile_Image', 'default_profile_image'),
+    ('Protected', 'protected'),
+    ('Profile_Image_Url', 'profile_image_url'),
+    ('Description', 'description'),
+    ('Location', 'location'),
+]
+
+# Accounts sharing a text or an avatar hash with at least this many accounts are grouped
+MIN_GROUP_ACCOUNTS = 2
+
+
+def user_features(user):
+    """Copy the account-level fields of a twikit User into a plain dict"""
+    if user is None:
+        return {}
+    features = {column: getattr(user, attribute, None) for column, attribute in USER_FIELDS}
+    features['User_ID'] = str(features['User_ID']) if features['User_ID'] else None
+    return features
+
+
+def read_user_table(path=None):
+    """Load the local users table, or an empty one"""
+    path = path or settings.users_table_file
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=[column for column, _ in USER_FIELDS] + ['Last_Seen'])
+    return pd.read_parquet(path)
+
+
+class UserTable:
+    """Account features collected during a run, upserted once per user.
+
+    Every user seen is kept in memory; users not yet written this run are in
+    the dirty set, and flush() writes just those to the Firestore users
+    collection in batches. The local Parquet table is rewritten whole, so
+    save() merges the users seen into it only once in a while.
+    """
+
+    def __init__(self, gcp=None, path=None):
+        self.gcp = gcp
+        self.path = path or settings.users_table_file
+        self.users = {}
+        self.dirty = set()
+        # Users not yet merged into the local table
+        self.unsaved = set()
+
+    def observe(self, features):
+        """Remember a user's features; only the first sighting this run is written"""
+        user_id = features.get('User_ID') if features else None
+        if not user_id or user_id in self.users:
+            return False
+        self.users[user_id] = dict(features, Last_Seen=datetime.now().isoformat())
+        self.dirty.add(user_id)
+        self.unsaved.add(user_id)
+        return True
+
+    def flush(self):
+        """Upsert the dirty users to Firestore, return how many.
+
+        Users whose write still failed stay dirty for the next flush, and
+        BatchWriteError is raised with their IDs.
+        """
+        if not self.dirty:
+            return 0
+        batch = {user_id: self.users[user_id] for user_id in self.dirty}
+        if self.gcp is not None:
+            from gcp_utils import BatchWriteError
+            try:
+                self.gcp.upsert_users_batch(batch)
+            except BatchWriteError as e:
+                self.dirty = set(e.failed_ids)
+                raise
+        self.dirty = set()
+        print(f"{datetime.now()} - Upserted {len(batch)} users ({len(self.users)} seen this run)")
+        return len(batch)
+
+    def save(self):
+        """Merge the users seen since the last save into the local table, return how many"""
+        if not self.unsaved:
+            return 0
+        batch = {user_id: self.users[user_id] for user_id in self.unsaved}
+        self._merge_local(batch)
+        self.unsaved = set()
+        print(f"{datetime.now()} - Saved {len(batch)} users to {self.path}")
+        return len(batch)
+
+    def _merge_local(self, batch):
+        """Replace the batch's rows in the local table, writing it atomically"""
+        table = read_user_table(self.path)
+        updates = pd.DataFrame(list(batch.values()))
+        table = table[~table['User_ID'].isin(updates['User_ID'])]
+        table = pd.concat([table, updates], ignore_index=True) if len(table) else updates
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+
+def aggregate_accounts(tweets, users=None, min_group=MIN_GROUP_ACCOUNTS):
+    """Per-account coordination signals from a tweets frame, one row per account.
+
+    Accounts are keyed by User_ID, or Username for tweets stored before
+    User_ID was recorded. Columns: tweet count and posting rate (tweets per
+    day between first and last tweet), duplicate-text ratio within the
+    account, share of its tweets whose text other accounts also posted, and
+    the group of accounts sharing its profile picture hash. With the users
+    table, lifetime statuses per day and follower ratio are added as well.
+    """
+    from review_queue import duplicate_keys
+    from tweet_store import parse_created_at
+
+    frame = pd.DataFrame(index=tweets.index)
+    user_ids = tweets['User_ID'] if 'User_ID' in tweets else pd.Series(None, index=tweets.index, dtype=object)
+    frame['account'] = user_ids.where(user_ids.notna() & (user_ids.astype(str) != ''), tweets['Username'])
+    frame['account'] = frame['account'].astype(str)
+    frame['created'] = parse_created_at(tweets['Created_At'].astype(object))
+    frame['text_key'] = duplicate_keys(tweets['Text'].astype(object))
+    avatar = tweets['Profile_Pic_Hash'] if 'Profile_Pic_Hash' in tweets else pd.Series('', index=tweets.index)
+    frame['avatar'] = avatar.fillna('').astype(str)
+
+    # Texts posted by more than one account, ignoring empty ones
+    accounts_per_text = frame.groupby('text_key')['account'].nunique()
+    frame['shared_text'] = frame['text_key'].map(accounts_per_text).ge(min_group) & frame['text_key'].ne('')
+
+    grouped = frame.groupby('account')
+    result = pd.DataFrame({
+        'Username': tweets.groupby(frame['account'])['Username'].last(),
+        'Tweets': grouped.size(),
+        'First_Tweet': grouped['created'].min(),
+        'Last_Tweet': grouped['created'].max(),
+        'Distinct_Texts': grouped['text_key'].nunique(),
+        'Shared_Text_Ratio': grouped['shared_text'].mean(),
+    })
+    span_days = (result['Last_Tweet'] - result['First_Tweet']).dt.total_seconds() / 86400
+    # A burst within one day counts as one day, not as an infinite rate
+    result['Posting_Rate'] = result['Tweets'] / span_days.fillna(0).clip(lower=1)
+    result['Duplicate_Text_Ratio'] = 1 - result['Distinct_Texts'] / result['Tweets']
+
+    # The avatar hash an account used most, then the accounts sharing each hash
+    avatars = frame[frame['avatar'] != '']
+    if len(avatars):
+        top_avatar = avatars.groupby(['account', 'avatar']).size().sort_values().groupby(level=0).tail(1)
+        top_avatar = top_avatar.reset_index(level=1)['avatar']
+    else:
+        top_avatar = pd.Series(dtype=object)
+    result['Avatar_Hash'] = top_avatar.reindex(result.index).fillna('')
+    group_sizes = result.loc[result['Avatar_Hash'] != '', 'Avatar_Hash'].value_counts()
+    result['Avatar_Group_Size'] = result['Avatar_Hash'].map(group_sizes).fillna(0).astype(int)
+    in_group = result['Avatar_Group_Size'] >= min_group
+    result['Avatar_Group'] = np.where(in_group, result['Avatar_Hash'], '')
+
+    if users is not None and len(users):
+        users = users.drop_duplicates('User_ID', keep='last').set_index('User_ID')
+        joined = users.reindex(result.index)
+        account_created = parse_created_at(joined['User_Created_At'].astype(object))
+        age_days = (pd.Timestamp.now(tz='UTC') - account_created).dt.total_seconds() / 86400
+        result['Account_Age_Days'] = age_days
+        result['Lifetime_Rate'] = pd.to_numeric(joined['Statuses'], errors='coerce') / age_days.clip(lower=1)
+        followers = pd.to_numeric(joined['Followers'], errors='coerce')
+        following = pd.to_numeric(joined['Following'], errors='coerce')
+        result['Follower_Ratio'] = followers / following.clip(lower=1)
+        for column in ('Followers', 'Verified', 'Blue_Verified', 'Default_Profile_Image'):
+            result[column] = joined[column]
+
+    result.index.name = 'Account'
+    return result.drop(columns=['Distinct_Texts'])
+
+
+def load_tweets(csv_path=None):
+    """Tweet columns needed for aggregation, from a CSV export or the local tweet store"""
+    columns = ['User_ID', 'Username', 'Text', 'Created_At', 'Profile_Pic_Hash']
+    if csv_path:
+        return pd.read_csv(csv_path, usecols=lambda column: column in columns, dtype={'User_ID': str})
+    from tweet_store import TweetStore
+    return TweetStore().query(columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Account table and coordination signals')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    aggregate = subparsers.add_parser('aggregate', help='Compute per-account posting rate, duplicate texts and avatar groups')
+    aggregate.add_argument('--csv', help='Tweets CSV export; defaults to the local tweet store')
+    aggregate.add_argument('--output', default='account_signals.csv')
+    aggregate.add_argument('--to-firestore', action='store_true',
+                           help='Also merge the signals into the users collection')
+
+    subparsers.add_parser('stats', help='Size of the local users table')
+    args = parse_args(parser)
+
+    users = read_user_table()
+    if args.command == 'stats':
+        print(f"{len(users)} users in {settings.users_table_file}")
+        return
+
+    tweets = load_tweets(args.csv)
+    signals = aggregate_accounts(tweets, users)
+    signals.to_csv(args.output)
+    print(f"{datetime.now()} - Wrote signals for {len(signals)} accounts to {args.output}")
+
+    grouped = signals[signals['Avatar_Group'] != '']
+    print(f"{grouped['Avatar_Group'].nunique()} shared avatars across {len(grouped)} accounts")
+
+    if args.to_firestore:
+        from gcp_utils import GCPStorage, BatchWriteError
+        known = signals[signals.index.isin(users['User_ID'])]
+        fields = ['Posting_Rate', 'Duplicate_Text_Ratio', 'Shared_Text_Ratio', 'Avatar_Group', 'Avatar_Group_Size']
+        records = known[fields].astype(object).where(known[fields].notna(), None).to_dict('index')
+        try:
+            GCPStorage().upsert_users_batch(records)
+        except BatchWriteError as e:
+            print(f"{datetime.now()} - Upsert incomplete: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import asyncio
+import tempfile
+import aiohttp
+from io import BytesIO
+from datetime import datetime
+from config import settings
+
+
+def get_video_variants(media_item):
+    """Return (bitrate, url) for every MP4 variant of a twikit video or GIF"""
+    variants = []
+
+    # twikit exposes variants as Stream objects, older payloads as raw dicts
+    streams = getattr(media_item, 'streams', None)
+    if not streams:
+        video_info = getattr(media_item, 'video_info', None) or {}
+        streams = video_info.get('variants', [])
+
+    for stream in streams:
+        if isinstance(stream, dict):
+            content_type, bitrate, url = stream.get('content_type'), stream.get('bitrate'), stream.get('url')
+        else:
+            content_type = getattr(stream, 'content_type', None)
+            bitrate, url = getattr(stream, 'bitrate', None), getattr(stream, 'url', None)
+        if url and content_type == 'video/mp4':
+            variants.append((bitrate or 0, url))
+    return variants
+
+
+def select_video_variant(variants, min_bitrate=None):
+    """Pick the lowest bitrate variant that is still at least min_bitrate"""
+    min_bitrate = settings.video_min_bitrate if min_bitrate is None else min_bitrate
+    if not variants:
+        return None
+
+    acceptable = [variant for variant in variants if variant[0] >= min_bitrate]
+    if acceptable:
+        return min(acceptable)[1]
+    # Nothing reaches the threshold, so take the best there is
+    return max(variants)[1]
+
+
+async def download_video_to_file(session, video_url, max_bytes=None):
+    """Stream a video to a temporary file, giving up once it exceeds max_bytes.
+
+    The session's total timeout would abort any large video, so the body is
+    only bounded by connect and per-read timeouts. Whatever cuts the
+    download short, the partial file is removed.
+    """
+    max_bytes = max_bytes or settings.max_video_bytes
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=settings.video_connect_timeout_seconds,
+                                    sock_read=settings.video_read_timeout_seconds)
+    path = None
+    try:
+        async with session.get(video_url, timeout=timeout) as response:
+            if response.status != 200:
+                print(f"Error downloading video: {response.status}")
+                return None, None
+
+            if response.content_length and response.content_length > max_bytes:
+                print(f"Skipping video of {response.content_length} bytes (limit {max_bytes})")
+                return None, None
+
+            content_type = response.headers.get('Content-Type')
+            size = 0
+            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+                path = f.name
+                async for chunk in response.content.iter_chunked(1024 * 1024):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        break
+                    f.write(chunk)
+
+            if size > max_bytes:
+                print(f"Skipping video larger than {max_bytes} bytes")
+                return None, None
+            # Handed over to the caller, who removes it after the upload
+            video_path, path = path, None
+            return video_path, content_type
+    except Exception as e:
+        print(f"Error downloading video: {e}")
+        return None, None
+    finally:
+        if path is not None:
+            os.remove(path)
+
+
+def extract_keyframe_thumbnail(video_path, max_size=(640, 640)):
+    """Decode the first keyframe of a video and return it as JPEG bytes (runs in a worker process)"""
+    import av
+
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        # Only keyframes need decoding, which skips almost all of the work
+        stream.codec_context.skip_frame = 'NONKEY'
+        for frame in container.decode(stream):
+            image = frame.to_image()
+            image.thumbnail(max_size)
+            buffer = BytesIO()
+            image.convert('RGB').save(buffer, format='JPEG', quality=85)
+            return buffer.getvalue()
+    return None
+
+
+async def extract_thumbnail(cpu, video_path):
+    """Run keyframe extraction in the CPU pool so the event loop keeps downloading"""
+    try:
+        return await cpu.run(extract_keyframe_thumbnail, video_path)
+    except ImportError:
+        print("PyAV is not installed, skipping video thumbnail")
+    except Exception as e:
+        print(f"Error extracting video thumbnail: {e}")
+    return None
+
+
+async def handle_video(session, gcp, cpu, variants, tweet_id, index):
+    """Download, upload and thumbnail one video from its (bitrate, url) variants; returns (video_path, thumbnail_path) in GCS"""
+    video_url = select_video_variant(variants)
+    if not video_url:
+        return "", ""
+
+    print(f"Found video URL: {video_url}")
+    local_path, header_type = await download_video_to_file(session, video_url)
+    if not local_path:
+        return "", ""
+
+    try:
+        # Upload (network) and keyframe decode (CPU) overlap
+        video_path, thumbnail = await asyncio.gather(
+            asyncio.to_thread(gcp.upload_video_file, local_path, tweet_id, index, header_type),
+            extract_thumbnail(cpu, local_path),
+        )
+        print(f"{datetime.now()} - Uploaded video {index} to GCP")
+
+        thumbnail_path = ""
+        if thumbnail:
+            thumbnail_path = await asyncio.to_thread(
+                gcp.upload_media_file_from_memory, thumbnail, tweet_id, f"{index}_thumb", 'image/jpeg'
+            )
+        return video_path, thumbnail_path
+    finally:
+        os.remove(local_path)
+
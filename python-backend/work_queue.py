@@ -0,0 +1,354 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import argparse
+from datetime import datetime
+from config import settings, parse_args
+
+# Failed jobs come back after RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+RETRY_BASE_SECONDS = 30
+
+# A leased job is just a queued job whose available_at was pushed into the
+# future. If the worker dies without acking, the lease runs out and the job
+# becomes available again with no separate reaper. Every lease bumps attempts,
+# so a job that keeps crashing its worker still ends up dead-lettered.
+
+
+class Job:
+    """A leased queue entry; ack or fail it with the token it was leased with."""
+
+    def __init__(self, job_id, payload, attempts, token):
+        self.job_id = job_id
+        self.payload = payload
+        self.attempts = attempts
+        self.token = token
+
+
+class SQLiteWorkQueue:
+    """Durable tweet queue in a local SQLite file, shared by processes on one machine."""
+
+    def __init__(self, path=None, lease_seconds=None, max_attempts=None):
+        path = path or settings.work_queue_file
+        self.path = path
+        self.lease_seconds = lease_seconds or settings.work_queue_lease_seconds
+        self.max_attempts = max_attempts or settings.work_queue_max_attempts
+        # Workers call in from asyncio.to_thread, so one lock serializes the connection
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        # WAL lets the fetcher append while workers lease
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,
+            token TEXT,
+            last_error TEXT)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_available ON jobs (available_at)')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS dead_letters (
+            job_id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            died_at REAL NOT NULL)''')
+
+    def enqueue(self, job_id, payload):
+        """Add a job; re-enqueueing an ID that is still queued is a no-op"""
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO jobs (job_id, payload, available_at) VALUES (?, ?, ?)',
+                (str(job_id), json.dumps(payload), time.time()),
+            )
+
+    def lease(self, limit=1):
+        """Claim up to limit available jobs for lease_seconds"""
+        with self._lock:
+            now = time.time()
+            jobs = []
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self.conn.execute(
+                    'SELECT job_id, payload, attempts, last_error FROM jobs WHERE available_at <= ? '
+                    'ORDER BY available_at LIMIT ?', (now, limit),
+                ).fetchall()
+                for job_id, payload, attempts, last_error in rows:
+                    if attempts >= self.max_attempts:
+                        self._dead_letter(job_id, payload, attempts, last_error or 'lease expired')
+                        continue
+                    token = uuid.uuid4().hex
+                    self.conn.execute(
+                        'UPDATE jobs SET attempts = ?, available_at = ?, token = ? WHERE job_id = ?',
+                        (attempts + 1, now + self.lease_seconds, token, job_id),
+                    )
+                    jobs.append(Job(job_id, json.loads(payload), attempts + 1, token))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            return jobs
+
+    def ack(self, job):
+        """Remove a finished job, unless its lease already passed to another worker"""
+        with self._lock:
+            self.conn.execute('DELETE FROM jobs WHERE job_id = ? AND token = ?', (job.job_id, job.token))
+
+    def release(self, job):
+        """Hand an unfinished job back right away, without counting the attempt"""
+        with self._lock:
+            self.conn.execute(
+                'UPDATE jobs SET available_at = ?, attempts = attempts - 1, token = NULL WHERE job_id = ? AND token = ?',
+                (time.time(), job.job_id, job.token),
+            )
+
+    def fail(self, job, error):
+        """Schedule a retry with backoff, or dead-letter the job after max_attempts"""
+        with self._lock:
+            error = str(error)
+            if job.attempts >= self.max_attempts:
+                self.conn.execute('BEGIN IMMEDIATE')
+                try:
+                    if self.conn.execute('SELECT 1 FROM jobs WHERE job_id = ? AND token = ?',
+                                         (job.job_id, job.token)).fetchone():
+                        self._dead_letter(job.job_id, json.dumps(job.payload), job.attempts, error)
+                    self.conn.execute('COMMIT')
+                except Exception:
+                    self.conn.execute('ROLLBACK')
+                    raise
+                return
+
+            retry_at = time.time() + RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+            self.conn.execute(
+                'UPDATE jobs SET available_at = ?, token = NULL, last_error = ? WHERE job_id = ? AND token = ?',
+                (retry_at, error, job.job_id, job.token),
+            )
+
+    def _dead_letter(self, job_id, payload, attempts, error):
+        """Move a job to dead_letters (inside the caller's transaction)"""
+        self.conn.execute(
+            'INSERT OR REPLACE INTO dead_letters (job_id, payload, attempts, last_error, died_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, payload, attempts, error, time.time()),
+        )
+        self.conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+        print(f"{datetime.now()} - Dead-lettered job {job_id} after {attempts} attempts: {error}")
+
+    def requeue_dead(self):
+        """Put every dead-lettered job back in the queue with a fresh attempt count"""
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                count = self.conn.execute(
+                    'INSERT OR IGNORE INTO jobs (job_id, payload, available_at) '
+                    'SELECT job_id, payload, ? FROM dead_letters', (time.time(),),
+                ).rowcount
+                self.conn.execute('DELETE FROM dead_letters')
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            return count
+
+    def stats(self):
+        """Counts of ready, leased/backing-off and dead jobs"""
+        with self._lock:
+            now = time.time()
+            ready = self.conn.execute('SELECT COUNT(*) FROM jobs WHERE available_at <= ?', (now,)).fetchone()[0]
+            waiting = self.conn.execute('SELECT COUNT(*) FROM jobs WHERE available_at > ?', (now,)).fetchone()[0]
+            dead = self.conn.execute('SELECT COUNT(*) FROM dead_letters').fetchone()[0]
+            return {'ready': ready, 'leased_or_waiting': waiting, 'dead': dead}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class FirestoreWorkQueue:
+    """The same queue on Firestore, so media workers can run on other machines.
+
+    Jobs live in the work_queue collection and dead letters in
+    work_queue_dead. Leasing runs in a transaction, so two workers never
+    claim the same job.
+    """
+
+    def __init__(self, gcp, collection='work_queue', lease_seconds=None, max_attempts=None):
+        self.db = gcp.db
+        self.jobs = gcp.db.collection(collection)
+        self.dead = gcp.db.collection(f'{collection}_dead')
+        self.lease_seconds = lease_seconds or settings.work_queue_lease_seconds
+        self.max_attempts = max_attempts or settings.work_queue_max_attempts
+
+    def enqueue(self, job_id, payload):
+        """Add a job; re-enqueueing an ID that is still queued is a no-op"""
+        from google.api_core.exceptions import AlreadyExists
+
+        try:
+            self.jobs.document(str(job_id)).create({
+                'payload': json.dumps(payload),
+                'attempts': 0,
+                'available_at': time.time(),
+                'token': None,
+                'last_error': None,
+            })
+        except AlreadyExists:
+            pass
+
+    def lease(self, limit=1):
+        """Claim up to limit available jobs for lease_seconds"""
+        from google.cloud import firestore
+
+        now = time.time()
+        candidates = list(self.jobs.where('available_at', '<=', now).order_by('available_at').limit(limit).stream())
+        jobs = []
+
+        @firestore.transactional
+        def claim(transaction, ref):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            data = snapshot.to_dict()
+            # Someone else leased it between the query and this transaction
+            if data['available_at'] > now:
+                return None
+            if data['attempts'] >= self.max_attempts:
+                transaction.set(self.dead.document(ref.id), {
+                    'payload': data['payload'],
+                    'attempts': data['attempts'],
+                    'last_error': data.get('last_error') or 'lease expired',
+                    'died_at': time.time(),
+                })
+                transaction.delete(ref)
+                print(f"{datetime.now()} - Dead-lettered job {ref.id} after {data['attempts']} attempts")
+                return None
+            token = uuid.uuid4().hex
+            transaction.update(ref, {
+                'attempts': data['attempts'] + 1,
+                'available_at': now + self.lease_seconds,
+                'token': token,
+            })
+            return Job(ref.id, json.loads(data['payload']), data['attempts'] + 1, token)
+
+        for snapshot in candidates:
+            job = claim(self.db.transaction(), snapshot.reference)
+            if job:
+                jobs.append(job)
+        return jobs
+
+    def _owned(self, transaction, job):
+        """Return the job's document reference if this lease still holds it"""
+        ref = self.jobs.document(job.job_id)
+        snapshot = ref.get(transaction=transaction)
+        if snapshot.exists and snapshot.to_dict().get('token') == job.token:
+            return ref
+        return None
+
+    def ack(self, job):
+        """Remove a finished job, unless its lease already passed to another worker"""
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def remove(transaction):
+            ref = self._owned(transaction, job)
+            if ref:
+                transaction.delete(ref)
+
+        remove(self.db.transaction())
+
+    def release(self, job):
+        """Hand an unfinished job back right away, without counting the attempt"""
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def give_back(transaction):
+            ref = self._owned(transaction, job)
+            if ref:
+                transaction.update(ref, {'available_at': time.time(), 'attempts': job.attempts - 1, 'token': None})
+
+        give_back(self.db.transaction())
+
+    def fail(self, job, error):
+        """Schedule a retry with backoff, or dead-letter the job after max_attempts"""
+        from google.cloud import firestore
+
+        error = str(error)
+
+        @firestore.transactional
+        def reschedule(transaction):
+            ref = self._owned(transaction, job)
+            if not ref:
+                return
+            if job.attempts >= self.max_attempts:
+                transaction.set(self.dead.document(job.job_id), {
+                    'payload': json.dumps(job.payload),
+                    'attempts': job.attempts,
+                    'last_error': error,
+                    'died_at': time.time(),
+                })
+                transaction.delete(ref)
+                return
+            transaction.update(ref, {
+                'available_at': time.time() + RETRY_BASE_SECONDS * 2 ** (job.attempts - 1),
+                'token': None,
+                'last_error': error,
+            })
+
+        reschedule(self.db.transaction())
+
+    def requeue_dead(self):
+        """Put every dead-lettered job back in the queue with a fresh attempt count"""
+        count = 0
+        for snapshot in self.dead.stream():
+            self.jobs.document(snapshot.id).set({
+                'payload': snapshot.to_dict()['payload'],
+                'attempts': 0,
+                'available_at': time.time(),
+                'token': None,
+                'last_error': None,
+            })
+            snapshot.reference.delete()
+            count += 1
+        return count
+
+    def stats(self):
+        """Counts of ready, leased/backing-off and dead jobs"""
+        now = time.time()
+        ready = self.jobs.where('available_at', '<=', now).count().get()[0][0].value
+        total = self.jobs.count().get()[0][0].value
+        dead = self.dead.count().get()[0][0].value
+        return {'ready': ready, 'leased_or_waiting': total - ready, 'dead': dead}
+
+    def close(self):
+        pass
+
+
+def open_work_queue(backend=None, gcp=None):
+    """Open the work queue for a backend name ('sqlite' or 'firestore'), by default the configured one"""
+    backend = backend or settings.queue_backend
+    if backend == 'sqlite':
+        return SQLiteWorkQueue()
+    if backend == 'firestore':
+        if gcp is None:
+            from gcp_utils import GCPStorage
+            gcp = GCPStorage()
+        return FirestoreWorkQueue(gcp)
+    raise ValueError(f"Unknown work queue backend: {backend}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect the collector work queue')
+    parser.add_argument('command', choices=['stats', 'requeue-dead'])
+    parser.add_argument('--backend', choices=['sqlite', 'firestore'], help='Defaults to the queue_backend setting')
+    args = parse_args(parser)
+
+    queue = open_work_queue(args.backend)
+    try:
+        if args.command == 'stats':
+            print(queue.stats())
+        else:
+            print(f'{datetime.now()} - Requeued {queue.requeue_dead()} dead-lettered jobs')
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()